@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import sys
+import os.path
+import getopt
+
+ADMIN_PATH = os.path.normpath(os.path.dirname(os.path.abspath(__file__)))
+SRC_PATH = os.path.normpath(os.path.join(ADMIN_PATH, '..', 'src'))
+sys.path.insert(0, SRC_PATH)
+sys.path.insert(0, os.path.join(SRC_PATH, 'plugins', 'geniv3rpc', 'g3rpc'))
+
+from schemacache import SchemaRegistry
+
+DEFAULT_CACHE_DIR = os.path.normpath(os.path.join(ADMIN_PATH, '..', 'deploy', 'schemas.cache')) # see config key geniv3rpc.schema_cache_dir
+DEFAULT_SCHEMAS = [
+    'http://www.geni.net/resources/rspec/3/request.xsd',
+    'http://www.geni.net/resources/rspec/3/ad.xsd',
+    'http://www.geni.net/resources/rspec/3/manifest.xsd']
+
+def print_usage():
+    print "USAGE: ./schema_preload.py [--help] [--cache-dir FOLDER] [SCHEMA_URL ...]"
+    print
+    print "Downloads the given XML schemas (and all schemas they import or include) into the schema cache of the AM."
+    print "Afterwards, RSpecs can be validated without network access (set geniv3rpc.schema_download to 0)."
+    print "When no URL is given, the GENI v3 request, advertisement and manifest schemas are fetched."
+    print
+    print "  --cache-dir FOLDER  Folder to store the schemas in (default: %s)." % (DEFAULT_CACHE_DIR,)
+    print "                      Must match the config key geniv3rpc.schema_cache_dir."
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'hc:', ['help', 'cache-dir='])
+    except getopt.GetoptError as err:
+        print "ERROR: %s" % (err,)
+        print_usage()
+        sys.exit(2)
+
+    cache_dir = DEFAULT_CACHE_DIR
+    for option, opt_arg in opts:
+        if option in ['-h', '--help']:
+            print_usage()
+            sys.exit(0)
+        if option in ['-c', '--cache-dir']:
+            cache_dir = os.path.abspath(opt_arg)
+
+    registry = SchemaRegistry([], cache_dir, True)
+    failed = False
+    for url in (args or DEFAULT_SCHEMAS):
+        try:
+            for stored in registry.preload(url):
+                print "stored %s" % (stored,)
+            registry.get(url) # make sure the schema compiles from the cache
+        except Exception as e:
+            print "ERROR: could not preload %s (%s)" % (url, str(e))
+            failed = True
+    sys.exit(1 if failed else 0)
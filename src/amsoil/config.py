@@ -11,10 +11,28 @@ SRC_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
 ROOT_PATH = os.path.normpath(os.path.join(SRC_PATH, '..'))
 PLUGINS_PATH = os.path.join(SRC_PATH, 'plugins')
 
+##Plugins
+PLUGINS_CACHE_FILE = "%s/deploy/plugins.cache" % (ROOT_PATH,) # pre-validated manifest index (rebuilt when a manifest changes)
+PLUGINS_PROFILE = False # print the time spent in each phase of the plugin bootstrapping
+
 ##Logging
-LOG_LEVEL = logging.DEBUG
+LOG_LEVEL = logging.INFO # DEBUG writes e.g. the bodies of all XML-RPC requests and responses (with flask.debug)
 LOG_FORMAT = "%(asctime)s [%(levelname)s] - %(message)s"
 LOG_FILE = "%s/log/amsoil.log" % (ROOT_PATH,)
+LOG_LEVELS = {} # per-module overrides of LOG_LEVEL, the keys are the prefixes given to getLogger (e.g. { 'flaskrpcs' : logging.INFO })
+LOG_QUEUE_SIZE = 10000 # max. records waiting for the writer thread, further records are dropped (and counted)
+LOG_RATE_LIMIT = 200 # max. records below WARNING per call site and LOG_RATE_INTERVAL (0 disables the limit)
+LOG_RATE_INTERVAL = 1 # sec
+
+##Request tracing (see amsoil.core.trace)
+TRACE_ENABLED = True
+TRACE_SLOW_THRESHOLD = 1.0 # sec, requests taking longer are kept in the ring buffer (and exported)
+TRACE_RING_SIZE = 100 # number of slow requests kept in memory
+TRACE_EXPORT_FILE = None # e.g. "%s/log/slow-requests.jsonl" % (ROOT_PATH,), one json object per slow request
+
+##Startup profiling (see main.py --profile-startup)
+STARTUP_PROFILE_REPORT = "%s/log/startup-profile.txt" % (ROOT_PATH,)
+STARTUP_PROFILE_TRACE = "%s/log/startup-profile.jsonl" % (ROOT_PATH,)
 
 ##CONFIGDB
 CONFIGDB_PATH = "%s/deploy/config.db" % (ROOT_PATH,)
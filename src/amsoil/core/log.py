@@ -1,13 +1,28 @@
 """
 This module provides logging facilities. More specifically, it provides a way to get to a (configured) python logger.
-Hence the interface of this logger is the same as the python one (so please direct all complaints regarding this to the python people). 
+Hence the interface of this logger is the same as the python one (so please direct all complaints regarding this to the python people).
 In order to get such a logger instance, you could insert this code at the beginning of your module:
     import amsoil.core.log
     logger=amsoil.core.log.getLogger('SOMENAME')
 whereby SOMENAME represents an optional prefix for the logging messages (e.g. 'xplugin' would yield messages like 'd.a.te [xplugin] message')
 
+Expensive messages
+The logger only renders a message if the record is actually written. So, please pass the values as arguments instead of formatting
+the message yourself (logger.debug("got %s", rspec) rather than logger.debug("got %s" % (rspec,))).
+If even building the argument is expensive, wrap it with lazy(...), it will only be called if the record is written:
+    logger.debug("Calling with args=%s", amsoil.core.log.lazy(format_args, args))
+For blocks of debug code use the usual level check: if logger.isEnabledFor(logging.DEBUG): ...
+
 Configuration
 Please see the config.py file in the root/src-folder.
+The level can be overridden per prefix via LOG_LEVELS (e.g. to silence a chatty plugin or to debug a single one).
+
+Pipeline
+Records are not written by the thread which logs them. They are put into a bounded queue and a background thread writes them to the file.
+Hence, request threads never wait for disk I/O or the rotation of the log file. If the queue is full, records are dropped and the
+number of dropped records is logged as soon as there is room again.
+To protect the file from floods, each call site may only emit LOG_RATE_LIMIT records (below WARNING) per LOG_RATE_INTERVAL.
+Suppressed records are counted and the count is appended to the next record of the same call site.
 
 Rationale
 After long discussions logging is a core service.
@@ -17,34 +32,151 @@ edit the log config (level, file, etc.). If you had a plugin for it, the config-
 when the pluginmanager loads.
 """
 import logging, logging.handlers
+import threading
+import Queue
+import atexit
 
 from amsoil import config
 
 LOGGER_NAME = 'amsoil'
 
+_configured = set() # prefixes whose child logger got its level from config.LOG_LEVELS
+_configured_lock = threading.Lock()
+
 def getLogger(prefix=None):
     """Receive a python logger (logging.Logger) which has been configured by AMsoil."""
     logger = logging.getLogger(LOGGER_NAME)
     if (prefix):
-        return PrefixAdapter(logger, prefix)
+        # each prefix gets a child logger, so the level can be overridden per prefix (the records propagate to the amsoil logger's handler)
+        # the prefix is added to the message when the record is written (see QueueHandler), so disabled levels cost nothing
+        # the configured level is only set when the child is created, so a level set at runtime (child.setLevel) is kept
+        with _configured_lock:
+            child = logger.getChild(prefix)
+            if prefix not in _configured:
+                child.setLevel(config.LOG_LEVELS.get(prefix, logging.NOTSET))
+                _configured.add(prefix)
+        return child
     else:
         return logger
 
+def lazy(func, *args, **kwargs):
+    """Returns a placeholder for logging arguments. {func} is called with the given arguments only if the message is rendered."""
+    return _Lazy(func, args, kwargs)
+
+
+class _Lazy(object):
+    """Internal class, see lazy(...)."""
+    __slots__ = ('_func', '_args', '_kwargs')
+
+    def __init__(self, func, args, kwargs):
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def __str__(self):
+        return str(self._func(*self._args, **self._kwargs))
+
+    def __repr__(self):
+        return repr(self._func(*self._args, **self._kwargs))
+
+
+class QueueHandler(logging.Handler):
+    """Internal class, which hands the records over to the _LogWriter thread. Do not use outside this module."""
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self._queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        """Renders the message and the traceback in the caller's thread, so the arguments can not change before the record is written."""
+        if record.name != LOGGER_NAME:
+            record.msg = "[%s] %s" % (record.name[len(LOGGER_NAME)+1:], record.getMessage())
+        else:
+            record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self._queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class RateLimitFilter(logging.Filter):
+    """Internal class, which limits the number of records below WARNING per call site and interval. Do not use outside this module."""
+    def __init__(self, limit, interval):
+        logging.Filter.__init__(self)
+        self._limit = limit
+        self._interval = interval
+        self._windows = {} # (pathname, lineno) -> [window start, records in window, suppressed records]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if (not self._limit) or (record.levelno >= logging.WARNING):
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            window = self._windows.get(key)
+            if (window is None) or (record.created - window[0] >= self._interval):
+                suppressed = window[2] if window else 0
+                self._windows[key] = [record.created, 1, 0]
+            elif window[1] < self._limit:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = "%s [%d similar messages suppressed]" % (record.msg, suppressed)
+        return True
+
+
+class _LogWriter(threading.Thread):
+    """Internal thread, which takes the records from the queue and passes them to the actual (file) handler."""
+    _STOP = object()
+
+    def __init__(self, queue, queue_handler, target):
+        super(_LogWriter, self).__init__(name='amsoil-log-writer')
+        self.daemon = True
+        self._queue = queue
+        self._queue_handler = queue_handler
+        self._target = target
+
+    def run(self):
+        while True:
+            record = self._queue.get()
+            if record is self._STOP:
+                break
+            self._target.handle(record)
+            if self._queue_handler.dropped:
+                dropped, self._queue_handler.dropped = self._queue_handler.dropped, 0
+                self._target.handle(logging.LogRecord(LOGGER_NAME, logging.WARNING, __file__, 0, "Log queue full, dropped %d records" % (dropped,), None, None))
+        self._target.flush()
 
-class PrefixAdapter(logging.LoggerAdapter):
-    """Internal class for wrapping logging messages. Do not use outside this module."""
-    def __init__(self, logger, prefix):
-        logging.LoggerAdapter.__init__(self, logger, { "prefix" : prefix })
+    def stop(self, timeout=5):
+        """Writes the records which are still in the queue and stops the thread."""
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except Queue.Full:
+            return
+        self.join(timeout)
 
-    def process(self, msg, kwargs):
-        prefix = self.extra["prefix"]
-        return ("[%s] %s" % (prefix, msg), kwargs)
-        
 # initialziation
 lhandle = logging.handlers.RotatingFileHandler(config.LOG_FILE, maxBytes = 1000000)
-lhandle.setLevel(config.LOG_LEVEL)
 lhandle.setFormatter(logging.Formatter(config.LOG_FORMAT))
+lqueue = Queue.Queue(config.LOG_QUEUE_SIZE)
+qhandle = QueueHandler(lqueue)
+qhandle.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT, config.LOG_RATE_INTERVAL))
+lwriter = _LogWriter(lqueue, qhandle, lhandle)
+lwriter.start()
+atexit.register(lwriter.stop)
 logger = getLogger()
-logger.addHandler(lhandle)
+logger.addHandler(qhandle)
 logger.setLevel(config.LOG_LEVEL)
 logger.info("Logging initialized")
@@ -31,6 +31,13 @@ Example:
     (The last line is optional)
     -> The plugin needs the config service when its setup() method is called.
     -> It will register the service authorization and somewhere in its code it will use the policy service.
+
+Manifest cache
+After a successful bootstrap the validated manifests, the resolved load order and the location of each plugin's
+bootstrap module are written to config.PLUGINS_CACHE_FILE. On the next start the cache is used as long as the set of
+plugin directories, the modification times of their manifests and config.IS_MULTIPROCESS did not change.
+Hence, normal restarts skip parsing and validating the manifests. Delete the file to force a full discovery.
+If config.PLUGINS_PROFILE is set, the time spent in each phase of the bootstrapping is printed.
 """
 
 
@@ -40,9 +47,11 @@ import traceback
 import os, os.path
 import json
 import imp
+import time
 
 from amsoil import config
 from amsoil.core.exception import CoreException
+from amsoil.core import startupprofiler
 
 import amsoil.core.log
 logger=amsoil.core.log.getLogger('pluginmanager')
@@ -102,15 +111,18 @@ MULTIPROCESS_SUPPORTED_KEY="multi-process-supported"
 REQUIRES_KEY='requires'
 BOOTSTRAP_MODULE_NAME='plugin'
 
+CACHE_VERSION=1
+
 class PluginInfo(object):
     """
     Data holder for the _pluginList.
     This class handles one plugin's data and the setup/loading of a plugin.
     serviceNames **and** dependencies are service names. They are arbitrary and do not necessarly need correspond to the plugin's name.
     """
-    def __init__(self, pluginPath, manifest):
+    def __init__(self, pluginPath, manifest, bootstrap=None):
         """
         Receives the path of the plugin, service names provided by the plugin and a list of dependencies.
+        {bootstrap} is the (filename, description) of the bootstrap module as returned by imp.find_module (optional, taken from the manifest cache).
         """
         # we could check the format of serviceNames and dependencies here, but I dont yet
         try:
@@ -123,17 +135,20 @@ class PluginInfo(object):
             else:
                 self._supports_multiprocess = True
         except KeyError, e:
-            raise PluginMalformedManifestError(path)
+            raise PluginMalformedManifestError(os.path.basename(pluginPath))
             
+        self._manifest = manifest
+        self._bootstrap = bootstrap
         self._pluginModule = None
 
     def setup(self):
         """Load the plugin, set the _pluginModule and call the setup method."""
         logger.info("loading %s" % self.pluginName)
         try:
-            bFile, bFilename, bDesc = imp.find_module(BOOTSTRAP_MODULE_NAME, [self._pluginPath])
+            bFile, bFilename, bDesc = self._findBootstrapModule()
             sys.path.append(os.path.dirname(bFilename))
-            self._pluginModule = imp.load_module(self.pluginName, bFile, bFilename, bDesc)
+            with startupprofiler.measure('import', "%s (bootstrap module)" % (self.pluginName,)):
+                self._pluginModule = imp.load_module(self.pluginName, bFile, bFilename, bDesc)
         except ImportError, e:
             logger.exception(traceback.format_exc())
             raise PluginBootstrapModuleNotLoaded(self.pluginName)
@@ -142,9 +157,22 @@ class PluginInfo(object):
             self._pluginModule = None
             raise PluginBootstrapSetupMethodNotFoundError(self.pluginName)
         _currentSetupPluginInfo = self
-        self._pluginModule.setup()
+        with startupprofiler.measure('setup', self.pluginName):
+            self._pluginModule.setup()
         _currentSetupPluginInfo = None
 
+    def _findBootstrapModule(self):
+        """Returns the result of imp.find_module for the bootstrap module. The lookup is skipped if the location is known from the cache."""
+        if self._bootstrap:
+            bFilename, bDesc = self._bootstrap
+            try:
+                return open(bFilename, bDesc[1]), bFilename, bDesc
+            except IOError:
+                pass # the module has moved, look it up again
+        bFile, bFilename, bDesc = imp.find_module(BOOTSTRAP_MODULE_NAME, [self._pluginPath])
+        self._bootstrap = (bFilename, bDesc) if bFile else None
+        return bFile, bFilename, bDesc
+
     def implementsService(self, name):
         """Tells if the plugin's manifest specifies the service's name given."""
         return (name in self._serviceNames)
@@ -200,6 +228,79 @@ class PluginInfo(object):
     def pluginName(self):
         return os.path.basename(self._pluginPath)
 
+    def toCacheEntry(self):
+        """Returns a json serializable dict, which can be given to fromCacheEntry."""
+        return { 'path' : self._pluginPath, 'manifest' : self._manifest, 'bootstrap' : self._bootstrap }
+
+    @classmethod
+    def fromCacheEntry(cls, entry):
+        bootstrap = None
+        if entry['bootstrap']:
+            bFilename, (suffix, mode, mtype) = entry['bootstrap']
+            bootstrap = (str(bFilename), (str(suffix), str(mode), int(mtype)))
+        return cls(str(entry['path']), entry['manifest'], bootstrap)
+
+
+class _PhaseTimer(object):
+    """Measures the wall time of the bootstrapping phases (only used if config.PLUGINS_PROFILE is set)."""
+    def __init__(self, enabled):
+        self._enabled = enabled
+        self._phases = []
+        self._last = time.time()
+
+    def phase(self, name):
+        """Ends the current phase and names it {name}."""
+        if not self._enabled:
+            return
+        now = time.time()
+        self._phases.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self._enabled:
+            return
+        for name, duration in self._phases:
+            print "plugin bootstrapping: %-12s %8.1f ms" % (name, duration * 1000)
+        print "plugin bootstrapping: %-12s %8.1f ms" % ('total', sum([d for n, d in self._phases]) * 1000)
+
+
+def _manifestModificationTimes(pluginsPath):
+    """Returns a dict with the plugin directory names as keys and the modification time of their manifests as values."""
+    result = {}
+    for path in os.listdir(pluginsPath):
+        absPath = os.path.join(pluginsPath, path)
+        if not os.path.isdir(absPath):
+            continue
+        try:
+            result[path] = os.path.getmtime(os.path.join(absPath, MANIFEST_FILENAME))
+        except OSError, e: # handle error if manifest does not exist
+            raise PluginManifestNotFoundError(path)
+    return result
+
+def _readCache(pluginsPath, mtimes):
+    """Returns the list of PluginInfos (in load order) from the cache or None if the cache is missing or outdated."""
+    try:
+        with open(config.PLUGINS_CACHE_FILE, 'r') as cacheFile:
+            cache = json.load(cacheFile)
+        if (cache['version'] != CACHE_VERSION) or (cache['plugins_path'] != pluginsPath) or (cache['multiprocess'] != config.IS_MULTIPROCESS) or (cache['mtimes'] != mtimes):
+            return None
+        return [PluginInfo.fromCacheEntry(entry) for entry in cache['plugins']]
+    except Exception, e: # a broken cache is treated like a missing one
+        logger.info("ignoring plugin cache (%s)" % (str(e),))
+        return None
+
+def _writeCache(pluginsPath, mtimes, loadOrder):
+    """Saves the validated plugin list {loadOrder} so the next start can skip discovery and validation."""
+    cache = { 'version' : CACHE_VERSION, 'plugins_path' : pluginsPath, 'multiprocess' : config.IS_MULTIPROCESS, 'mtimes' : mtimes,
+              'plugins' : [pluginInfo.toCacheEntry() for pluginInfo in loadOrder] }
+    tmpPath = "%s.%d.tmp" % (config.PLUGINS_CACHE_FILE, os.getpid())
+    try:
+        with open(tmpPath, 'w') as cacheFile:
+            json.dump(cache, cacheFile)
+        os.rename(tmpPath, config.PLUGINS_CACHE_FILE) # atomic, so a concurrently starting process never sees half a file
+    except (IOError, OSError), e:
+        logger.warning("could not write plugin cache %s (%s)" % (config.PLUGINS_CACHE_FILE, str(e)))
+
 
 def init(pluginsPath):
     """
@@ -207,45 +308,61 @@ def init(pluginsPath):
     Walks through the plugins directory and reads the dependencies (loadsAfter, requires) and saves this information to the pluginList.
     Then the plugins' setup method is called, where the plugin can register it's services.
     The order of loading depends on the loadsAfter tree.
+    If the manifest cache is up to date, the manifests are neither read nor validated again (see module documentation).
     
     Semantics:
     During the setup of the plugins the plugins can assume that the service which are specified in loadsAfter are present.
     The plugins which are specified in requries are not necessarily present during the setup call, but the system enforces
     that they are present in the system after all plugins are present.
     """
-    for path in os.listdir(pluginsPath):
+    timer = _PhaseTimer(config.PLUGINS_PROFILE)
+    mtimes = _manifestModificationTimes(pluginsPath)
+    cachedPlugins = _readCache(pluginsPath, mtimes)
+    timer.phase('discovery')
+
+    if cachedPlugins is not None:
+        # the cached list is validated and sorted already
+        _pluginList.extend(cachedPlugins)
+        for pluginInfo in _pluginList:
+            pluginInfo.setup()
+        timer.phase('setup')
+        logger.info("done loading plugins (from cache)")
+        timer.report()
+        return
+
+    for path in sorted(mtimes.keys()):
         absPath = os.path.join(pluginsPath, path)
-        if not os.path.isdir(absPath):
-            continue
         try:
-            manifestFile = open(os.path.join(absPath, MANIFEST_FILENAME), 'r')
+            with open(os.path.join(absPath, MANIFEST_FILENAME), 'r') as manifestFile:
+                manifest = json.load(manifestFile)
         except IOError, e: # handle error if manifest does not exist
             raise PluginManifestNotFoundError(path)
-        try:
-            manifest = json.load(manifestFile)
         except Exception, e:
             raise PluginMalformedManifestError(path)
         _pluginList.append(PluginInfo(absPath, manifest))
+    timer.phase('manifests')
 
     # check for duplications of service implementations
-    allServices = []  # damn i can not find decent documentation on sets... the next couple of lines are ugly
+    serviceCount = {}
     for pluginInfo in _pluginList:
-        allServices.extend(pluginInfo.serviceNames)
-    for s in set(allServices):
-        allServices.remove(s)
-    if len(allServices) > 0:
-        raise PluginDuplicateServiceDefinitionsInManifestError(', '.join(allServices))
+        for s in pluginInfo.serviceNames:
+            serviceCount[s] = serviceCount.get(s, 0) + 1
+    duplicateServices = [s for s, count in serviceCount.iteritems() if count > 1]
+    if len(duplicateServices) > 0:
+        raise PluginDuplicateServiceDefinitionsInManifestError(', '.join(duplicateServices))
     
     if config.IS_MULTIPROCESS:
         for pluginInfo in _pluginList:
             if not pluginInfo.supports_multiprocess:
                 raise PluginUnsupportedMultiprocess(pluginInfo.pluginName)
+    timer.phase('validation')
     
     # Load the plugins in according to the loadsAfter specifications in the plugin's manifest.
     # This is how it works:
     #   iterate through the pluginList and load the plugins which have no (loadsAfter) dependencies
     #   repeat this iteration as long as at least one plugin was loaded in the last cycle.
     #   if there are unloaded plugins left after that, there is an unsatifyable dependency (either cycle or undefined service names).
+    loadOrder = []
     loadedPlugin = True
     while (loadedPlugin):
         loadedPlugin = False
@@ -254,7 +371,9 @@ def init(pluginsPath):
                 continue
             if pluginInfo.allLoadsAfterSatisfied(_pluginList):
                pluginInfo.setup()
+               loadOrder.append(pluginInfo)
                loadedPlugin = True
+    timer.phase('setup')
     
     # crash if not all plugins loaded
     # also crash if not all requires statements are satisfied
@@ -263,7 +382,10 @@ def init(pluginsPath):
             raise PluginLoadAfterResolvingError(pluginInfo.pluginName)
         if not pluginInfo.allRequiresSatisfied(_pluginList):
             raise PluginRequiresCanNotBeFulfilledError(pluginInfo.pluginName)
+    _writeCache(pluginsPath, mtimes, loadOrder)
+    timer.phase('cache')
     logger.info("done loading plugins")
+    timer.report()
 
 def getService(name):
     """
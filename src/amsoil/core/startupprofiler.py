@@ -0,0 +1,148 @@
+"""
+This module records where the time goes while AMsoil boots (see main.py --profile-startup).
+
+When enabled, the profiler wraps the import statement and measures every import which actually loads a new module.
+The pluginmanager also reports each plugin's bootstrap module and setup() call via measure(...).
+For each of these steps the wall time (including and excluding nested steps) and the change of the process' memory
+(resident set size) is recorded.
+
+finish() writes two files:
+- a human readable report sorted by the time spent in the step itself (config.STARTUP_PROFILE_REPORT)
+- a machine readable trace, one json object per line in the order the steps were started (config.STARTUP_PROFILE_TRACE)
+Keep the trace of each release around and compare it with the next one to spot startup regressions.
+
+The profiler only measures the main thread and costs nothing when it is not enabled.
+"""
+import __builtin__
+import sys
+import os
+import time
+import json
+import resource
+import threading
+
+_enabled = False
+_originalImport = None
+_records = [] # finished steps in the order they were started
+_stack = [] # steps in progress, each is a list of [record, time spent in children]
+_startTime = None
+
+def _memoryKB():
+    """Returns the current resident set size of the process in KB (peak size if /proc is not available)."""
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * (resource.getpagesize() / 1024)
+    except (IOError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _isMainThread():
+    return isinstance(threading.current_thread(), threading._MainThread)
+
+class measure(object):
+    """
+    Context manager which records the enclosed block as one step.
+    {kind} groups the steps (e.g. 'import', 'setup'), {name} identifies the step.
+    Example:
+        with startupprofiler.measure('setup', 'myplugin'):
+            plugin.setup()
+    """
+    def __init__(self, kind, name):
+        self._kind = kind
+        self._name = name
+        self._active = False
+        self._record = None
+
+    def __enter__(self):
+        if not (_enabled and _isMainThread()):
+            return self
+        self._active = True
+        record = { 'kind' : self._kind, 'name' : self._name, 'depth' : len(_stack), 'start' : time.time() - _startTime, 'memory_start_kb' : _memoryKB() }
+        _records.append(record)
+        _stack.append([record, 0.0])
+        self._record = record
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not self._active:
+            return False
+        record, childrenTime = _stack.pop()
+        total = time.time() - _startTime - record['start']
+        record['total'] = total
+        record['self'] = total - childrenTime
+        record['memory_kb'] = _memoryKB() - record.pop('memory_start_kb')
+        record['failed'] = exc_type is not None
+        if _stack:
+            _stack[-1][1] += total
+        return False
+
+def _profiledImport(name, globals=None, locals=None, fromlist=None, level=-1):
+    """Replacement for __import__, which records an import step if the import loaded at least one new module."""
+    if not _isMainThread():
+        return _originalImport(name, globals, locals, fromlist, level)
+    moduleCount = len(sys.modules)
+    step = measure('import', name)
+    with step:
+        module = _originalImport(name, globals, locals, fromlist, level)
+    if step._active and (len(sys.modules) == moduleCount): # nothing was loaded, forget the record
+        # nested steps may have been recorded after ours (e.g. a nested import which failed and was caught), so remove ours by identity
+        index = len(_records) - 1
+        while _records[index] is not step._record:
+            index -= 1
+        del _records[index]
+        if _stack:
+            _stack[-1][1] -= step._record['total']
+    return module
+
+def enable():
+    """Starts recording. Call this as early as possible, so the first imports are measured too."""
+    global _enabled, _originalImport, _startTime
+    if _enabled:
+        return
+    _startTime = time.time()
+    _originalImport = __builtin__.__import__
+    __builtin__.__import__ = _profiledImport
+    _enabled = True
+
+def disable():
+    """Stops recording and restores the original import function."""
+    global _enabled
+    if not _enabled:
+        return
+    __builtin__.__import__ = _originalImport
+    _enabled = False
+
+def isEnabled():
+    return _enabled
+
+def records():
+    """Returns the finished steps as list of dicts (keys: kind, name, depth, start, total, self, memory_kb, failed). Times are in seconds."""
+    return [r for r in _records if 'total' in r]
+
+def finish(reportPath=None, tracePath=None):
+    """
+    Stops recording and writes the report and the trace.
+    If no paths are given, config.STARTUP_PROFILE_REPORT and config.STARTUP_PROFILE_TRACE are used.
+    Returns the tuple (reportPath, tracePath).
+    """
+    wallTime = time.time() - _startTime
+    disable()
+    from amsoil import config
+    reportPath = reportPath or config.STARTUP_PROFILE_REPORT
+    tracePath = tracePath or config.STARTUP_PROFILE_TRACE
+    finished = records()
+
+    with open(tracePath, 'w') as trace:
+        for record in finished:
+            trace.write(json.dumps(record, sort_keys=True))
+            trace.write('\n')
+
+    with open(reportPath, 'w') as report:
+        report.write("AMsoil startup profile (%s)\n" % (time.strftime('%Y-%m-%d %H:%M:%S'),))
+        report.write("total wall time: %.1f ms, imports: %.1f ms, plugin setups: %.1f ms\n\n" % (wallTime * 1000,
+            sum([r['self'] for r in finished if r['kind'] == 'import']) * 1000,
+            sum([r['self'] for r in finished if r['kind'] == 'setup']) * 1000))
+        report.write("%10s %10s %10s  %-7s %s\n" % ('self [ms]', 'total [ms]', 'mem [KB]', 'kind', 'name'))
+        for record in sorted(finished, key=lambda r: r['self'], reverse=True):
+            report.write("%10.1f %10.1f %10d  %-7s %s%s\n" % (record['self'] * 1000, record['total'] * 1000, record['memory_kb'],
+                record['kind'], record['name'], ' (failed)' if record['failed'] else ''))
+    return reportPath, tracePath
@@ -0,0 +1,166 @@
+"""
+This module provides lightweight tracing of requests.
+A trace consists of nested, timed spans which belong to one request (identified by a request id).
+It helps to find out where the time of a single (slow) call is spent (e.g. dispatching, authentication, RSpec parsing, database access, HTTP calls).
+
+Usage:
+    from amsoil.core import trace
+
+    with trace.request('ListResources'): # usually done by the RPC dispatcher
+        ...
+        with trace.span('auth'):
+            ...
+        with trace.span('db.get_resources', rows=len(rows)): # keyword arguments are stored as tags of the span
+            ...
+
+    @trace.traced('opennaas.http') # same as wrapping the whole function in a span
+    def get(self, url):
+        ...
+
+Spans which are opened outside of a request (e.g. in the worker) are not recorded and cost (almost) nothing.
+Requests taking longer than config.TRACE_SLOW_THRESHOLD are kept in a ring buffer (see slowRequests()) and, if config.TRACE_EXPORT_FILE is set,
+appended to that file as one json object per line.
+
+Configuration
+Please see the config.py file in the root/src-folder.
+"""
+import time
+import json
+import threading
+import itertools
+import collections
+
+from amsoil import config
+import amsoil.core.log
+logger=amsoil.core.log.getLogger('trace')
+
+_local = threading.local()
+_requestIds = itertools.count(1)
+_slowRequests = collections.deque(maxlen=config.TRACE_RING_SIZE)
+_exportLock = threading.Lock()
+
+
+class _Span(object):
+    """Internal data holder for one timed section."""
+    __slots__ = ('name', 'tags', 'start', 'duration', 'children')
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.start = time.time()
+        self.duration = None
+        self.children = []
+
+    def toDict(self, requestStart):
+        result = { 'name' : self.name, 'offset' : self.start - requestStart, 'duration' : self.duration }
+        if self.tags:
+            result['tags'] = self.tags
+        if self.children:
+            result['children'] = [child.toDict(requestStart) for child in self.children]
+        return result
+
+
+class span(object):
+    """
+    Context manager which records the enclosed block as a span of the current request.
+    {name} should be a short, static identifier (e.g. 'db.get_slice'), {tags} are stored alongside.
+    """
+    __slots__ = ('_name', '_tags', '_span')
+
+    def __init__(self, name, **tags):
+        self._name = name
+        self._tags = tags
+        self._span = None
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack: # only record inside of a request
+            self._span = _Span(self._name, self._tags)
+            stack[-1].children.append(self._span)
+            stack.append(self._span)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._span:
+            self._span.duration = time.time() - self._span.start
+            if exc_type is not None:
+                self._span.tags['error'] = exc_type.__name__
+            stack = getattr(_local, 'stack', None) or []
+            # spans above this one were not closed (e.g. an abandoned generator), they are dropped with it
+            for index in xrange(len(stack) - 1, -1, -1):
+                if stack[index] is self._span:
+                    del stack[index:]
+                    break
+        return False
+
+    def tag(self, **tags):
+        """Adds tags to the span (e.g. the number of rows which were only known after the work was done)."""
+        if self._span:
+            self._span.tags.update(tags)
+
+
+class request(span):
+    """
+    Context manager which starts a new trace for the current thread.
+    Nested requests (e.g. a dispatcher calling another dispatcher) are recorded as spans of the outer request.
+    """
+    __slots__ = ('_requestId',)
+
+    def __enter__(self):
+        if (not config.TRACE_ENABLED) or getattr(_local, 'stack', None):
+            return span.__enter__(self)
+        self._requestId = _requestIds.next()
+        self._span = _Span(self._name, self._tags)
+        _local.stack = [self._span]
+        _local.requestId = self._requestId
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        stack = getattr(_local, 'stack', None)
+        if (not self._span) or (not stack) or (stack[0] is not self._span):
+            return span.__exit__(self, exc_type, exc_value, tb)
+        root = self._span
+        root.duration = time.time() - root.start
+        if exc_type is not None:
+            root.tags['error'] = exc_type.__name__
+        _local.stack = None
+        _local.requestId = None
+        if root.duration >= config.TRACE_SLOW_THRESHOLD:
+            _recordSlowRequest(self._requestId, root)
+        return False
+
+
+def traced(name):
+    """Decorator which wraps each call of the function in a span called {name}."""
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+def currentRequestId():
+    """Returns the id of the request the current thread is working on (or None)."""
+    return getattr(_local, 'requestId', None)
+
+def slowRequests():
+    """Returns the most recent slow requests (newest last) as list of dicts (keys: id, time, name, duration, tags, children)."""
+    return list(_slowRequests)
+
+def _recordSlowRequest(requestId, root):
+    entry = root.toDict(root.start)
+    entry['id'] = requestId
+    entry['time'] = root.start
+    del entry['offset']
+    _slowRequests.append(entry)
+    logger.info("slow request #%d %s took %.3f sec", requestId, root.name, root.duration)
+    if config.TRACE_EXPORT_FILE:
+        try:
+            line = json.dumps(entry, default=str)
+            with _exportLock:
+                with open(config.TRACE_EXPORT_FILE, 'a') as exportFile:
+                    exportFile.write(line + '\n')
+        except (IOError, TypeError, ValueError) as e:
+            logger.warning("could not export trace #%d (%s)", requestId, str(e))
@@ -1,22 +1,35 @@
 import sys
 import getopt
 
+# the profiler needs to be enabled before anything else is imported, otherwise the imports below are not measured
+PROFILE_STARTUP = '--profile-startup' in sys.argv[1:]
+if PROFILE_STARTUP:
+    from amsoil.core import startupprofiler
+    startupprofiler.enable()
+
 from amsoil import config
 from amsoil.core import pluginmanager as pm
 
 def print_usage():
-    print "USAGE: ./main.py [--help] [--worker]"
+    print "USAGE: ./main.py [--help] [--worker] [--profile-startup]"
     print
     print "When no option is specified, the server will be started."
     print
-    print "  --help    Print this help message."
-    print "  --worker  Starts the worker process instead of the RPC server."
+    print "  --help             Print this help message."
+    print "  --worker           Starts the worker process instead of the RPC server."
+    print "  --profile-startup  Records wall time and memory of every import and plugin setup."
+    print "                     The report and the trace are written to the log folder."
 
 def main():
     # load plugins
+    if PROFILE_STARTUP:
+        config.PLUGINS_PROFILE = True
     pm.init(config.PLUGINS_PATH)
+    if PROFILE_STARTUP:
+        report_path, trace_path = startupprofiler.finish()
+        print "Startup profile written to %s (trace: %s)" % (report_path, trace_path)
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'hw', ['help', 'worker'])
+        opts, args = getopt.getopt(sys.argv[1:], 'hw', ['help', 'worker', 'profile-startup'])
     except getopt.GetoptError as e:
         print "Wrong arguments: " + str(e)
         print
@@ -30,7 +43,7 @@ def main():
             worker = pm.getService('worker')
             worker.WorkerServer().runServer()
             sys.exit(0)
-    
+
     rpcserver = pm.getService('rpcserver')
     rpcserver.runServer()
 
@@ -96,20 +96,12 @@ class DHCPGENI3Delegate(GENIv3DelegateBase):
         """Documentation see [geniv3rpc] GENIv3DelegateBase."""
         # this code is similar to the provision call
         # TODO honor best effort
-        leases = []
-        for urn in urns:
-            if (self.urn_type(urn) == 'slice'):
-                client_urn, client_uuid, client_email = self.auth(client_cert, credentials, urn, ('renewsliver',)) # authenticate for each given slice
-                slice_leases = self._resource_manager.leases_in_slice(urn)
-                for lease in slice_leases: # extend the lease, so we have a longer timeout.
-                    try:
-                        self._resource_manager.extend_lease(lease, expiration_time)
-                    except dhcp_ex.DHCPMaxLeaseDurationExceeded as e:
-                        raise geni_ex.GENIv3BadArgsError("Lease can not be extended that long (%s)" % (str(e),))
-                leases.extend(slice_leases)
-            else:
-                raise geni_ex.GENIv3OperationUnsupportedError('Only slice URNs can be renewed in this aggregate')
-                # we could use _urn_to_ip helper method for mapping sliver URNs to IPs
+        self._check_slice_urns(urns, 'Only slice URNs can be renewed in this aggregate')
+        client_urn, client_uuid, client_email = self.auth_urns(client_cert, credentials, urns, ('renewsliver',)) # authenticate for all given slices at once
+        try: # extend the leases, so we have a longer timeout.
+            leases = self._resource_manager.extend_leases(self._resource_manager.leases_in_slices(urns), expiration_time)
+        except dhcp_ex.DHCPMaxLeaseDurationExceeded as e:
+            raise geni_ex.GENIv3BadArgsError("Lease can not be extended that long (%s)" % (str(e),))
         
         if len(leases) == 0:
             raise geni_ex.GENIv3SearchFailedError("There are no resources in the given slice(s)")
@@ -121,21 +113,13 @@ class DHCPGENI3Delegate(GENIv3DelegateBase):
         """Documentation see [geniv3rpc] GENIv3DelegateBase.
         {geni_users} is not relevant here."""
         # TODO honor best_effort
-        provisioned_leases = []
-        for urn in urns:
-            if (self.urn_type(urn) == 'slice'):
-                client_urn, client_uuid, client_email = self.auth(client_cert, credentials, urn, ('createsliver',)) # authenticate for each given slice
-                leases = self._resource_manager.leases_in_slice(urn)
-                for lease in leases: # extend the lease, so we have a longer timeout.
-                    try:
-                        self._resource_manager.extend_lease(lease, end_time)
-                    except dhcp_ex.DHCPMaxLeaseDurationExceeded as e:
-                        raise geni_ex.GENIv3BadArgsError("Lease can not be extended that long (%s)" % (str(e),))
-                # usually you would really instanciate resources here (not necessary for IP-resources)
-                provisioned_leases.extend(leases)
-            else:
-                raise geni_ex.GENIv3OperationUnsupportedError('Only slice URNs can be provisioned by this aggregate')
-                # we could use _urn_to_ip helper method for mapping sliver URNs to IPs
+        self._check_slice_urns(urns, 'Only slice URNs can be provisioned by this aggregate')
+        client_urn, client_uuid, client_email = self.auth_urns(client_cert, credentials, urns, ('createsliver',)) # authenticate for all given slices at once
+        try: # extend the leases, so we have a longer timeout.
+            provisioned_leases = self._resource_manager.extend_leases(self._resource_manager.leases_in_slices(urns), end_time)
+        except dhcp_ex.DHCPMaxLeaseDurationExceeded as e:
+            raise geni_ex.GENIv3BadArgsError("Lease can not be extended that long (%s)" % (str(e),))
+        # usually you would really instanciate resources here (not necessary for IP-resources)
         
         if len(provisioned_leases) == 0:
             raise geni_ex.GENIv3SearchFailedError("There are no resources in the given slice(s); perform allocate first")
@@ -146,15 +130,9 @@ class DHCPGENI3Delegate(GENIv3DelegateBase):
     def status(self, urns, client_cert, credentials):
         """Documentation see [geniv3rpc] GENIv3DelegateBase."""
         # This code is similar to the provision call.
-        leases = []
-        for urn in urns:
-            if (self.urn_type(urn) == 'slice'):
-                client_urn, client_uuid, client_email = self.auth(client_cert, credentials, urn, ('sliverstatus',)) # authenticate for each given slice
-                slice_leases = self._resource_manager.leases_in_slice(urn)
-                leases.extend(slice_leases)
-            else:
-                raise geni_ex.GENIv3OperationUnsupportedError('Only slice URNs can be given to status in this aggregate')
-                # we could use _urn_to_ip helper method for mapping sliver URNs to IPs
+        self._check_slice_urns(urns, 'Only slice URNs can be given to status in this aggregate')
+        client_urn, client_uuid, client_email = self.auth_urns(client_cert, credentials, urns, ('sliverstatus',)) # authenticate for all given slices at once
+        leases = self._resource_manager.leases_in_slices(urns)
         
         if len(leases) == 0:
             raise geni_ex.GENIv3SearchFailedError("There are no resources in the given slice(s)")
@@ -170,17 +148,10 @@ class DHCPGENI3Delegate(GENIv3DelegateBase):
     def delete(self, urns, client_cert, credentials, best_effort):
         """Documentation see [geniv3rpc] GENIv3DelegateBase."""
         # This code is similar to the provision call.
-        leases = []
-        for urn in urns:
-            if (self.urn_type(urn) == 'slice'):
-                client_urn, client_uuid, client_email = self.auth(client_cert, credentials, urn, ('deletesliver',)) # authenticate for each given slice
-                slice_leases = self._resource_manager.leases_in_slice(urn)
-                for lease in slice_leases:
-                    self._resource_manager.free_lease(lease)
-                leases.extend(slice_leases)
-            else:
-                raise geni_ex.GENIv3OperationUnsupportedError('Only slice URNs can be deleted in this aggregate')
-                # we could use _urn_to_ip helper method for mapping sliver URNs to IPs
+        self._check_slice_urns(urns, 'Only slice URNs can be deleted in this aggregate')
+        client_urn, client_uuid, client_email = self.auth_urns(client_cert, credentials, urns, ('deletesliver',)) # authenticate for all given slices at once
+        leases = self._resource_manager.leases_in_slices(urns)
+        self._resource_manager.free_leases(leases)
         
         if len(leases) == 0:
             raise geni_ex.GENIv3SearchFailedError("There are no resources in the given slice(s)")
@@ -196,6 +167,13 @@ class DHCPGENI3Delegate(GENIv3DelegateBase):
 
 
     # Helper methods
+    def _check_slice_urns(self, urns, message):
+        """Helper method which raises an OperationUnsupportedError with the given {message} if any of the {urns} is not a slice URN."""
+        for urn in urns:
+            if (self.urn_type(urn) != 'slice'):
+                raise geni_ex.GENIv3OperationUnsupportedError(message)
+                # we could use _urn_to_ip helper method for mapping sliver URNs to IPs
+
     def _ip_to_urn(self, ip_str):
         """Helper method to map IPs to URNs."""
         return ("%s:%s" % (self.URN_PREFIX, ip_str.replace('.', '-')))
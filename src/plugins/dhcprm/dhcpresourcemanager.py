@@ -68,6 +68,37 @@ class DHCPResourceManager(object):
         return leases
         
     
+    def leases_in_slices(self, slice_names):
+        """Same as leases_in_slice, but for many slices at once (one query, ordered like {slice_names})."""
+        order = dict((name, i) for i, name in enumerate(slice_names))
+        leases = db_session.query(DHCPLease).filter(DHCPLease.slice_name.in_(slice_names)).all() if slice_names else []
+        leases.sort(key=lambda lease: order[lease.slice_name])
+        db_session.expunge_all() # detach the objects from the database session, so the user can not directly change the database
+        return leases
+
+    def extend_leases(self, leases, end_time=None):
+        """Same as extend_lease, but for many leases in one transaction (returned in the order of {leases}). Nothing is changed if one of the leases can not be extended."""
+        if not leases:
+            return []
+        internal_leases = db_session.query(DHCPLease).filter(DHCPLease.ip_str.in_([lease.ip_str for lease in leases])).all() # find the internal data objects
+        try:
+            for lease in internal_leases:
+                lease.set_end_time_with_max(end_time, self.MAX_LEASE_DURATION)
+        except:
+            db_session.rollback()
+            raise
+        db_session.commit()
+        db_session.expunge_all() # detach the objects from the database session, so the user can not directly change the database
+        by_ip = dict((lease.ip_str, lease) for lease in internal_leases)
+        return [by_ip[lease.ip_str] for lease in leases if lease.ip_str in by_ip]
+
+    def free_leases(self, leases):
+        """Same as free_lease, but for many leases in one transaction."""
+        if leases:
+            db_session.query(DHCPLease).filter(DHCPLease.ip_str.in_([lease.ip_str for lease in leases])).delete(synchronize_session=False)
+            db_session.commit()
+        return None
+
     def free_lease(self, lease):
         lease = find_lease(lease.ip) # find the internal data object
         db_session.delete(lease)
@@ -137,7 +168,7 @@ class DHCPLease(Base):
         if end_time == None:
             end_time = max_end_time
         if (end_time > max_end_time):
-            raise DHCPMaxLeaseDurationExceeded(lease.ip_str)
+            raise DHCPMaxLeaseDurationExceeded(self.ip_str)
         self.end_time = end_time
 
     @property
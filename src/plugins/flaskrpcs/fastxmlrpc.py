@@ -0,0 +1,244 @@
+"""
+Faster marshalling of XML-RPC responses (see FastXMLRPCHandler).
+
+xmlrpclib.dumps writes each value in many small pieces, joins them and then joins the result again with the header.
+Large RSpec strings are hence copied several times and long sliver lists cause a lot of function calls.
+The ChunkMarshaller produces the same XML, but
+- writes strings which do not need escaping as they are (no copy at all),
+- writes the members of structs with simple values (e.g. sliver status) in one go,
+- collects the output in chunks of CHUNK_SIZE bytes and passes large strings as separate chunks (they are never copied into a bigger string).
+The chunks can be sent to the client as they are, so large responses do not need to be joined at all.
+Values with an iterchunks method (e.g. RSpecs kept in a temporary file, see the geniv3rpc plugin) are marshalled as strings, their content is only
+read (in chunks) while the response is sent (see DeferredChunks), so it is not held in memory as a whole.
+"""
+import sys
+import xmlrpclib
+from xmlrpclib import Fault, escape
+
+from flask import request, current_app
+from flaskext.xmlrpc import XMLRPCHandler
+
+import ratelimit
+
+CHUNK_SIZE = 64 * 1024
+
+class DeferredChunks(object):
+    """Strings which are only produced when the response is sent, passed to ChunkWriter.write like a string of {size} bytes (at least CHUNK_SIZE)."""
+    __slots__ = ('_chunks', '_size')
+
+    def __init__(self, chunks, size):
+        self._chunks = chunks
+        self._size = max(size, CHUNK_SIZE) # kept as chunk of its own by the ChunkWriter
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+class ChunkWriter(object):
+    """Collects written strings. Small strings are coalesced into chunks of about CHUNK_SIZE, large ones are kept as chunks of their own."""
+    __slots__ = ('chunks', 'size', '_pending', '_pending_size')
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, data):
+        length = len(data)
+        self.size += length
+        if length >= CHUNK_SIZE:
+            self._flush()
+            self.chunks.append(data)
+            return
+        self._pending.append(data)
+        self._pending_size += length
+        if self._pending_size >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self.chunks.append(''.join(self._pending))
+            del self._pending[:]
+            self._pending_size = 0
+
+    def getchunks(self):
+        """Returns the list of chunks (strings or DeferredChunks), which make up the output."""
+        self._flush()
+        return self.chunks
+
+    def iterchunks(self):
+        """Generator over the output in strings (DeferredChunks are produced now)."""
+        for chunk in self.getchunks():
+            if type(chunk) is DeferredChunks:
+                for part in chunk:
+                    yield part
+            else:
+                yield chunk
+
+
+def _escape(value):
+    """Same as xmlrpclib.escape, but avoids scanning the string three times if nothing needs to be escaped (the common case for keys and short values)."""
+    if ('&' in value) or ('<' in value) or ('>' in value):
+        return escape(value)
+    return value
+
+_SIMPLE_FORMATS = {
+    str  : "<member>\n<name>%s</name>\n<value><string>%s</string></value>\n</member>\n",
+    bool : "<member>\n<name>%s</name>\n<value><boolean>%d</boolean></value>\n</member>\n",
+    int  : "<member>\n<name>%s</name>\n<value><int>%d</int></value>\n</member>\n",
+}
+
+class ChunkMarshaller(xmlrpclib.Marshaller):
+    """Marshaller which produces the same output as xmlrpclib.Marshaller, but faster (see module documentation)."""
+    dispatch = dict(xmlrpclib.Marshaller.dispatch)
+
+    def dumps_response(self, values, write):
+        """Writes a complete methodResponse document for {values} (a singleton tuple or a Fault) to {write}."""
+        if self.encoding != "utf-8":
+            write("<?xml version='1.0' encoding='%s'?>\n" % str(self.encoding))
+        else:
+            write("<?xml version='1.0'?>\n")
+        write("<methodResponse>\n")
+        dump = self._Marshaller__dump
+        if isinstance(values, Fault):
+            write("<fault>\n")
+            dump({'faultCode': values.faultCode, 'faultString': values.faultString}, write)
+            write("</fault>\n")
+        else:
+            write("<params>\n")
+            for v in values:
+                write("<param>\n")
+                dump(v, write)
+                write("</param>\n")
+            write("</params>\n")
+        write("</methodResponse>\n")
+
+    def dump_string(self, value, write):
+        if len(value) < CHUNK_SIZE:
+            write("<value><string>%s</string></value>\n" % (_escape(value),))
+        else:
+            write("<value><string>")
+            write(_escape(value))
+            write("</string></value>\n")
+    dispatch[str] = dump_string
+
+    def dump_struct(self, value, write):
+        i = id(value)
+        if i in self.memo:
+            raise TypeError, "cannot marshal recursive dictionaries"
+        self.memo[i] = None
+        dump = self._Marshaller__dump
+        write("<value><struct>\n")
+        for k, v in value.iteritems():
+            if type(k) is str:
+                k = _escape(k)
+            elif type(k) is unicode:
+                k = escape(k).encode(self.encoding, 'xmlcharrefreplace')
+            else:
+                raise TypeError, "dictionary key must be string"
+            simple_format = _SIMPLE_FORMATS.get(type(v))
+            if (simple_format is not None) and ((type(v) is not str) or (len(v) < CHUNK_SIZE)) and ((type(v) is not int) or (xmlrpclib.MININT <= v <= xmlrpclib.MAXINT)):
+                write(simple_format % (k, _escape(v) if type(v) is str else v))
+            else:
+                write("<member>\n<name>%s</name>\n" % (k,))
+                dump(v, write)
+                write("</member>\n")
+        write("</struct></value>\n")
+        del self.memo[i]
+    dispatch[dict] = dump_struct
+
+    def dump_instance(self, value, write):
+        if hasattr(value, 'iterchunks'):
+            write("<value><string>")
+            write(DeferredChunks((_escape(chunk) for chunk in value.iterchunks()), len(value)))
+            write("</string></value>\n")
+        else:
+            xmlrpclib.Marshaller.dump_instance(self, value, write)
+    dispatch[xmlrpclib.InstanceType] = dump_instance
+
+
+class FastXMLRPCHandler(XMLRPCHandler):
+    """
+    XMLRPCHandler which marshals the responses with the ChunkMarshaller.
+    Responses larger than {chunked_threshold} bytes are passed to the server as list of chunks without a Content-Length,
+    so the server sends them with chunked transfer encoding (or until the connection is closed for HTTP/1.0) instead of joining them first.
+    A {chunked_threshold} of 0 disables this.
+    If a {rate_limiter} (see ratelimit) is given, each request has to be admitted by it before it is parsed
+    (and again after parsing, if the method found in the raw request is of another priority class than the parsed one; the first admission is cancelled then).
+    """
+    def __init__(self, endpoint_name=None, instance=None, introspection=True, multicall=False, chunked_threshold=0, rate_limiter=None):
+        XMLRPCHandler.__init__(self, endpoint_name, instance, introspection, multicall)
+        self.chunked_threshold = chunked_threshold
+        self.rate_limiter = rate_limiter
+
+    def handle_request(self):
+        writer = self._marshaled_dispatch_chunks(request.data)
+        if self.chunked_threshold and (writer.size > self.chunked_threshold):
+            # werkzeug computes the Content-Length for lists, but not for iterators
+            return current_app.response_class(writer.iterchunks(), content_type='text/xml')
+        return current_app.response_class(''.join(writer.iterchunks()), content_type='text/xml')
+
+    def _marshaled_dispatch_chunks(self, data):
+        """Same as SimpleXMLRPCDispatcher._marshaled_dispatch, but returns the ChunkWriter with the response."""
+        admission = ratelimit.ADMITTED
+        try:
+            peeked_method = ratelimit.peek_method_name(data)
+            admission, rejection = self._admit(peeked_method)
+            if rejection is None:
+                params, method = xmlrpclib.loads(data)
+                if (method != peeked_method) and (self._priority_class(method) != self._priority_class(peeked_method)):
+                    # the peeked name was wrong (e.g. a name in a comment), give the token back and admit by the real one
+                    admission.cancel()
+                    admission = ratelimit.ADMITTED
+                    admission, rejection = self._admit(method)
+            if rejection is not None:
+                response = (rejection,)
+            else:
+                response = (self._dispatch(method, params),)
+        except Fault, fault:
+            response = fault
+        except:
+            exc_type, exc_value = sys.exc_info()[:2]
+            response = Fault(1, "%s:%s" % (exc_type, exc_value))
+        finally:
+            admission.release()
+        writer = ChunkWriter()
+        try:
+            ChunkMarshaller(self.encoding, self.allow_none).dumps_response(response, writer.write)
+        except:
+            exc_type, exc_value = sys.exc_info()[:2]
+            writer = ChunkWriter()
+            ChunkMarshaller(self.encoding, self.allow_none).dumps_response(Fault(1, "%s:%s" % (exc_type, exc_value)), writer.write)
+        return writer
+
+    def _admit(self, method):
+        """Asks the rate limiter if a call of {method} may be processed.
+        Returns the admission (to be released after the call) and None or the admission and the response to send instead of processing the request."""
+        if (self.rate_limiter is None) or (self.instance is None):
+            return ratelimit.ADMITTED, None
+        admission = self.rate_limiter.admit(self._client_identity(), self._priority_class(method))
+        if admission.retry_after is None:
+            return admission, None
+        return admission, self.instance._rejectedReturn(method, admission.retry_after, admission.reason)
+
+    def _priority_class(self, method):
+        """Returns the rate limiting class of {method}. Calls whose name is not known (or could not be found) count as mutating calls."""
+        if (self.instance is not None) and (method in self.instance.READONLY_METHODS):
+            return ratelimit.READ
+        return ratelimit.WRITE
+
+    def _client_identity(self):
+        """Returns the identity of the caller for the rate limiter.
+        Callers without certificate (or whose certificate could not be read) are told apart by their address, so they do not share one bucket."""
+        try:
+            client_cert = self.instance.requestCertificate()
+        except Exception: # e.g. DebugClientCertNotFound, the method itself decides if it needs the certificate
+            client_cert = None
+        identity = self.instance._clientIdentity(client_cert) if client_cert else None
+        if identity is None:
+            return ('address', request.remote_addr)
+        return identity
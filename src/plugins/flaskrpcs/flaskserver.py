@@ -1,3 +1,5 @@
+import logging
+
 from flask import Flask, request, request_started, request_finished
 
 import amsoil.core.pluginmanager as pm
@@ -25,12 +27,15 @@ class FlaskServer(object):
         # Setup debugging for app
         config = pm.getService("config")
         cDebug = config.get("flask.debug")
-        if cDebug: # log all actions on the XML-RPC interface
+        if cDebug: # log all actions on the XML-RPC interface (debug level, so the bodies can be silenced via config.LOG_LEVELS['flaskrpcs'])
+            # the bodies are only read if the record is written (response.data joins a chunked response)
             def log_request(sender, **extra):
-                logger.info(">>> REQUEST %s:\n%s" % (request.path, request.data))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(">>> REQUEST %s:\n%s", request.path, request.data)
             request_started.connect(log_request, self._app)
             def log_response(sender, response, **extra):
-                logger.info(">>> RESPONSE %s:\n%s" % (response.status, response.data))
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(">>> RESPONSE %s:\n%s", response.status, response.data)
             request_finished.connect(log_response, self._app)
 
     @property
@@ -1,7 +1,11 @@
 from flup.server.fcgi import WSGIServer
-from flaskext.xmlrpc import XMLRPCHandler, Fault
+from flaskext.xmlrpc import Fault
 
 from xmlrpcdispatcher import XMLRPCDispatcher
+from fastxmlrpc import FastXMLRPCHandler
+from ratelimit import RateLimiter
+
+import amsoil.core.pluginmanager as pm
 
 from amsoil.core import serviceinterface
 
@@ -20,6 +24,7 @@ class FlaskXMLRPC(object):
     """
     def __init__(self, flaskapp):
         self._flaskapp = flaskapp
+        self._rate_limiter = None # shared by all endpoints, created on the first registerXMLRPC
 
     @property
     @serviceinterface
@@ -33,7 +38,12 @@ class FlaskXMLRPC(object):
         {unique_service_name} just has to be a unique name (dont ask why).
         The {instance} is an object (an {Dispatcher} instance) providing the methods which get called via the XMLRPC enpoint.
         {endpoint} is the mounting point for the XML RPC interface (e.g. '/geni' )."""
-        handler = XMLRPCHandler(unique_service_name)
+        config = pm.getService("config")
+        if (self._rate_limiter is None) and config.get("flask.ratelimit.enabled"):
+            self._rate_limiter = RateLimiter(config.get("flask.ratelimit.read_rate"), config.get("flask.ratelimit.read_burst"),
+                                             config.get("flask.ratelimit.write_rate"), config.get("flask.ratelimit.write_burst"),
+                                             config.get("flask.ratelimit.max_concurrent_reads"))
+        handler = FastXMLRPCHandler(unique_service_name, chunked_threshold=config.get("flask.xmlrpc.chunked_threshold"), rate_limiter=self._rate_limiter)
         handler.connect(self._flaskapp.app, endpoint)
         handler.register_instance(instance)
 
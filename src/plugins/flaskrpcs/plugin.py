@@ -16,6 +16,13 @@ def setup():
     config.install("flask.app_port", 8001, "Port to bind the Flask RPC to (standalone server).")
     config.install("flask.debug", True, "Write logging messages for the Flask RPC server.")
     config.install("flask.fcgi", False, "Use FCGI server instead of the development server.")
+    config.install("flask.xmlrpc.chunked_threshold", 1048576, "XML-RPC responses larger than this (bytes) are sent in chunks (chunked transfer encoding) instead of being joined first. 0 disables chunked responses.")
+    config.install("flask.ratelimit.enabled", False, "Limit the rate of XML-RPC calls per client (certificate, or address for clients without certificate). Rejected calls get an error (e.g. GENI code BUSY) without being processed. Off by default, existing clients may poll faster than the limits below.")
+    config.install("flask.ratelimit.read_rate", 5, "Read-only calls (e.g. GetVersion, ListResources, Status) per second and client. 0 disables the limit.")
+    config.install("flask.ratelimit.read_burst", 20, "Number of read-only calls a client may issue at once, before the read_rate applies.")
+    config.install("flask.ratelimit.write_rate", 2, "Mutating calls (e.g. Allocate, Delete) per second and client. 0 disables the limit.")
+    config.install("flask.ratelimit.write_burst", 10, "Number of mutating calls a client may issue at once, before the write_rate applies.")
+    config.install("flask.ratelimit.max_concurrent_reads", 8, "Number of read-only calls (of all clients) processed at the same time, further ones are rejected. Mutating calls are not affected. 0 for no limit.")
     config.install("flask.debug.client_cert_file", '~/.gcf/alice-cert.pem', "Only if FCGI off and debug on: The debug-server can not receive client certificates, this file is then taken for each incoming request.")
 
     # create and register the RPC server
@@ -0,0 +1,120 @@
+"""
+Rate limiting and admission control for the XML-RPC endpoints (see FastXMLRPCHandler).
+
+Each client gets one token bucket per priority class: read-only calls (see XMLRPCDispatcher.READONLY_METHODS) and mutating calls.
+A call takes a token from the bucket of its class, the buckets refill at a configured rate up to a configured burst size.
+Hence, a client polling ListResources in a loop runs out of read tokens, but can still allocate and delete.
+In addition, the number of read-only calls running at the same time can be capped (for all clients together), so reads can not occupy all server threads.
+
+The decision is made on the raw request, before the parameters (credentials, RSpecs) are parsed.
+The method name is only looked up with a regular expression there, so FastXMLRPCHandler checks it against the parsed name. If the names are of different
+classes, the first admission is cancelled (its token is given back) and the call is admitted by the parsed name, so each call is charged to one bucket.
+Calls whose name can not be found count as mutating calls.
+Clients without certificate are told apart by their address.
+"""
+import re
+import time
+import threading
+
+READ = 'read'
+WRITE = 'write'
+
+MAX_BUCKETS = 10000 # when there are more buckets, the ones which are full again (idle clients) are dropped
+
+_METHOD_NAME_RE = re.compile(r'<methodName>\s*([^<\s]+)\s*</methodName>')
+METHOD_NAME_SEARCH_LENGTH = 1024 # the method name comes right after the XML declaration
+
+def peek_method_name(data):
+    """Returns the method name of the given XML-RPC request string without parsing the request or None if it could not be found."""
+    match = _METHOD_NAME_RE.search(data, 0, METHOD_NAME_SEARCH_LENGTH)
+    return match.group(1) if match else None
+
+
+class TokenBucket(object):
+    """Token bucket holding at most {burst} tokens and gaining {rate} tokens per second. Not thread-safe (see RateLimiter)."""
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, now):
+        """Takes a token. Returns 0 on success or the number of seconds until the next token is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class Admission(object):
+    """Result of RateLimiter.admit. If {retry_after} is None, the call was admitted and release() must be called when it has finished.
+    cancel() is release() for calls which were admitted in the wrong class: it also gives the token back to the bucket it was taken from."""
+    __slots__ = ('retry_after', 'reason', '_semaphore', '_bucket', '_lock')
+
+    def __init__(self, retry_after=None, reason=None, semaphore=None, bucket=None, lock=None):
+        self.retry_after = retry_after
+        self.reason = reason
+        self._semaphore = semaphore
+        self._bucket = bucket
+        self._lock = lock
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+            self._semaphore = None
+
+    def cancel(self):
+        if self._bucket is not None:
+            with self._lock:
+                self._bucket.tokens = min(self._bucket.burst, self._bucket.tokens + 1)
+            self._bucket = None
+        self.release()
+
+ADMITTED = Admission()
+
+
+class RateLimiter(object):
+    """Decides which calls are admitted (see module documentation). The instances are thread-safe."""
+
+    def __init__(self, read_rate, read_burst, write_rate, write_burst, max_concurrent_reads=0):
+        """{*_rate} tokens per second per client and class (0 disables the limit for the class), {*_burst} maximum number of tokens,
+        {max_concurrent_reads} number of read-only calls which may run at the same time (0 for no limit)."""
+        self._limits = { READ : (read_rate, max(1, read_burst)), WRITE : (write_rate, max(1, write_burst)) }
+        self._buckets = {} # (client identity, class) -> TokenBucket
+        self._lock = threading.Lock()
+        self._read_slots = threading.Semaphore(max_concurrent_reads) if max_concurrent_reads else None
+
+    def admit(self, identity, priority_class):
+        """Returns an Admission for a call of the client {identity} (any hashable) in the given {priority_class} (READ or WRITE)."""
+        rate, burst = self._limits[priority_class]
+        bucket = None
+        if rate:
+            now = time.time()
+            key = (identity, priority_class)
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    if len(self._buckets) >= MAX_BUCKETS:
+                        self._prune(now)
+                    bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+                wait = bucket.take(now)
+            if wait:
+                return Admission(wait, "rate limit of %s calls exceeded" % (priority_class,))
+        if (priority_class == READ) and (self._read_slots is not None):
+            if not self._read_slots.acquire(False):
+                return Admission(1, "too many concurrent %s calls" % (priority_class,))
+            return Admission(semaphore=self._read_slots, bucket=bucket, lock=self._lock)
+        if bucket is not None:
+            return Admission(bucket=bucket, lock=self._lock)
+        return ADMITTED
+
+    def _prune(self, now):
+        for key in [key for key, bucket in self._buckets.iteritems() if bucket.is_full(now)]:
+            del self._buckets[key]
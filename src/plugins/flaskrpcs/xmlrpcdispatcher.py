@@ -1,15 +1,22 @@
 import os.path
+import hashlib
+from xmlrpclib import Fault
 from flask import request
 
 from amsoil.core import serviceinterface
+from amsoil.core import trace
 import amsoil.core.pluginmanager as pm
 
 from amsoil.config import expand_amsoil_path
 
 import exceptions
 
+RATE_LIMITED_FAULT_CODE = 429
+
 class XMLRPCDispatcher(object):
     """Please see documentation in FlaskXMLRPC."""
+    READONLY_METHODS = frozenset() # names of the methods which do not change anything (lower priority class for rate limiting, see ratelimit)
+
     @serviceinterface
     def __init__(self, log):
         self._log = log
@@ -33,7 +40,10 @@ class XMLRPCDispatcher(object):
         
 
     def _dispatch(self, method, params):
-        self._log.info("Called: <%s>" % (method))
+        self._log.info("Called: <%s>", method)
+        if method.startswith('_'): # private methods (e.g. helpers which take the client certificate as parameter) must not be callable remotely
+            self._log.warning("Client called private method: <%s>" % (method))
+            raise AttributeError("method <%s> is not supported" % (method,))
         try:
             meth = getattr(self, "%s" % (method))
         except AttributeError, e:
@@ -41,8 +51,19 @@ class XMLRPCDispatcher(object):
             raise e
 
         try:
-            return meth(*params)
+            with trace.request(method):
+                return meth(*params)
         except Exception, e:
             # TODO check if the exception has already been logged
             self._log.exception("Call to known method <%s> failed!" % (method))
             raise e
+
+    def _clientIdentity(self, client_cert):
+        """Returns the key by which calls are rate limited. Overwrite to use a more meaningful identity (e.g. the URN in the certificate)."""
+        if client_cert is None:
+            return None
+        return hashlib.sha1(client_cert).digest()
+
+    def _rejectedReturn(self, method, retry_after, reason):
+        """Returns the response for calls which were not admitted by the rate limiter. Overwrite to return a protocol specific error."""
+        raise Fault(RATE_LIMITED_FAULT_CODE, "Call to <%s> rejected: %s, retry after %.1f seconds" % (method, reason, retry_after))
@@ -209,13 +209,7 @@ class CredentialVerifier(object):
         self.logger.debug('Verifying privileges')
         result = list()
         failure = ""
-        tried_creds = ""
         for cred in credentials:
-            if tried_creds != "":
-                tried_creds = "%s, %s" % (tried_creds, cred.get_gid_caller().get_urn())
-            else:
-                tried_creds = cred.get_gid_caller().get_urn()
-
             if not self.verify_source(gid, cred):
                 failure = "Cred %s fails: Source URNs dont match" % cred.get_gid_caller().get_urn()
                 continue
@@ -226,8 +220,6 @@ class CredentialVerifier(object):
                 failure = "Cert %s doesn't have sufficient privileges" % cred.get_gid_caller().get_urn()
                 continue
 
-
-            print 
             try:
                 if not cred.verify(self.root_cert_files):
                     failure = "Couldn't validate credential for caller %s with target %s with any of %d known root certs" % (cred.get_gid_caller().get_urn(), cred.get_gid_object().get_urn(), len(self.root_cert_files))
@@ -247,6 +239,8 @@ class CredentialVerifier(object):
         else:
             # We did not find any credential with sufficient privileges
             # Raise an exception.
+            # the list of tried credentials is only needed for the error message, so it is assembled here
+            tried_creds = ", ".join([cred.get_gid_caller().get_urn() for cred in credentials])
             fault_code = 'Insufficient privileges'
             fault_string = 'No credential was found with appropriate privileges. Tried %s. Last failure: %s' % (tried_creds, failure)
             self.logger.error(fault_string)
@@ -0,0 +1,86 @@
+"""
+Compression of RSpecs for the geni_compress option (zlib, then base64 as required by the GENI AM API v3).
+
+Advertisements and manifests are often requested again without having changed (see GENIv3DelegateBase.cached_advertisement),
+so the compressed payloads are cached by the content of the RSpec. RSpecs are very repetitive and compress fast, hashing them with SHA-1
+took about as long as compressing them. Hence, the entries are looked up by length and CRC-32 and the RSpec is compared with the cached one.
+RSpecs in temporary files (see spooledrspec) are compressed while they are read back in chunks and cached by identity (the delegate's
+advertisement cache returns the same instance until the advertisement changes).
+Large RSpecs are compressed in chunks, so the uncompressed and the compressed copy do not need to be held in one piece (besides the input).
+"""
+import zlib
+import base64
+import threading
+import collections
+
+STREAM_CHUNK_SIZE = 64 * 1024 # bytes of input fed to the compressor at once, also the threshold for compressing in chunks
+
+def compress_chunks(chunks, level=zlib.Z_DEFAULT_COMPRESSION):
+    """Compresses the strings given by the iterable {chunks} and returns the base64 encoded result.
+    The result is the same as base64.b64encode(zlib.compress(''.join(chunks), level))."""
+    compressor = zlib.compressobj(level)
+    encoded = []
+    carry = '' # base64 encodes groups of 3 bytes, the rest is kept for the next round
+    for chunk in chunks:
+        data = carry + compressor.compress(chunk)
+        cut = len(data) - (len(data) % 3)
+        encoded.append(base64.b64encode(data[:cut]))
+        carry = data[cut:]
+    encoded.append(base64.b64encode(carry + compressor.flush()))
+    return ''.join(encoded)
+
+def compress(rspec, level=zlib.Z_DEFAULT_COMPRESSION):
+    """Returns the base64 encoded zlib compressed {rspec}."""
+    if len(rspec) <= STREAM_CHUNK_SIZE:
+        return base64.b64encode(zlib.compress(rspec, level))
+    return compress_chunks((rspec[i:i+STREAM_CHUNK_SIZE] for i in xrange(0, len(rspec), STREAM_CHUNK_SIZE)), level)
+
+
+class CompressionCache(object):
+    """Keeps the compressed payloads of the most recently compressed RSpecs (least recently used ones are dropped). The instances are thread-safe.
+    The RSpecs are kept as well (to compare them), usually they are held by the delegate's cache anyway."""
+
+    def __init__(self, size=16, level=zlib.Z_DEFAULT_COMPRESSION):
+        """{size} maximum number of cached payloads (0 disables the cache), {level} zlib compression level (0-9, -1 for zlib's default)"""
+        self.size = size
+        self.level = level
+        self._entries = collections.OrderedDict() # (length, crc32) -> (rspec, compressed payload)
+        self._last = None # (rspec, compressed), avoids hashing if the very same string object is compressed again
+        self._lock = threading.Lock()
+
+    def compress(self, rspec):
+        """Returns the base64 encoded zlib compressed {rspec} (string or SpooledRSpec), from the cache if possible."""
+        if isinstance(rspec, unicode):
+            rspec = rspec.encode('utf-8')
+        last = self._last
+        if last and (last[0] is rspec):
+            return last[1]
+        spooled = not isinstance(rspec, str)
+        if not self.size:
+            return self._compress(rspec, spooled)
+        key = (len(rspec), id(rspec) if spooled else zlib.crc32(rspec), spooled) # the entry keeps the RSpec, so the id is not reused meanwhile
+        compressed = None
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry # move to the end (most recently used)
+        if (entry is not None) and ((entry[0] is rspec) or ((not spooled) and (entry[0] == rspec))):
+            compressed = entry[1]
+        if compressed is None:
+            compressed = self._compress(rspec, spooled)
+            with self._lock:
+                self._entries[key] = (rspec, compressed)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        self._last = (rspec, compressed)
+        return compressed
+
+    def _compress(self, rspec, spooled):
+        if spooled:
+            return compress_chunks(rspec.iterchunks(STREAM_CHUNK_SIZE), self.level)
+        return compress(rspec, self.level)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._last = None
@@ -1,17 +1,18 @@
 import os, os.path
-import urllib2
+import sys
 import traceback
 from datetime import datetime
-from dateutil import parser as dateparser
 
 from lxml import etree
 from lxml.builder import ElementMaker
 
 import ext.geni
 import ext.sfa.trust.gid as gid
+import ext.sfa.trust.credential as credential
 
 import amsoil.core.pluginmanager as pm
 from amsoil.core import serviceinterface
+from amsoil.core import trace
 from amsoil.config import ROOT_PATH
 import amsoil.core.log
 logger=amsoil.core.log.getLogger('geniv3rpc')
@@ -19,8 +20,14 @@ logger=amsoil.core.log.getLogger('geniv3rpc')
 from amsoil.config import expand_amsoil_path
 
 from exceptions import *
+from schemacache import SchemaRegistry
+from compression import CompressionCache
+from spooledrspec import SpooledRSpec
+from singleflight import SingleFlight, freeze
+import rfc3339
 
 xmlrpc = pm.getService('xmlrpc')
+_shared_schema_registry = None
 
 class GENIv3Handler(xmlrpc.Dispatcher):
     # TODO
@@ -36,15 +43,33 @@ class GENIv3Handler(xmlrpc.Dispatcher):
     #     st['request_data'] = { post_data, certs, ... }
     # """
     
-    RFC3339_FORMAT_STRING = '%Y-%m-%d %H:%M:%S.%fZ'
+    RFC3339_FORMAT_STRING = rfc3339.FORMAT_STRING
+    READONLY_METHODS = frozenset(['GetVersion', 'ListResources', 'Describe', 'Status'])
+    CLIENT_IDENTITY_MEMO_SIZE = 1024
     
     def __init__(self):
         super(GENIv3Handler, self).__init__(logger)
         self._delegate = None
+        self._version = None # GetVersion result, see _reload
+        self._single_flight = SingleFlight()
+        self._client_identities = {} # client certificate -> urn, see _clientIdentity
+        self._load_config()
     
     @serviceinterface
     def setDelegate(self, geniv3delegate):
         self._delegate = geniv3delegate
+        self._reload()
+    
+    def _reload(self):
+        """Re-reads the config keys of this plugin and the capabilities of the delegate (extensions, allocation mode), which are otherwise only read when the delegate is set.
+        Call this method (via the geniv3reload service) if the config or the delegate's answers have changed.
+        It is private, because the handler's public methods are callable by any client over XML-RPC."""
+        self._load_config()
+        try:
+            self._version = self._successReturn(self._build_version())
+        except Exception as e:
+            logger.error("Could not build the GetVersion result (it is retried on the next call): %s" % (str(e),))
+            self._version = None
     
     @serviceinterface
     def getDelegate(self):
@@ -56,35 +81,21 @@ class GENIv3Handler(xmlrpc.Dispatcher):
     def GetVersion(self):
         """Returns the version of this interface.
         This method can be hard coded, since we are actually setting up the GENI v3 API, only.
-        For the RSpec extensions, we ask the delegate."""
+        For the RSpec extensions, we ask the delegate (once, see _reload)."""
         # no authentication necessary
-        
-        try:
-            request_extensions = self._delegate.get_request_extensions_list()
-            ad_extensions = self._delegate.get_ad_extensions_list()
-            allocation_mode = self._delegate.get_allocation_mode()
-            is_single_allocation = self._delegate.is_single_allocation()
-        except Exception as e:
-            return self._errorReturn(e)
-                
-        request_rspec_versions = [
-            { 'type' : 'geni', 'version' : '3', 'schema' : 'http://www.geni.net/resources/rspec/3/request.xsd', 'namespace' : 'http://www.geni.net/resources/rspec/3', 'extensions' : request_extensions},]
-        ad_rspec_versions = [
-                { 'type' : 'geni', 'version' : '3', 'schema' : 'http://www.geni.net/resources/rspec/3/ad.xsd', 'namespace' : 'http://www.geni.net/resources/rspec/3', 'extensions' : ad_extensions },]
-        credential_types = { 'geni_type' : 'geni_sfa', 'geni_version' : '3' }
-    
-        return self._successReturn({ 
-                'geni_api'                    : '3',
-                'geni_api_versions'           : { '3' : '/RPC2' }, # this should be an absolute URL
-                'geni_request_rspec_versions' : request_rspec_versions,
-                'geni_ad_rspec_versions'      : ad_rspec_versions,
-                'geni_credential_types'       : credential_types,
-                'geni_single_allocation'      : is_single_allocation,
-                'geni_allocate'               : allocation_mode
-                })
+        version = self._version
+        if version is None:
+            try:
+                version = self._version = self._successReturn(self._build_version())
+            except Exception as e:
+                return self._errorReturn(e)
+        return version
 
     def ListResources(self, credentials, options):
         """Delegates the call and unwraps the needed parameter. Also takes care of the compression option."""
+        return self._shared_call('ListResources', self._list_resources, credentials, options)
+
+    def _list_resources(self, client_cert, credentials, options):
         # interpret options
         geni_available = bool(options['geni_available']) if ('geni_available' in options) else False
         geni_compress = bool(options['geni_compress']) if ('geni_compress' in options) else False
@@ -92,36 +103,42 @@ class GENIv3Handler(xmlrpc.Dispatcher):
         # check version and delegate
         try:
             self._checkRSpecVersion(options['geni_rspec_version'])
-            result = self._delegate.list_resources(self.requestCertificate(), credentials, geni_available)
+            with trace.span('delegate.list_resources'):
+                result = self._delegate.list_resources(client_cert, credentials, geni_available)
         except Exception as e:
             return self._errorReturn(e)
         # compress and return
         if geni_compress:
-            result = base64.b64encode(zlib.compress(result))
+            result = self._compress(result)
         return self._successReturn(result)
 
     def Describe(self, urns, credentials, options):
         """Delegates the call and unwraps the needed parameter. Also takes care of the compression option."""
+        return self._shared_call('Describe', self._describe, urns, credentials, options)
+
+    def _describe(self, client_cert, urns, credentials, options):
         # some duplication with above
         geni_compress = bool(options['geni_compress']) if ('geni_compress' in options) else False
 
         try:
             self._checkRSpecVersion(options['geni_rspec_version'])
-            result = self._delegate.describe(urns, self.requestCertificate(), credentials)
+            with trace.span('delegate.describe', urns=len(urns)):
+                result = self._delegate.describe(urns, client_cert, credentials)
         except Exception as e:
             return self._errorReturn(e)
 
         if geni_compress:
-            result = base64.b64encode(zlib.compress(result))
+            result = self._compress(result)
         return self._successReturn(result)
 
     def Allocate(self, slice_urn, credentials, rspec, options):
         """Delegates the call and unwraps the needed parameter. Also converts the incoming timestamp to python and the outgoing to geni compliant date format."""
-        geni_end_time = self._str2datetime(options['geni_end_time']) if ('geni_end_time' in options) else None
         # TODO check the end_time against the duration of the credential
         try:
+            geni_end_time = self._str2datetime(options['geni_end_time']) if ('geni_end_time' in options) else None
             # delegate
-            result_rspec, result_sliver_list = self._delegate.allocate(slice_urn, self.requestCertificate(), credentials, rspec, geni_end_time)
+            with trace.span('delegate.allocate'):
+                result_rspec, result_sliver_list = self._delegate.allocate(slice_urn, self.requestCertificate(), credentials, rspec, geni_end_time)
             # change datetime's to strings
             result = { 'geni_rspec' : result_rspec, 'geni_slivers' : self._convertExpiresDate(result_sliver_list) }
         except Exception as e:
@@ -130,10 +147,11 @@ class GENIv3Handler(xmlrpc.Dispatcher):
 
     def Renew(self, urns, credentials, expiration_time_str, options):
         geni_best_effort = bool(options['geni_best_effort']) if ('geni_best_effort' in options) else True
-        expiration_time = self._str2datetime(expiration_time_str)
         try:
+            expiration_time = self._str2datetime(expiration_time_str)
             # delegate
-            result = self._delegate.renew(urns, self.requestCertificate(), credentials, expiration_time, geni_best_effort)
+            with trace.span('delegate.renew', urns=len(urns)):
+                result = self._delegate.renew(urns, self.requestCertificate(), credentials, expiration_time, geni_best_effort)
             # change datetime's to strings
             result = self._convertExpiresDate(result)
         except Exception as e:
@@ -142,20 +160,25 @@ class GENIv3Handler(xmlrpc.Dispatcher):
     
     def Provision(self, urns, credentials, options):
         geni_best_effort = bool(options['geni_best_effort']) if ('geni_best_effort' in options) else True
-        geni_end_time = self._str2datetime(options['geni_end_time']) if ('geni_end_time' in options) else None
         geni_users = options['geni_users'] if ('geni_users' in options) else []
         # TODO check the end_time against the duration of the credential
         try:
+            geni_end_time = self._str2datetime(options['geni_end_time']) if ('geni_end_time' in options) else None
             self._checkRSpecVersion(options['geni_rspec_version'])
-            result_rspec, result_sliver_list = self._delegate.provision(urns, self.requestCertificate(), credentials, geni_best_effort, geni_end_time, geni_users)
+            with trace.span('delegate.provision', urns=len(urns)):
+                result_rspec, result_sliver_list = self._delegate.provision(urns, self.requestCertificate(), credentials, geni_best_effort, geni_end_time, geni_users)
             result = { 'geni_rspec' : result_rspec, 'geni_slivers' : self._convertExpiresDate(result_sliver_list) }
         except Exception as e:
             return self._errorReturn(e)
         return self._successReturn(result)
     
     def Status(self, urns, credentials, options):
+        return self._shared_call('Status', self._status, urns, credentials, options)
+
+    def _status(self, client_cert, urns, credentials, options):
         try:
-            result_sliceurn, result_sliver_list = self._delegate.status(urns, self.requestCertificate(), credentials)
+            with trace.span('delegate.status', urns=len(urns)):
+                result_sliceurn, result_sliver_list = self._delegate.status(urns, client_cert, credentials)
             result = { 'geni_urn' : result_sliceurn, 'geni_slivers' : self._convertExpiresDate(result_sliver_list) }
         except Exception as e:
             return self._errorReturn(e)
@@ -164,7 +187,8 @@ class GENIv3Handler(xmlrpc.Dispatcher):
     def PerformOperationalAction(self, urns, credentials, action, options):
         geni_best_effort = bool(options['geni_best_effort']) if ('geni_best_effort' in options) else False
         try:
-            result = self._delegate.perform_operational_action(urns, self.requestCertificate(), credentials, action, geni_best_effort)
+            with trace.span('delegate.perform_operational_action', urns=len(urns)):
+                result = self._delegate.perform_operational_action(urns, self.requestCertificate(), credentials, action, geni_best_effort)
             result = self._convertExpiresDate(result)
         except Exception as e:
             return self._errorReturn(e)
@@ -173,7 +197,8 @@ class GENIv3Handler(xmlrpc.Dispatcher):
     def Delete(self, urns, credentials, options):
         geni_best_effort = bool(options['geni_best_effort']) if ('geni_best_effort' in options) else False
         try:
-            result = self._delegate.delete(urns, self.requestCertificate(), credentials, geni_best_effort)
+            with trace.span('delegate.delete', urns=len(urns)):
+                result = self._delegate.delete(urns, self.requestCertificate(), credentials, geni_best_effort)
             result = self._convertExpiresDate(result)
         except Exception as e:
             return self._errorReturn(e)
@@ -181,43 +206,111 @@ class GENIv3Handler(xmlrpc.Dispatcher):
 
     def Shutdown(self, slice_urn, credentials, options):
         try:
-            result = bool(self._delegate.shutdown(slice_urn, self.requestCertificate(), credentials))
+            with trace.span('delegate.shutdown'):
+                result = bool(self._delegate.shutdown(slice_urn, self.requestCertificate(), credentials))
         except Exception as e:
             return self._errorReturn(e)
         return self._successReturn(result)
 
 
     # ---- helper methods
+    def _shared_call(self, method, func, *args):
+        """Returns func(client_cert, *args), but shares the result with concurrent calls of the same {method} with the same client certificate and arguments (see singleflight).
+        Since the certificate and the credentials are part of the key, the authorization is still done for each caller (or rather each distinct set of credentials).
+        The result must not be modified after it has been returned."""
+        client_cert = self.requestCertificate()
+        if not self._single_flight_enabled:
+            return func(client_cert, *args)
+        with trace.span('single_flight', method=method):
+            return self._single_flight.do((method, client_cert, freeze(args)), func, client_cert, *args)
+
+    def _load_config(self):
+        config = pm.getService("config")
+        self._single_flight_enabled = config.get("geniv3rpc.single_flight")
+        cache_size, level = config.get("geniv3rpc.compress_cache_size"), config.get("geniv3rpc.compress_level")
+        cache = getattr(self, '_compression_cache', None)
+        if (cache is None) or (cache.size != cache_size) or (cache.level != level): # keep the cached payloads if nothing changed
+            self._compression_cache = CompressionCache(cache_size, level)
+
+    def _build_version(self):
+        """Assembles the value of the GetVersion result from the delegate's capabilities."""
+        request_extensions = self._delegate.get_request_extensions_list()
+        ad_extensions = self._delegate.get_ad_extensions_list()
+        allocation_mode = self._delegate.get_allocation_mode()
+        is_single_allocation = self._delegate.is_single_allocation()
+                
+        request_rspec_versions = [
+            { 'type' : 'geni', 'version' : '3', 'schema' : 'http://www.geni.net/resources/rspec/3/request.xsd', 'namespace' : 'http://www.geni.net/resources/rspec/3', 'extensions' : request_extensions},]
+        ad_rspec_versions = [
+                { 'type' : 'geni', 'version' : '3', 'schema' : 'http://www.geni.net/resources/rspec/3/ad.xsd', 'namespace' : 'http://www.geni.net/resources/rspec/3', 'extensions' : ad_extensions },]
+        credential_types = { 'geni_type' : 'geni_sfa', 'geni_version' : '3' }
+    
+        return { 
+                'geni_api'                    : '3',
+                'geni_api_versions'           : { '3' : '/RPC2' }, # this should be an absolute URL
+                'geni_request_rspec_versions' : request_rspec_versions,
+                'geni_ad_rspec_versions'      : ad_rspec_versions,
+                'geni_credential_types'       : credential_types,
+                'geni_single_allocation'      : is_single_allocation,
+                'geni_allocate'               : allocation_mode
+                }
+
+    def _compress(self, rspec):
+        """Compresses the {rspec} for the geni_compress option (results are cached by content, see compression.CompressionCache)."""
+        with trace.span('compress', size=len(rspec)):
+            return self._compression_cache.compress(rspec)
+
     def _datetime2str(self, dt):
-        return dt.strftime(self.RFC3339_FORMAT_STRING)
+        return rfc3339.format(dt)
     def _str2datetime(self, strval):
-        """Parses the given date string and converts the timestamp to utc and the date unaware of timezones."""
-        result = dateparser.parse(strval)
-        if result:
-            result = result - result.utcoffset()
-            result = result.replace(tzinfo=None)
-        return result
+        """Parses the given date string and converts the timestamp to utc and the date unaware of timezones (see rfc3339.parse)."""
+        try:
+            return rfc3339.parse(strval)
+        except ValueError as e:
+            raise GENIv3BadArgsError("Invalid timestamp %s (%s)" % (strval, str(e)))
 
     def _convertExpiresDate(self, sliver_list):
         for slhash in sliver_list:
-            if slhash['geni_expires'] == None:
+            expires = slhash['geni_expires']
+            if expires is None:
                 continue
-            if not isinstance(slhash['geni_expires'], datetime):
+            if not isinstance(expires, datetime):
                 raise ValueError("Given geni_expires in sliver_list hash retrieved from delegate's method is not a python datetime object.")
-            slhash['geni_expires'] = self._datetime2str(slhash['geni_expires'])
+            slhash['geni_expires'] = rfc3339.format(expires)
         return sliver_list
 
     def _checkRSpecVersion(self, rspec_version_option):
         if (int(rspec_version_option['version']) != 3) or (rspec_version_option['type'].lower() != 'geni'):
             raise GENIv3BadArgsError("Only RSpec 3 supported.")
         
-    def _errorReturn(self, e):
-        """Assembles a GENI compliant return result for faulty methods."""
+    def _clientIdentity(self, client_cert):
+        """Rate limits apply per user URN (see xmlrpc.Dispatcher). The URNs are memoized, so the certificate is only parsed once per client."""
+        if client_cert is None:
+            return None
+        urn = self._client_identities.get(client_cert)
+        if urn is None:
+            try:
+                urn = gid.GID(string=client_cert).get_urn()
+            except Exception:
+                return super(GENIv3Handler, self)._clientIdentity(client_cert) # not our business to reject invalid certificates here
+            if len(self._client_identities) >= self.CLIENT_IDENTITY_MEMO_SIZE:
+                self._client_identities.clear()
+            self._client_identities[client_cert] = urn
+        return urn
+
+    def _rejectedReturn(self, method, retry_after, reason):
+        """Calls which exceed the rate limits get a BUSY error (without logging a traceback, this is the normal way to slow down clients)."""
+        logger.info("Rejected call to <%s>: %s", method, reason)
+        return self._errorReturn(GENIv3BusyError("%s, please retry after %.1f seconds" % (reason, retry_after)), log=False)
+
+    def _errorReturn(self, e, log=True):
+        """Assembles a GENI compliant return result for faulty methods. The error and the current traceback are logged, unless {log} is False."""
         if not isinstance(e, GENIv3BaseError): # convert common errors into GENIv3GeneralError
             e = GENIv3ServerError(str(e))
         # do some logging
-        logger.error(e)
-        logger.error(traceback.format_exc())
+        if log:
+            logger.error(e)
+            logger.error(traceback.format_exc())
         return { 'geni_api' : 3, 'code' : { 'geni_code' : e.code }, 'output' : str(e) }
         
     def _successReturn(self, result):
@@ -226,6 +319,41 @@ class GENIv3Handler(xmlrpc.Dispatcher):
 
 
 
+class _ChunkCollector(object):
+    """Internal file-like object, which collects the output of etree.xmlfile until it is picked up."""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def pop(self):
+        data = ''.join(self.chunks)
+        del self.chunks[:]
+        return data
+
+
+class _SignatureCheckedOnce(object):
+    """Internal. Wraps a credential, so its signature is only checked once when it is verified for many targets (see GENIv3DelegateBase.auth_urns)."""
+    def __init__(self, cred):
+        self._cred = cred
+        self._verified = None # (result, exc_info)
+
+    def verify(self, trusted_certs=None):
+        if self._verified is None:
+            try:
+                self._verified = (self._cred.verify(trusted_certs), None)
+            except Exception:
+                self._verified = (None, sys.exc_info())
+        result, exc_info = self._verified
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cred, name)
+
+
 class GENIv3DelegateBase(object):
     """
     TODO document
@@ -269,7 +397,7 @@ class GENIv3DelegateBase(object):
 
     def __init__(self):
         super(GENIv3DelegateBase, self).__init__()
-        pass
+        self._advertisement_cache = {} # geni_available -> (generation, rspec string)
     
     def get_request_extensions_list(self):
         """Not to overwrite by AM developer. Should retrun a list of request extensions (XSD schemas) to be sent back by GetVersion."""
@@ -306,6 +434,11 @@ class GENIv3DelegateBase(object):
         For description of the options see http://groups.geni.net/geni/wiki/GAPI_AM_API_V3/CommonConcepts#OperationsonIndividualSlivers"""
         return 'geni_single'
 
+    def get_advertisement_generation(self):
+        """Overwrite by AM developer. Shall return a value which changes whenever the advertisement changes (e.g. a counter increased on allocate, delete and audit).
+        The value is compared with the one of the cached advertisement (see cached_advertisement). None (default) disables the cache."""
+        return None
+
     def list_resources(self, client_cert, credentials, geni_available):
         """Overwrite by AM developer. Shall return an RSpec version 3 (advertisement) or raise an GENIv3...Error.
         If {geni_available} is set, only return availabe resources.
@@ -479,6 +612,30 @@ class GENIv3DelegateBase(object):
         - user: "refresh", "resolve", "info" (which resolves to the privileges: "remove", "update", "resolve", "list", "getcredential", "listslices", "listnodes", "getpolicy").
         - slice: "refresh", "embed", "bind", "control", "info" (well, do the resolving yourself...)        
         """
+        self._verify_credentials(client_cert, credentials, [slice_urn], privileges)
+
+        user_gid = gid.GID(string=client_cert)
+        user_urn = user_gid.get_urn()
+        user_uuid = user_gid.get_uuid()
+        user_email = user_gid.get_email()
+        return user_urn, user_uuid, user_email # TODO document return
+
+    @serviceinterface
+    def auth_urns(self, client_cert, credentials, urns, privileges=()):
+        """
+        Same as auth(...), but authorizes the client for each of the given {urns} (e.g. all slices given to Status).
+        The client certificate and the credentials are parsed and the credentials' signatures are verified only once per call,
+        so checking hundreds of URNs costs about the same as checking one.
+        Returns the client's urn, uuid, email (like auth). If any of the URNs is not covered by the credentials, an GENIv3ForbiddenError is thrown.
+        """
+        self._verify_credentials(client_cert, credentials, urns, privileges)
+
+        client_gid = gid.GID(string=client_cert)
+        return client_gid.get_urn(), client_gid.get_uuid(), client_gid.get_email()
+
+    def _verify_credentials(self, client_cert, credentials, target_urns, privileges):
+        """Checks the credentials for each of the {target_urns} (see auth) with CredentialVerifier.verify.
+        The certificate and the credentials are parsed only once and each credential's signature is checked at most once."""
         # check variables
         if not isinstance(privileges, tuple):
             raise TypeError("Privileges need to be a tuple.")
@@ -491,19 +648,48 @@ class GENIv3DelegateBase(object):
         # get the cert_root
         config = pm.getService("config")
         cert_root = expand_amsoil_path(config.get("geniv3rpc.cert_root"))
-        
+
         # test the credential
         try:
-            cred_verifier = ext.geni.CredentialVerifier(cert_root)
-            cred_verifier.verify_from_strings(client_cert, geni_credentials, slice_urn, privileges)
+            with trace.span('auth', credentials=len(geni_credentials), urns=len(target_urns)):
+                cred_verifier = ext.geni.CredentialVerifier(cert_root)
+                if client_cert is None: # same as CredentialVerifier.verify_from_strings
+                    return
+                client_gid = gid.GID(string=client_cert)
+                creds = [_SignatureCheckedOnce(credential.Credential(string=c)) for c in geni_credentials]
+                for urn in target_urns:
+                    cred_verifier.verify(client_gid, creds, urn, privileges)
         except Exception as e:
             raise GENIv3ForbiddenError(str(e))
 
-        user_gid = gid.GID(string=client_cert)
-        user_urn = user_gid.get_urn()
-        user_uuid = user_gid.get_uuid()
-        user_email = user_gid.get_email()
-        return user_urn, user_uuid, user_email # TODO document return
+    @serviceinterface
+    def cached_advertisement(self, geni_available, builder):
+        """Returns the advertisement (RSpec string or SpooledRSpec) for the given {geni_available} variant.
+        The result of {builder} (a callable without arguments, which creates the RSpec) is cached until get_advertisement_generation() changes.
+        Please authenticate before calling this method, the cache is shared by all clients.
+        Example (in list_resources):
+            self.auth(client_cert, credentials, None, ('listslices',))
+            return self.cached_advertisement(geni_available, lambda: self._build_advertisement(geni_available))"""
+        generation = self.get_advertisement_generation() # read before building, so changes during the build cause a rebuild next time
+        if generation is None:
+            return builder()
+        cached = self._advertisement_cache.get(geni_available)
+        if cached and (cached[0] == generation):
+            return cached[1]
+        with trace.span('advertisement.build', generation=generation):
+            rspec = builder()
+        self._advertisement_cache[geni_available] = (generation, rspec)
+        return rspec
+
+    @serviceinterface
+    def rfc3339_to_datetime(self, value):
+        """Converts an RFC3339 timestamp (e.g. from an RSpec) to a UTC datetime without tzinfo. Raises ValueError if the timestamp is invalid."""
+        return rfc3339.parse(value)
+
+    @serviceinterface
+    def datetime_to_rfc3339(self, dt):
+        """Converts a UTC datetime to the timestamp format used in the responses (e.g. for dates in manifests)."""
+        return rfc3339.format(dt)
 
     @serviceinterface
     def urn_type(self, urn):
@@ -523,8 +709,43 @@ class GENIv3DelegateBase(object):
     @serviceinterface
     def lxml_to_string(self, rspec):
         """Converts a lxml root node to string (for returning to the client)."""
-        return etree.tostring(rspec, pretty_print=True)
+        with trace.span('rspec.serialize'):
+            return etree.tostring(rspec, pretty_print=True)
         
+    @serviceinterface
+    def lxml_ad_stream(self, elements, pretty_print=True):
+        """Serializes an advertisement incrementally into a temporary file and returns it as SpooledRSpec (for returning to the client).
+        {elements} is an iterable (e.g. a generator fed by a database cursor) of the lxml elements below the root node.
+        In contrast to lxml_ad_root/lxml_to_string, only one element is held in memory at a time, the result is read back in chunks
+        when it is compressed or sent (see spooledrspec). Use str(...) if the RSpec is needed as string.
+        Example:
+            em = self.lxml_ad_element_maker('myprefix')
+            return self.lxml_ad_stream(em.resource(em.name(row.name)) for row in rows)"""
+        return SpooledRSpec(self.lxml_stream_chunks('advertisement', self.get_ad_extensions_mapping(), elements, pretty_print))
+
+    @serviceinterface
+    def lxml_manifest_stream(self, elements, pretty_print=True):
+        """Same as lxml_ad_stream, but for manifests."""
+        return SpooledRSpec(self.lxml_stream_chunks('manifest', self.get_manifest_extensions_mapping(), elements, pretty_print))
+
+    @serviceinterface
+    def lxml_stream_chunks(self, rspec_type, extensions_mapping, elements, pretty_print=True):
+        """Generator which serializes an RSpec of the given {rspec_type} incrementally and yields the output in chunks (strings).
+        The root node is built the same way as lxml_ad_root/lxml_manifest_root do it. Each chunk holds the output of one element (or less)."""
+        output = _ChunkCollector()
+        with trace.span('rspec.serialize', streaming=True):
+            with etree.xmlfile(output, encoding='ascii') as xf:
+                with xf.element('rspec', extensions_mapping, type=rspec_type):
+                    if pretty_print:
+                        xf.write('\n')
+                    for element in elements:
+                        xf.write(element, pretty_print=pretty_print) # each element is indented on its own (one per line)
+                        if output.chunks:
+                            yield output.pop()
+            if pretty_print:
+                output.write('\n')
+        yield output.pop()
+
     @serviceinterface
     def lxml_ad_element_maker(self, prefix):
         """Returns a lxml.builder.ElementMaker configured for avertisements and the namespace given by {prefix}."""
@@ -542,7 +763,8 @@ class GENIv3DelegateBase(object):
         """Returns a the root element of the given {rspec_string} as lxml.Element.
         If the config key is set, the rspec is validated with the schemas found at the URLs specified in schemaLocation of the the given RSpec."""
         # parse
-        rspec_root = etree.fromstring(rspec_string)
+        with trace.span('rspec.parse', size=len(rspec_string)):
+            rspec_root = etree.fromstring(rspec_string)
         # validate RSpec against specified schemaLocations
         config = pm.getService("config")
         should_validate = config.get("geniv3rpc.rspec_validation")
@@ -550,20 +772,32 @@ class GENIv3DelegateBase(object):
         if should_validate:
             schema_locations = rspec_root.get("{http://www.w3.org/2001/XMLSchema-instance}schemaLocation")
             if schema_locations:
-                schema_location_list = schema_locations.split(" ")
-                schema_location_list = map(lambda x: x.strip(), schema_location_list) # strip whitespaces
+                # the attribute holds pairs of namespace and schema URL, only the URLs (every second entry) lead to a schema
+                schema_location_list = schema_locations.split()[1::2]
+                registry = self._schema_registry()
                 for sl in schema_location_list:
                     try:
-                        xmlschema_contents = urllib2.urlopen(sl) # try to download the schema
-                        xmlschema_doc = etree.parse(xmlschema_contents)
-                        xmlschema = etree.XMLSchema(xmlschema_doc)
-                        xmlschema.validate(rspec_root)
+                        with trace.span('rspec.validate', schema=sl):
+                            valid, errors = registry.validate(sl, rspec_root)
+                        if not valid:
+                            logger.warning("RSpec is not valid according to %s (%s)", sl, errors)
                     except Exception as e:
                         logger.warning("RSpec validation failed failed (%s: %s)" % (sl, str(e),))
             else:
                 logger.warning("RSpec does not specify any schema locations")
         return rspec_root
 
+    @classmethod
+    def _schema_registry(cls):
+        """Returns the registry for the compiled schemas (shared by all delegates). It is created on first use."""
+        global _shared_schema_registry
+        if _shared_schema_registry is None:
+            config = pm.getService("config")
+            _shared_schema_registry = SchemaRegistry([expand_amsoil_path(config.get("geniv3rpc.schema_dir"))],
+                expand_amsoil_path(config.get("geniv3rpc.schema_cache_dir")),
+                config.get("geniv3rpc.schema_download"))
+        return _shared_schema_registry
+
     @serviceinterface
     def lxml_elm_has_request_prefix(self, lxml_elm, ns_name):
         return str(lxml_elm.tag).startswith("{%s}" % (self.get_request_extensions_mapping()[ns_name],))
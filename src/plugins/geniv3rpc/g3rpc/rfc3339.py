@@ -0,0 +1,66 @@
+"""
+Conversion between RFC3339 timestamps and python datetimes as used by the GENI AM API v3.
+
+parse() converts a timestamp string to a UTC datetime without tzinfo (the convention of the delegates, see GENIv3DelegateBase).
+format() converts a datetime to the string format sent back to clients (e.g. '2013-11-08 12:00:00.000000Z').
+
+The usual RFC3339 forms (e.g. '2013-11-08T12:00:00Z', '2013-11-08 12:00:00.5+02:00') are handled by a precompiled expression.
+Anything else is passed to dateutil, which is much slower, but accepts about any format.
+Clients tend to send the same timestamps over and over again (e.g. renewing all slivers to the same date), so the results of parse() are memoized.
+format() is not memoized, datetime.isoformat is cheaper than the lookup.
+"""
+import re
+import threading
+from datetime import datetime, timedelta
+from dateutil import parser as dateparser
+
+FORMAT_STRING = '%Y-%m-%d %H:%M:%S.%fZ' # the format produced by format() (kept for reference, format() does not use strftime)
+MEMO_SIZE = 256 # entries of the parse memo, the memo is cleared when it is full
+
+_RFC3339_RE = re.compile(r'^\s*(\d{4})-(\d\d)-(\d\d)[Tt ](\d\d):(\d\d):(\d\d)(?:[.,](\d+))?\s*(?:([Zz])|([+-])(\d\d):?(\d\d))?\s*$')
+
+_parse_memo = {}
+_lock = threading.Lock()
+
+def parse(value):
+    """Converts the given timestamp string to a datetime in UTC without tzinfo. Timestamps without offset are assumed to be UTC.
+    Raises ValueError if the string is not a valid timestamp."""
+    result = _parse_memo.get(value)
+    if result is None:
+        result = _parse(value)
+        _remember(_parse_memo, value, result)
+    return result
+
+def format(dt):
+    """Converts the given datetime to the string format used in responses. Timezone information is ignored (please pass UTC datetimes)."""
+    # isoformat is done in C and is cheaper than any memo lookup, it only omits zero microseconds and appends the offset of aware datetimes
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None)
+    if dt.microsecond:
+        return dt.isoformat(' ') + 'Z'
+    return dt.isoformat(' ') + '.000000Z'
+
+def _parse(value):
+    match = _RFC3339_RE.match(value)
+    if not match:
+        return _parse_fallback(value)
+    year, month, day, hour, minute, second, fraction, zulu, sign, offset_hours, offset_minutes = match.groups()
+    microsecond = int((fraction + '00000')[:6]) if fraction else 0
+    result = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond)
+    if sign:
+        offset = timedelta(hours=int(offset_hours), minutes=int(offset_minutes))
+        result = (result - offset) if sign == '+' else (result + offset)
+    return result
+
+def _parse_fallback(value):
+    result = dateparser.parse(value)
+    if result.tzinfo is not None:
+        result = result - result.utcoffset()
+        result = result.replace(tzinfo=None)
+    return result
+
+def _remember(memo, key, value):
+    with _lock:
+        if len(memo) >= MEMO_SIZE:
+            memo.clear()
+        memo[key] = value
@@ -0,0 +1,165 @@
+"""
+Registry for the XML schemas (XSDs) used to validate RSpecs.
+
+Compiling an etree.XMLSchema is expensive and downloading the XSD (and everything it imports) on each request is even more so.
+The registry keeps the compiled schemas in memory (keyed by URL) and loads the files from (in this order):
+- the local schema folders (read-only, e.g. shipped with the AM)
+- the cache folder (filled by earlier downloads or by admin/schema_preload.py)
+- the network (only if downloads are allowed, the file is stored in the cache folder afterwards)
+Imports and includes within the schemas are resolved the same way.
+
+Files are found by their URL: http://www.geni.net/resources/rspec/3/request.xsd is looked up as <folder>/www.geni.net/resources/rspec/3/request.xsd
+"""
+import os, os.path
+import time
+import urllib2
+import urlparse
+import threading
+
+from lxml import etree
+
+import amsoil.core.log
+logger=amsoil.core.log.getLogger('geniv3rpc')
+
+XSD_NAMESPACE = 'http://www.w3.org/2001/XMLSchema'
+
+class SchemaRegistry(object):
+    """Loads, compiles and caches XML schemas. The instances are thread-safe."""
+
+    FAILURE_RETRY_INTERVAL = 300 # seconds until a schema which could not be loaded is tried again
+    DOWNLOAD_TIMEOUT = 10 # seconds
+
+    def __init__(self, local_dirs=[], cache_dir=None, allow_download=True):
+        """{local_dirs} list of folders to look for schema files, {cache_dir} folder to store downloaded schemas (None disables the disk cache)
+        {allow_download} if False, the registry never touches the network."""
+        self._local_dirs = list(local_dirs)
+        self._cache_dir = cache_dir
+        self._allow_download = allow_download
+        self._schemas = {} # url -> [compiled schema, lock for validating]
+        self._failures = {} # url -> time of the last failed attempt
+        self._lock = threading.Lock() # guards the dicts, never held while compiling
+        self._compile_locks = {} # url -> lock held while the schema is compiled
+
+    def get(self, url):
+        """Returns the compiled etree.XMLSchema for the given {url}. Raises IOError or etree.XMLSchemaParseError if the schema could not be loaded."""
+        entry = self._entry(url)
+        return entry[0]
+
+    def validate(self, url, lxml_root):
+        """Validates the {lxml_root} against the schema given by {url}.
+        Returns a tuple (valid, error_log as string). Raises the same exceptions as get()."""
+        schema, lock = self._entry(url)
+        with lock: # the error_log is stored in the schema object, so one validation at a time
+            valid = schema.validate(lxml_root)
+            return valid, (str(schema.error_log) if not valid else '')
+
+    def preload(self, url):
+        """Fetches the given schema and all schemas it imports/includes into the cache folder (regardless of allow_download).
+        Returns the list of URLs which have been stored."""
+        stored = []
+        pending = [url]
+        seen = set()
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            data = self._load(current, force_download=True)
+            stored.append(current)
+            try:
+                doc = etree.fromstring(data, base_url=current)
+            except etree.XMLSyntaxError as e:
+                raise IOError("%s is not well-formed (%s)" % (current, str(e)))
+            for ref in doc.iter('{%s}import' % (XSD_NAMESPACE,), '{%s}include' % (XSD_NAMESPACE,), '{%s}redefine' % (XSD_NAMESPACE,)):
+                location = ref.get('schemaLocation')
+                if location:
+                    pending.append(urlparse.urljoin(current, location))
+        return stored
+
+    def clear(self):
+        """Forgets all compiled schemas and failures (the files on disk are kept)."""
+        with self._lock:
+            self._schemas.clear()
+            self._failures.clear()
+
+    # --- helpers ---
+    def _entry(self, url):
+        entry = self._schemas.get(url)
+        if entry:
+            return entry
+        with self._lock:
+            compile_lock = self._compile_locks.setdefault(url, threading.Lock())
+        with compile_lock: # compile each schema only once, even if many requests arrive at the same time (other schemas are not blocked)
+            entry = self._schemas.get(url)
+            if entry:
+                return entry
+            failed_at = self._failures.get(url)
+            if failed_at and (time.time() - failed_at < self.FAILURE_RETRY_INTERVAL):
+                raise IOError("Loading the schema failed recently, not trying again before %d seconds have passed" % (self.FAILURE_RETRY_INTERVAL,))
+            try:
+                entry = [self._compile(url), threading.Lock()]
+            except Exception:
+                with self._lock:
+                    self._failures[url] = time.time()
+                raise
+            with self._lock:
+                self._schemas[url] = entry
+                self._failures.pop(url, None)
+            return entry
+
+    def _compile(self, url):
+        parser = etree.XMLParser(no_network=True)
+        parser.resolvers.add(_RegistryResolver(self))
+        doc = etree.fromstring(self._load(url), parser, base_url=url)
+        schema = etree.XMLSchema(doc)
+        logger.info("Compiled schema %s", url)
+        return schema
+
+    def _load(self, url, force_download=False):
+        """Returns the contents of the schema file for the given {url}."""
+        relative_path = self._relative_path(url)
+        if relative_path and not force_download:
+            for folder in self._local_dirs + ([self._cache_dir] if self._cache_dir else []):
+                path = os.path.join(folder, relative_path)
+                if os.path.isfile(path):
+                    with open(path, 'rb') as f:
+                        return f.read()
+        if not (self._allow_download or force_download):
+            raise IOError("Schema %s not found in the local schema folders and downloads are disabled" % (url,))
+        logger.info("Downloading schema %s", url)
+        data = urllib2.urlopen(url, timeout=self.DOWNLOAD_TIMEOUT).read()
+        if relative_path and self._cache_dir:
+            self._store(os.path.join(self._cache_dir, relative_path), data)
+        return data
+
+    def _store(self, path, data):
+        try:
+            folder = os.path.dirname(path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            tmp_path = "%s.%d.tmp" % (path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path) # atomic, so other processes never read half a file
+        except (IOError, OSError) as e:
+            logger.warning("Could not write schema cache file %s (%s)", path, str(e))
+
+    @staticmethod
+    def _relative_path(url):
+        """Maps the {url} to a relative file path (host/path). Returns None if the URL can not be mapped safely."""
+        parts = urlparse.urlsplit(url)
+        segments = [parts.netloc] + parts.path.split('/')
+        segments = [s for s in segments if s not in ('', '.')]
+        if (not parts.netloc) or ('..' in segments):
+            return None
+        return os.path.join(*segments)
+
+
+class _RegistryResolver(etree.Resolver):
+    """Serves the xs:import and xs:include files of a schema through the registry (disk first)."""
+    def __init__(self, registry):
+        super(_RegistryResolver, self).__init__()
+        self._registry = registry
+
+    def resolve(self, url, pubid, context):
+        return self.resolve_string(self._registry._load(url), context, base_url=url)
@@ -0,0 +1,65 @@
+"""
+Deduplication of concurrent identical calls (single-flight).
+
+When many clients poll the same read-only method at once (e.g. ListResources or Status of a slice), each call would check the credentials,
+query the database and build the RSpec again. With SingleFlight, the first call (the leader) does the work and all identical calls arriving
+while it is running wait for it and get the very same result.
+
+Whether calls are identical is decided by the key passed to do(). The GENIv3Handler includes the method name, the client certificate,
+the credentials and the options, so a result is only ever shared between calls which would have passed (or failed) the same authorization.
+Calls arriving after the leader finished start a new computation, results are not cached.
+"""
+import sys
+import threading
+
+def freeze(value):
+    """Converts {value} (as received via XML-RPC: dicts, lists, strings, numbers, ...) to a hashable value. Dicts are ordered by key, so the order of struct members does not matter."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class _Call(object):
+    """Internal. A computation in progress."""
+    __slots__ = ('done', 'result', 'exc_info')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class SingleFlight(object):
+    """Runs at most one computation per key at a time and hands its result to all callers with the same key. The instances are thread-safe."""
+
+    def __init__(self):
+        self._calls = {} # key -> _Call
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """Returns func(*args). If a call with the same {key} is already running, its result is returned instead (or its exception is raised).
+        Please note that all callers get the same result object, so it must not be modified afterwards."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.exc_info:
+                raise call.exc_info[0], call.exc_info[1], call.exc_info[2]
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
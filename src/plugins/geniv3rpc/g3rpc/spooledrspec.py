@@ -0,0 +1,46 @@
+"""
+RSpecs which are kept in a temporary file instead of one string (see GENIv3DelegateBase.lxml_ad_stream).
+
+Large advertisements and manifests are written to the file while they are serialized and read back in chunks when they are compressed
+(see compression.CompressionCache) or sent to the client (the XML-RPC marshaller of the flaskrpcs plugin picks up objects with iterchunks),
+so they are never held in memory as a whole. Small ones stay in memory (up to SPOOL_SIZE bytes, see tempfile.SpooledTemporaryFile).
+"""
+import tempfile
+import threading
+
+SPOOL_SIZE = 1024 * 1024 # bytes kept in memory before the RSpec is moved to the file
+READ_SIZE = 64 * 1024 # bytes per chunk when reading back
+
+class SpooledRSpec(object):
+    """An RSpec (byte string) in a temporary file. The instances can be read by several threads at once, the file is deleted with the instance."""
+
+    def __init__(self, chunks):
+        """Writes the strings of the iterable {chunks} (e.g. GENIv3DelegateBase.lxml_stream_chunks) to the file."""
+        self._file = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+        self._size = 0
+        self._lock = threading.Lock()
+        for chunk in chunks:
+            self._file.write(chunk)
+            self._size += len(chunk)
+
+    def __len__(self):
+        return self._size
+
+    def iterchunks(self, size=READ_SIZE):
+        """Generator over the content in chunks of at most {size} bytes."""
+        offset = 0
+        while offset < self._size:
+            with self._lock: # the position of the file is shared by all readers
+                self._file.seek(offset)
+                chunk = self._file.read(min(size, self._size - offset))
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
+
+    def __str__(self):
+        """Returns the whole content (in memory, please prefer iterchunks)."""
+        return ''.join(self.iterchunks())
+
+    def __repr__(self):
+        return "<SpooledRSpec of %d bytes>" % (self._size,)
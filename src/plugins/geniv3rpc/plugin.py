@@ -6,12 +6,19 @@ def setup():
     # setup config keys
     config = pm.getService("config")
     config.install("geniv3rpc.cert_root", "deploy/trusted", "Folder which includes trusted clearinghouse certificates for GENI API v3 (in .pem format). If relative path, the root is assumed to be git repo root.")
-    config.install("geniv3rpc.rspec_validation", True, "Determines if RSpec shall be validated by the given xs:schemaLocations in the document (may cause downloads of the given schema from the given URL per request).")
+    config.install("geniv3rpc.rspec_validation", True, "Determines if RSpec shall be validated by the given xs:schemaLocations in the document. The compiled schemas are kept in memory (see the schema_* keys).")
+    config.install("geniv3rpc.schema_dir", "deploy/schemas", "Folder with local copies of XML schemas (laid out as <host>/<path>, e.g. www.geni.net/resources/rspec/3/request.xsd). If relative path, the root is assumed to be git repo root.")
+    config.install("geniv3rpc.schema_cache_dir", "deploy/schemas.cache", "Folder where downloaded XML schemas are stored (see admin/schema_preload.py). If relative path, the root is assumed to be git repo root.")
+    config.install("geniv3rpc.schema_download", True, "Determines if XML schemas which are neither in the schema_dir nor in the schema_cache_dir may be downloaded (once per process).")
+    config.install("geniv3rpc.compress_level", 6, "zlib compression level (1 fastest - 9 smallest) for RSpecs requested with geni_compress.")
+    config.install("geniv3rpc.compress_cache_size", 16, "Number of compressed RSpecs kept in memory (keyed by content), so unchanged advertisements and manifests are only compressed once. 0 disables the cache.")
+    config.install("geniv3rpc.single_flight", True, "Determines if concurrent identical read-only calls (ListResources, Describe, Status with the same certificate, credentials and options) share one computation.")
     
     # register xmlrpc endpoint
     xmlrpc = pm.getService('xmlrpc')
     geni_handler = GENIv3Handler()
     pm.registerService('geniv3handler', geni_handler)
+    pm.registerService('geniv3reload', geni_handler._reload) # re-reads the config and the delegate's capabilities (not exposed via XML-RPC)
     pm.registerService('geniv3delegatebase', GENIv3DelegateBase)
     pm.registerService('geniv3exceptions', geni_exceptions)
     xmlrpc.registerXMLRPC('geni3', geni_handler, '/RPC2') # name, handlerObj, endpoint
@@ -1,4 +1,5 @@
 import amsoil.core.pluginmanager as pm
+from amsoil.core import trace
 import amsoil.core.log
 logger=amsoil.core.log.getLogger('ons_comms')
 
@@ -6,24 +7,71 @@ ons_ex = pm.getService('opennaas_exceptions')
 config = pm.getService("config")
 
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError: # requests < 2.4 (connection errors are still retried, see __create_session)
+    Retry = None
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 """
 OpenNaas Commands Manager.
 """
+XCONN_FIELDS = ('instanceID', 'srcEndPointId', 'srcLabelId', 'dstEndPointId', 'dstLabelId')
+
+def parse_xml(xml_data):
+    """Returns the root element of the given XML answer of the controller or None (logged) if it is not well-formed.
+    The answers are decoded by requests (unicode), but the parser only accepts byte strings if they contain non-ASCII characters."""
+    try:
+        if isinstance(xml_data, unicode):
+            xml_data = xml_data.encode('utf-8')
+        return ET.fromstring(xml_data)
+
+    except (ET.ParseError, SyntaxError) as e:
+        logger.error("XML ParseError: %s" % (str(e),))
+        return None
+
 class CommandsManager(object):
     """ Resource commands """
 
     def __init__(self, host, port):
         self._base_url = 'http://' + host + ':' + port + '/opennaas/'
         self._auth = (config.get("opennaas.user"), config.get("opennaas.password"))
+        self._timeout = (config.get("opennaas.http_connect_timeout"), config.get("opennaas.http_read_timeout"))
+        self._session = self.__create_session()
+        self._concurrency = max(1, config.get("opennaas.fetch_concurrency"))
+        self._pool = None # created on first use, see map
+        self._pool_lock = threading.Lock()
+
+    def __create_session(self):
+        """The session keeps up to opennaas.http_pool_size connections to the controller alive, so they are reused by subsequent calls."""
+        retries_ = config.get("opennaas.http_retries")
+        if Retry is not None:
+            # idempotent requests (GET, DELETE) are retried on errors, all requests if the connection could not be established
+            retries_ = Retry(total=retries_, backoff_factor=config.get("opennaas.http_retry_backoff"),
+                             status_forcelist=[502, 503, 504])
+
+        adapter_ = HTTPAdapter(pool_connections=1, pool_maxsize=config.get("opennaas.http_pool_size"),
+                               max_retries=retries_)
+        session_ = requests.Session()
+        session_.auth = self._auth
+        session_.mount('http://', adapter_)
+        session_.mount('https://', adapter_)
+        return session_
 
     def post(self, url, xml_data):
         try:
-            logger.debug("POST url=%s, data=%s" % (url, xml_data,))
-            resp_ = requests.post(url=url, headers={'Content-Type': 'application/xml'},
-                                  auth=self._auth, data=xml_data).text
-            logger.debug("POST resp=%s" % (resp_,))
+            logger.debug("POST url=%s, data=%s", url, xml_data)
+            with trace.span('opennaas.http', method='POST', url=url):
+                resp_ = self._session.post(url=url, headers={'Content-Type': 'application/xml'},
+                                           data=xml_data, timeout=self._timeout).text
+            logger.debug("POST resp=%s", resp_)
             return resp_
 
         except requests.exceptions.RequestException as e:
@@ -31,32 +79,64 @@ class CommandsManager(object):
 
     def get(self, url):
         try:
-            logger.debug("GET url=%s" % (url,))
-            resp_ = requests.get(url=url, auth=self._auth).text
-            logger.debug("GET resp=%s" % (resp_,))
+            logger.debug("GET url=%s", url)
+            with trace.span('opennaas.http', method='GET', url=url):
+                resp_ = self._session.get(url=url, timeout=self._timeout).text
+            logger.debug("GET resp=%s", resp_)
             return resp_
 
         except requests.exceptions.RequestException as e:
             raise ons_ex.ONSException(str(e))
 
+    def get_conditional(self, url, etag=None):
+        """Same as get, but sends If-None-Match: {etag} (if given).
+        Returns (response text, etag of the response or None) or (None, {etag}) if the resource has not been modified."""
+        try:
+            logger.debug("GET url=%s, etag=%s", url, etag)
+            with trace.span('opennaas.http', method='GET', url=url):
+                resp_ = self._session.get(url=url, timeout=self._timeout,
+                                          headers={'If-None-Match': etag} if etag else None)
+            if etag and resp_.status_code == 304:
+                logger.debug("GET not modified")
+                return (None, etag)
+
+            logger.debug("GET resp=%s", resp_.text)
+            return (resp_.text, resp_.headers.get('ETag'))
+
+        except requests.exceptions.RequestException as e:
+            raise ons_ex.ONSException(str(e))
+
     def delete(self, url):
         try:
-            logger.debug("DELETE url=%s" % (url,))
-            resp_ = requests.delete(url=url, auth=self._auth).text
-            logger.debug("DELETE resp=%s" % (resp_,))
+            logger.debug("DELETE url=%s", url)
+            with trace.span('opennaas.http', method='DELETE', url=url):
+                resp_ = self._session.delete(url=url, timeout=self._timeout).text
+            logger.debug("DELETE resp=%s", resp_)
             return resp_
 
         except requests.exceptions.RequestException as e:
             raise ons_ex.ONSException(str(e))
 
-    def decode_xml_entry(self, xml_data):
-        try:
-            return [e.text.strip() for e in ET.fromstring(xml_data).findall('entry')]
+    def map(self, func, args_list):
+        """Calls func(*args) for each tuple in {args_list} and returns the results in the same order.
+        Up to opennaas.fetch_concurrency calls are run in parallel (the limit applies to this controller as a whole).
+        If a call raises an exception, it is raised here (after the other calls have finished)."""
+        if (self._concurrency == 1) or (len(args_list) < 2):
+            return [func(*args) for args in args_list]
+
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self._concurrency)
+
+        return self._pool.map(lambda args: func(*args), args_list)
 
-        except ET.ParseError as e:
-            logger.error("XML ParseError: %s" % (str(e),))
+    def decode_xml_entry(self, xml_data):
+        root_ = parse_xml(xml_data)
+        if root_ is None:
             return []
 
+        return [(e.text or '').strip() for e in root_.iterfind('entry')]
+
     def resource_create(self):
         try:
             descr = open('/home/ofelia-cf/opennaas-1/utils/examples/descriptors/roadm.descriptor', 'r')
@@ -64,7 +144,7 @@ class CommandsManager(object):
 
             command = 'resources/create'
             r = self.post(self._base_url + command, data)
-            logger.debug("CM: response=%s" % str(r))
+            logger.debug("CM: response=%s", r)
 
         except Exception as e:
             logger.error("CM: error=%s" % str(e))
@@ -72,39 +152,64 @@ class CommandsManager(object):
     def getResources(self):
         ret_ = []
         command = 'resources/getResourceTypes'
-        ts_ = self.get(self._base_url + command)
-        for t in self.decode_xml_entry(ts_):
-            command = 'resources/listResourcesByType/' + t
-            ns_ = self.get(self._base_url + command)
-            ret_.extend([(t, n) for n in self.decode_xml_entry(ns_)])
+        ts_ = self.decode_xml_entry(self.get(self._base_url + command))
+        ns_ = self.map(self.get, [(self._base_url + 'resources/listResourcesByType/' + t,) for t in ts_])
+        for t, n_xml in zip(ts_, ns_):
+            ret_.extend([(t, n) for n in self.decode_xml_entry(n_xml)])
 
         return ret_
 
 class RoadmCM(CommandsManager):
-    """ Roadm specific commands """
+    """ Roadm specific commands
+    The endpoints and labels of the ROADMs (topology) rarely change, so they are cached for opennaas.topology_ttl seconds.
+    When an entry expires, it is requested again with the ETag of the cached answer (if the controller sent one),
+    so an unchanged topology costs a 304 response at most. refresh_topology drops cached entries.
+    """
 
     def __init__(self, host, port):
         super(RoadmCM, self).__init__(host, port)
+        self._topology_ttl = config.get("opennaas.topology_ttl")
+        self._topology = {} # url -> (expiry time, decoded entries, etag)
+        self._topology_lock = threading.Lock()
+
+    def __get_topology(self, url):
+        if not self._topology_ttl:
+            return self.decode_xml_entry(self.get(url))
+
+        with self._topology_lock:
+            cached_ = self._topology.get(url)
+        if cached_ and cached_[0] > time.time():
+            return cached_[1]
+
+        xml_, etag_ = self.get_conditional(url, cached_[2] if cached_ else None)
+        entries_ = self.decode_xml_entry(xml_) if xml_ is not None else cached_[1]
+        with self._topology_lock:
+            self._topology[url] = (time.time() + self._topology_ttl, entries_, etag_)
+        return entries_
+
+    def refresh_topology(self, r_type=None, r_name=None):
+        """Drops the cached endpoints and labels of the given ROADM (all ROADMs if not given)."""
+        prefix_ = self._base_url + ((r_type + '/' + r_name + '/') if r_type else '')
+        with self._topology_lock:
+            for url in [u for u in self._topology if u.startswith(prefix_)]:
+                del self._topology[url]
 
     def decode_xml_conn(self, xml_data):
-        try:
-            return (ET.fromstring(xml_data).find('instanceID').text,
-                    ET.fromstring(xml_data).find('srcEndPointId').text,
-                    ET.fromstring(xml_data).find('srcLabelId').text,
-                    ET.fromstring(xml_data).find('dstEndPointId').text,
-                    ET.fromstring(xml_data).find('dstLabelId').text)
-
-        except ET.ParseError as e:
-            logger.error("XML ParseError: %s" % (str(e),))
+        root_ = parse_xml(xml_data)
+        if root_ is None:
+            return None
+
+        conn_ = tuple(root_.findtext(f) for f in XCONN_FIELDS)
+        if None in conn_:
+            logger.error("XML xConnection incomplete: %s" % (xml_data,))
             return None
 
+        return conn_
+
     def encode_xml_conn(self, x_id, src_ep, src_label, dst_ep, dst_label):
         root = ET.Element('xConnection')
-        ET.SubElement(root, 'instanceID').text = x_id
-        ET.SubElement(root, 'srcEndPointId').text = src_ep
-        ET.SubElement(root, 'srcLabelId').text = src_label
-        ET.SubElement(root, 'dstEndPointId').text = dst_ep
-        ET.SubElement(root, 'dstLabelId').text = dst_label
+        for field, value in zip(XCONN_FIELDS, (x_id, src_ep, src_label, dst_ep, dst_label)):
+            ET.SubElement(root, field).text = value
 
         return ET.tostring(root)
 
@@ -135,13 +240,11 @@ class RoadmCM(CommandsManager):
 
     def getEndPoints(self, r_type, r_name):
         command = r_type + '/' + r_name + '/xconnect/getEndPoints'
-        eps_ = self.get(self._base_url + command)
-        return self.decode_xml_entry(eps_)
+        return self.__get_topology(self._base_url + command)
 
     def getLabels(self, r_type, r_name, ep_id):
         command = r_type + '/' + r_name + '/xconnect/getLabels/' + ep_id
-        ls_ = self.get(self._base_url + command)
-        return self.decode_xml_entry(ls_)
+        return self.__get_topology(self._base_url + command)
 
     def execute(self, r_type, r_name):
         command = r_type + '/' + r_name + '/queue/execute'
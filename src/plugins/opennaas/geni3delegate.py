@@ -23,9 +23,11 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
     def enter_method_log(f):
         as_ = f.func_code.co_varnames[:f.func_code.co_argcount]
+        def format_args(args, kwargs):
+            return ', '.join('%s=%r' % e for e in zip(as_, args) + kwargs.items())
         def wrapper(*args, **kwargs):
-            ass_ = ', '.join('%s=%r' % e for e in zip(as_, args) + kwargs.items())
-            logger.debug("Calling %s with args=%s" % (f.func_name, ass_,))
+            # the arguments (RSpecs, credentials) are only formatted if debug logging is enabled
+            logger.debug("Calling %s with args=%s", f.func_name, amsoil.core.log.lazy(format_args, args, kwargs))
             return f(*args, **kwargs)
         return wrapper
 
@@ -44,62 +46,64 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
     def get_allocation_mode(self):
         return 'geni_many'
 
+    def get_advertisement_generation(self):
+        return self._resource_manager.get_resources_generation()
+
     @enter_method_log
     def list_resources(self, client_cert, credentials, geni_available):
         self.__authenticate(client_cert, credentials, None, ('listslices',))
+        return self.cached_advertisement(geni_available,
+                                         lambda: self.__build_advertisement(geni_available))
 
-        rn_ = self.lxml_ad_root()
+    def __build_advertisement(self, geni_available):
+        # the elements are created (and serialized to a temporary file) one by one while the resources are read from the database
         em_ = self.lxml_ad_element_maker(self.NAMESPACE_PREFIX)
+        with self._resource_manager.iter_resources() as rs_:
+            return self.lxml_ad_stream(self.__format_ad_resource(em_, r)
+                                       for r in rs_ if (not geni_available) or r.available())
+
+    def __format_ad_resource(self, em_, r):
+        res_ = em_.resource()
+        if r.type == 'roadm':
+            (name, endpoint, label) = ons_models.decode_roadm_urn(r.urn)
+            res_.append(em_.name(name))
+            res_.append(em_.type(r.type))
+            res_.append(em_.endpoint(endpoint))
+            res_.append(em_.label(label))
+        else:
+            res_.append(em_.name(r.urn))
+            res_.append(em_.type(r.type))
 
-        for r in self._resource_manager.get_resources():
-            if geni_available and not r.available(): continue
-
-            res_ = em_.resource()
-            if r.type == 'roadm':
-                (name, endpoint, label) = ons_models.decode_roadm_urn(r.urn)
-                res_.append(em_.name(name))
-                res_.append(em_.type(r.type))
-                res_.append(em_.endpoint(endpoint))
-                res_.append(em_.label(label))
-            else:
-                res_.append(em_.name(r.urn))
-                res_.append(em_.type(r.type))
-
-            res_.append(em_.available('True' if r.available() else 'False'))
-
-            rn_.append(res_)
-
-        return self.lxml_to_string(rn_)
+        res_.append(em_.available('True' if r.available() else 'False'))
+        return res_
 
     def describe(self, urns, client_cert, credentials):
         return self.status(urns, client_cert, credentials)[0]
 
     @enter_method_log
     def status(self, urns, client_cert, credentials):
-        rs_ = []
         for u_ in urns:
-            self.__authenticate(client_cert, credentials, u_, ('sliverstatus',))
-
             if self.urn_type(u_) != 'slice':
                 raise geni_ex.GENIv3OperationUnsupportedError('Only slice URNs can be given to this aggregate')
 
-            rs_slice_ = self._resource_manager.get_slice_resources(slice_name=u_)
-            rs_.extend(rs_slice_)
+        # one authorization and one query for all the slices
+        self.__authenticate_urns(client_cert, credentials, urns, ('sliverstatus',))
+        rs_ = self._resource_manager.get_slices_resources(slice_names=list(urns))
 
         if not len(rs_):
             raise geni_ex.GENIv3SearchFailedError("There are no resources in the given slice(s)")
 
-        logger.debug("Resources=%s" % (rs_,))
+        logger.debug("Resources=%s", rs_)
 
         slivers_ = [self.__format_sliver_status(r, True, True, r.error) for r in rs_]
-        slice_urn_ = self.lxml_to_string(self.__format_manifest_rspec(rs_))
+        slice_urn_ = self.__format_manifest_rspec(rs_)
         return (slice_urn_, slivers_)
 
     @enter_method_log
     def allocate(self, slice_urn, client_cert, credentials, rspec, end_time=None):
         c_urn_, c_uuid_, c_email_ = self.__authenticate(client_cert, credentials, slice_urn, ('createsliver',))
 
-        logger.debug("client_urn=%s, client_uuid=%s, client_email=%s" % (str(c_urn_), str(c_uuid_), str(c_email_),))
+        logger.debug("client_urn=%s, client_uuid=%s, client_email=%s", c_urn_, c_uuid_, c_email_)
 
         resources_ = []
         for em in self.lxml_parse_rspec(rspec).getchildren():
@@ -114,7 +118,7 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
         rs_ = []
         try:
-            logger.debug("Resources=%s" % str(resources_))
+            logger.debug("Resources=%s", resources_)
             rs_ = self._resource_manager.reserve_resources(resources=resources_,
                                                            slice_name=slice_urn,
                                                            end_time=end_time,
@@ -133,10 +137,10 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
             logger.error(str(e))
             raise geni_ex.GENIv3GeneralError(str(e))
 
-        logger.debug("Reserved=%s" % str(rs_))
+        logger.debug("Reserved=%s", rs_)
 
         slivers_ = [self.__format_sliver_status(r, True, True, r.error) for r in rs_]
-        slice_urn_ = self.lxml_to_string(self.__format_manifest_rspec(rs_))
+        slice_urn_ = self.__format_manifest_rspec(rs_)
         return (slice_urn_, slivers_)
 
     @enter_method_log
@@ -148,7 +152,7 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
         rs_ = []
         try:
-            logger.debug("Best=%s, Slices=%s, Slivers=%s" % (best_effort, slices_, slivers_,))
+            logger.debug("Best=%s, Slices=%s, Slivers=%s", best_effort, slices_, slivers_)
             if best_effort == False:
                 # all included slivers to be renewed or none
                 rs_ = self._resource_manager.renew_resources(slices=slices_,
@@ -188,7 +192,7 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
         rs_ = []
         try:
-            logger.debug("Best=%s, Action=%s, Slices=%s, Slivers=%s" % (best_effort, action, slices_, slivers_,))
+            logger.debug("Best=%s, Action=%s, Slices=%s, Slivers=%s", best_effort, action, slices_, slivers_)
             if best_effort == False and action == 'geni_start':
                 rs_ = self._resource_manager.start_slices(slices=slices_)
 
@@ -223,7 +227,7 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
         rs_ = []
         try:
-            logger.debug("Best=%s, Slices=%s, Slivers=%s" % (best_effort, slices_, slivers_,))
+            logger.debug("Best=%s, Slices=%s, Slivers=%s", best_effort, slices_, slivers_)
             if best_effort == False: # all included slivers to be removed or none
                 rs_ = self._resource_manager.delete_slices(slices=slices_)
 
@@ -255,6 +259,13 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
 
         return user_urn, user_uuid, user_mail
 
+    def __authenticate_urns(self, client_cert, credentials, urns, privileges=()):
+        user_urn, user_uuid, user_mail = None, None, None
+        if config.get('opennaas.check_credentials') and len(urns):
+            user_urn, user_uuid, user_mail = self.auth_urns(client_cert, credentials, urns, privileges)
+
+        return user_urn, user_uuid, user_mail
+
     def __convert_allocation_2geni(self, state):
         if state == ons_models.ALLOCATION.FREE:
             return self.ALLOCATION_STATE_UNALLOCATED
@@ -292,46 +303,49 @@ class OpenNaasGENI3Delegate(GENIv3DelegateBase):
         return status_
 
     def __format_manifest_rspec(self, resources):
-        manifest_ = self.lxml_manifest_root()
         em_ = self.lxml_manifest_element_maker(self.NAMESPACE_PREFIX)
+        return self.lxml_manifest_stream(self.__format_manifest_resource(em_, r) for r in resources)
 
-        for resource in resources:
-            r = em_.resource()
-            r.append(em_.type(resource.type))
-            r.append(em_.slice(resource.slice_urn))
-            r.append(em_.name(resource.urn))
-            r.append(em_.available('True' if resource.available() else 'False'))
-            r.append(em_.end(str(resource.end_time)))
-
-            if (resource.type == 'roadm') and 'roadm' in resource.details:
-                r.append(em_.client(resource.details['roadm'].client))
-                r.append(em_.client_mail(resource.details['roadm'].client_mail))
-                r.append(em_.client_id(resource.details['roadm'].client_id))
+    def __format_manifest_resource(self, em_, resource):
+        r = em_.resource()
+        r.append(em_.type(resource.type))
+        r.append(em_.slice(resource.slice_urn))
+        r.append(em_.name(resource.urn))
+        r.append(em_.available('True' if resource.available() else 'False'))
+        r.append(em_.end(self.datetime_to_rfc3339(resource.end_time) if resource.end_time else str(resource.end_time)))
 
-                if resource.details['roadm'].connected_in_urn:
-                    r.append(em_.to_ingress(resource.details['roadm'].connected_in_urn))
+        if (resource.type == 'roadm') and 'roadm' in resource.details:
+            r.append(em_.client(resource.details['roadm'].client))
+            r.append(em_.client_mail(resource.details['roadm'].client_mail))
+            r.append(em_.client_id(resource.details['roadm'].client_id))
 
-                if resource.details['roadm'].connected_out_urn:
-                    r.append(em_.to_egress(resource.details['roadm'].connected_out_urn))
+            if resource.details['roadm'].connected_in_urn:
+                r.append(em_.to_ingress(resource.details['roadm'].connected_in_urn))
 
-            manifest_.append(r)
+            if resource.details['roadm'].connected_out_urn:
+                r.append(em_.to_egress(resource.details['roadm'].connected_out_urn))
 
-        return manifest_
+        return r
 
     def __get_slices_slivers_from_urns(self, urns, cert, credentials, slice_op, sliver_op):
-        (slices_, slivers_) = ({}, {})
+        (slice_urns_, sliver_urns_) = ([], [])
         for u_ in urns:
             urn_type_ = self.urn_type(u_)
             if urn_type_ == 'slice':
-                slices_[u_] = self.__authenticate(cert, credentials, u_, (slice_op,))
+                slice_urns_.append(u_)
 
             elif urn_type_ == 'sliver':
-                slivers_[u_] = self.__authenticate(cert, credentials, u_, (sliver_op,))
+                sliver_urns_.append(u_)
 
             else:
                 raise geni_ex.GENIv3OperationUnsupportedError('Bad URN type (%s)' % (urn_type_,))
 
-        return (slices_, slivers_)
+        # the client information is the same for all urns, so it is retrieved once per group
+        slice_client_ = self.__authenticate_urns(cert, credentials, slice_urns_, (slice_op,))
+        sliver_client_ = self.__authenticate_urns(cert, credentials, sliver_urns_, (sliver_op,))
+
+        return (dict((u_, slice_client_) for u_ in slice_urns_),
+                dict((u_, sliver_client_) for u_ in sliver_urns_))
 
     def __verify_resource_tag(self, xml_elem):
         if not self.lxml_elm_has_request_prefix(xml_elem, 'opennaas'):
@@ -1,9 +1,12 @@
 import amsoil.core.pluginmanager as pm
+from amsoil.core import trace
 from datetime import datetime, timedelta
+import sqlite3
+from collections import namedtuple
 
 import sqlalchemy as sqla
 from sqlalchemy import event
-from sqlalchemy.orm import mapper, sessionmaker
+from sqlalchemy.orm import mapper, sessionmaker, aliased
 
 """
 OpenNaas Data Models.
@@ -44,6 +47,7 @@ roadms = sqla.Table('Roadms', meta,
                     sqla.Column('operational', sqla.Integer, default=OPERATIONAL.READY),
                     sqla.Column('audit_time', sqla.DateTime, default=datetime.utcnow),
                     sqla.UniqueConstraint('endpoint', 'label', 'resource_id'),
+                    sqla.Index('ix_roadms_resource', 'resource_id', 'endpoint', 'label'),
                     sqla.ForeignKeyConstraint(['resource_id'], ['Resources.id'],
                                               onupdate="CASCADE", ondelete="CASCADE"),
                    )
@@ -58,12 +62,30 @@ connections = sqla.Table('RoadmsConnections', meta,
                          sqla.Column('client_id', sqla.String, default=''),
                          sqla.Column('client_email', sqla.String, default=''),
                          sqla.Column('audit_time', sqla.DateTime, default=datetime.utcnow),
+                         sqla.Index('ix_connections_end_time', 'end_time'),
+                         sqla.Index('ix_connections_slice_urn', 'slice_urn'),
                          sqla.ForeignKeyConstraint(['ingress'], ['Roadms.id'],
                                                    onupdate="CASCADE", ondelete="CASCADE"),
                          sqla.ForeignKeyConstraint(['egress'], ['Roadms.id'],
                                                    onupdate="CASCADE", ondelete="CASCADE"),
                         )
 
+# counters which are increased whenever the corresponding information changes (shared between the server and the worker process)
+generations = sqla.Table('Generations', meta,
+                         sqla.Column('name', sqla.String, primary_key=True),
+                         sqla.Column('value', sqla.Integer, default=0),
+                        )
+
+RESOURCES_GENERATION = 'resources'
+TOPOLOGY_GENERATION = 'topology' # increased to drop the cached endpoints/labels (see RoadmCM.refresh_topology)
+
+# resources written by the current (not yet completed) sync cycle, see syncengine
+sync_checkpoints = sqla.Table('SyncCheckpoints', meta,
+                              sqla.Column('type', sqla.String, primary_key=True),
+                              sqla.Column('name', sqla.String, primary_key=True),
+                              sqla.Column('synced_time', sqla.DateTime, default=datetime.utcnow),
+                             )
+
 
 class Resources(object):
     def __init__(self, rname, rtype):
@@ -101,6 +123,21 @@ mapper(Resources, resources)
 mapper(Roadms, roadms)
 mapper(RoadmsConns, connections)
 
+# sqlite allows at most 999 variables per statement, so longer IN clauses are split
+IN_CLAUSE_STEP = 500
+
+# INSERT ... ON CONFLICT DO UPDATE is available since sqlite 3.24 (older versions update conflicting rows separately, see RoadmsDBM.__bulk_upsert)
+UPSERT_SUPPORTED = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+# rows seen by the audit get a new audit_time when theirs is older than this (rows not seen for a day are deleted, see audit_terminated)
+AUDIT_REFRESH_INTERVAL = timedelta(hours=12)
+
+# ingress/egress side of a connection as returned by get_slice(s)
+RoadmEnd = namedtuple('RoadmEnd', ['endpoint', 'label', 'allocation', 'operational', 'name', 'type'])
+# connection as returned by get_slice(s), plain columns (loading RoadmsConns objects into the session was the slowest part for large results)
+RoadmConnection = namedtuple('RoadmConnection', ['ingress', 'egress', 'xconn_id', 'slice_urn', 'end_time',
+                                                 'client_name', 'client_id', 'client_email'])
+
 def create_xconn_id(src_ep, src_label, dst_ep, dst_label):
     return src_ep + ':' + src_label + '::' + dst_ep + ':' + dst_label
 
@@ -114,11 +151,21 @@ class RoadmsDBM(object):
     def create_all(self):
         try:
             meta.create_all()
+            self.__create_missing_indexes()
             return (True, None)
 
         except sqla.exc.SQLAlchemyError as e:
             return (False, str(e))
 
+    def __create_missing_indexes(self):
+        """create_all creates the indexes of new tables only, databases of older versions get them here."""
+        inspector_ = sqla.inspect(engine)
+        for table in meta.sorted_tables:
+            existing_ = set(i['name'] for i in inspector_.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in existing_:
+                    index.create(engine)
+
     def open_session(self):
         if self.__s:
             raise self.ons_ex.ONSException('Session already opened!')
@@ -131,6 +178,31 @@ class RoadmsDBM(object):
 
         self.__s = None
 
+    def __bump_generation(self, name=RESOURCES_GENERATION):
+        """Increases the given counter within the current transaction (the caller commits)."""
+        res_ = self.__s.execute(generations.update().where(generations.c.name==name).\
+                                    values(value=generations.c.value + 1))
+        if not res_.rowcount:
+            self.__s.execute(generations.insert().values(name=name, value=1))
+
+    def invalidate_topology(self):
+        try:
+            self.__bump_generation(TOPOLOGY_GENERATION)
+            self.__s.commit()
+
+        except sqla.exc.SQLAlchemyError as e:
+            self.__s.rollback()
+            raise self.ons_ex.ONSException(str(e))
+
+    def get_generation(self, name=RESOURCES_GENERATION):
+        try:
+            ret_ = self.__s.query(generations.c.value).filter(generations.c.name==name).first()
+            return ret_.value if ret_ else 0
+
+        except sqla.exc.SQLAlchemyError as e:
+            raise self.ons_ex.ONSException(str(e))
+
+    @trace.traced('db.check_to_reserve')
     def check_to_reserve(self, resource, roadm):
         try:
             re_ = self.__s.query(Resources).filter(sqla.and_(Resources.name == resource['name'],
@@ -155,6 +227,7 @@ class RoadmsDBM(object):
         except sqla.exc.SQLAlchemyError as e:
             raise self.ons_ex.ONSResourceNotFound(str(e))
 
+    @trace.traced('db.make_connection')
     def make_connection(self, ingress, egress, conn_id, values):
         try:
             stmt_ = connections.insert().values(ingress=ingress, egress=egress, xconn_id=conn_id,
@@ -167,12 +240,14 @@ class RoadmsDBM(object):
                                                    roadms.c.id==egress)).values(allocation=ALLOCATION.ALLOCATED)
             self.__s.execute(stmt_)
 
+            self.__bump_generation()
             self.__s.commit()
 
         except sqla.exc.SQLAlchemyError as e:
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
+    @trace.traced('db.destroy_connection')
     def destroy_connection(self, ingress, egress):
         try:
             self.__s.query(RoadmsConns).filter(sqla.and_(RoadmsConns.ingress==ingress,
@@ -183,12 +258,14 @@ class RoadmsDBM(object):
                         values(allocation=ALLOCATION.FREE, operational=OPERATIONAL.READY)
             self.__s.execute(stmt_)
 
+            self.__bump_generation()
             self.__s.commit()
 
         except sqla.exc.SQLAlchemyError as e:
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
+    @trace.traced('db.oper_connection')
     def oper_connection(self, ingress, egress, op_value):
         try:
             stmt_ = roadms.update().where(sqla.or_(roadms.c.id==ingress,
@@ -202,58 +279,125 @@ class RoadmsDBM(object):
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
+    @trace.traced('db.oper_connections')
+    def oper_connections(self, conns, op_value):
+        """Same as oper_connection for many (ingress, egress) pairs in one transaction."""
+        try:
+            self.__update_many(roadms.c.id, [i for pair in conns for i in pair], operational=op_value)
+
+            self.__s.commit()
+
+        except sqla.exc.SQLAlchemyError as e:
+            self.__s.rollback()
+            raise self.ons_ex.ONSException(str(e))
+
+    @trace.traced('db.destroy_connections')
+    def destroy_connections(self, conns):
+        """Same as destroy_connection for many (ingress, egress) pairs in one transaction."""
+        try:
+            self.__delete_many(connections.c.ingress, [ingress for (ingress, egress) in conns])
+            self.__update_many(roadms.c.id, [i for pair in conns for i in pair],
+                               allocation=ALLOCATION.FREE, operational=OPERATIONAL.READY)
+
+            self.__bump_generation()
+            self.__s.commit()
+
+        except sqla.exc.SQLAlchemyError as e:
+            self.__s.rollback()
+            raise self.ons_ex.ONSException(str(e))
+
+    @trace.traced('db.get_resources')
     def get_resources(self):
+        """All rows at once, please use iter_resources for large inventories (e.g. the advertisement)."""
+        return list(self.iter_resources())
+
+    def iter_resources(self):
+        """Generator over the rows of get_resources, which are fetched from the cursor in batches (opennaas.update_step).
+        The connection of allocated ROADMs is outer joined (as ingress or egress), so this is a single query."""
         try:
+            cin_ = aliased(RoadmsConns)
+            cout_ = aliased(RoadmsConns)
             rall_ = self.__s.query(Resources.name, Resources.type, Roadms.endpoint, Roadms.label,
-                                   Roadms.allocation, Roadms.operational, Roadms.id).\
-                             join(Roadms, Resources.id==Roadms.resource_id).all()
-            ret_ = []
+                                   Roadms.allocation, Roadms.operational,
+                                   cin_.ingress.label('in_ingress'), cin_.slice_urn.label('in_slice_urn'), cin_.end_time.label('in_end_time'),
+                                   cout_.slice_urn.label('out_slice_urn'), cout_.end_time.label('out_end_time')).\
+                             join(Roadms, Resources.id==Roadms.resource_id).\
+                             outerjoin(cin_, cin_.ingress==Roadms.id).\
+                             outerjoin(cout_, cout_.egress==Roadms.id).\
+                             yield_per(config.get("opennaas.update_step"))
             for r_ in rall_:
                 if r_.allocation == ALLOCATION.ALLOCATED:
-                    conn_ = self.__s.query(RoadmsConns).filter(sqla.or_(RoadmsConns.ingress == r_.id,
-                                                                        RoadmsConns.egress == r_.id)).one()
+                    if r_.in_ingress is not None: # the slice_urn of a connection may be NULL (e.g. audit connections)
+                        slice_urn_, end_time_ = r_.in_slice_urn, r_.in_end_time
+                    else:
+                        slice_urn_, end_time_ = r_.out_slice_urn, r_.out_end_time
 
-                    ret_.append((r_.name, r_.endpoint, r_.label, conn_.slice_urn, conn_.end_time,\
-                                 r_.type, r_.allocation, r_.operational))
+                    yield (r_.name, r_.endpoint, r_.label, slice_urn_, end_time_,\
+                           r_.type, r_.allocation, r_.operational)
                 else:
-                    ret_.append((r_.name, r_.endpoint, r_.label, None, None,\
-                                 r_.type, r_.allocation, r_.operational))
-
-            return ret_
+                    yield (r_.name, r_.endpoint, r_.label, None, None,\
+                           r_.type, r_.allocation, r_.operational)
 
         except sqla.exc.SQLAlchemyError as e:
             raise self.ons_ex.ONSException(str(e))
 
+    def __query_connections(self):
+        """Returns a query over the connections joined with both of their ROADMs and resources (see __split_connection)."""
+        rin_, rout_ = aliased(Roadms), aliased(Roadms)
+        resin_, resout_ = aliased(Resources), aliased(Resources)
+        columns_ = [getattr(RoadmsConns, f) for f in RoadmConnection._fields] +\
+                   [rin_.endpoint, rin_.label, rin_.allocation, rin_.operational, resin_.name, resin_.type,
+                    rout_.endpoint, rout_.label, rout_.allocation, rout_.operational, resout_.name, resout_.type]
+        return self.__s.query(*columns_).\
+                        join(rin_, rin_.id==RoadmsConns.ingress).\
+                        join(resin_, resin_.id==rin_.resource_id).\
+                        join(rout_, rout_.id==RoadmsConns.egress).\
+                        join(resout_, resout_.id==rout_.resource_id)
+
+    def __split_connection(self, row):
+        n_ = len(RoadmConnection._fields)
+        return (RoadmEnd(*row[n_:n_+6]), RoadmEnd(*row[n_+6:n_+12]), RoadmConnection(*row[:n_]))
+
+    @trace.traced('db.get_slice')
     def get_slice(self, slice_urn):
         try:
-            rall_ = self.__s.query(RoadmsConns).filter(RoadmsConns.slice_urn == slice_urn).all()
-            ret_ = []
-            for r_ in rall_:
-                r_in_ = self.__s.query(Roadms.endpoint, Roadms.label, Roadms.allocation,
-                                       Roadms.operational, Resources.name, Resources.type).\
-                                 join(Resources, Roadms.resource_id==Resources.id).\
-                                 filter(Roadms.id == r_.ingress).one()
+            rall_ = self.__query_connections().filter(RoadmsConns.slice_urn == slice_urn).all()
+            return [self.__split_connection(r_) for r_ in rall_]
 
-                r_out_ = self.__s.query(Roadms.endpoint, Roadms.label, Roadms.allocation,
-                                        Roadms.operational, Resources.name, Resources.type).\
-                                  join(Resources, Roadms.resource_id==Resources.id).\
-                                  filter(Roadms.id == r_.egress).one()
+        except sqla.exc.SQLAlchemyError as e:
+            raise self.ons_ex.ONSException(str(e))
 
-                ret_.append((r_in_, r_out_, r_))
+    @trace.traced('db.get_slices')
+    def get_slices(self, slice_urns):
+        """Same as get_slice, but for many slices at once (ordered like {slice_urns})."""
+        try:
+            rall_ = []
+            for i in range(0, len(slice_urns), IN_CLAUSE_STEP):
+                rall_.extend(self.__query_connections().\
+                                  filter(RoadmsConns.slice_urn.in_(slice_urns[i:i+IN_CLAUSE_STEP])).all())
 
-            return ret_
+            order_ = dict((u, i) for i, u in enumerate(slice_urns))
+            rall_ = [self.__split_connection(r_) for r_ in rall_]
+            rall_.sort(key=lambda r: order_[r[2].slice_urn])
+            return rall_
 
         except sqla.exc.SQLAlchemyError as e:
             raise self.ons_ex.ONSException(str(e))
 
-    def get_expired_slices(self):
+    @trace.traced('db.get_expired_connections')
+    def get_expired_connections(self):
+        """Same as get_slices, for the slices which have expired (a connection of the slice has passed its end_time).
+        All connections of these slices are returned (as delete_slices releases them), the slices are found using the end_time index.
+        Connections found by the audit (without slice) are not included."""
         try:
-            return self.__s.query(RoadmsConns.slice_urn).\
-                            filter(RoadmsConns.end_time < datetime.utcnow()).all()
+            rall_ = self.__s.query(RoadmsConns.slice_urn).filter(RoadmsConns.end_time < datetime.utcnow()).\
+                                                      filter(RoadmsConns.slice_urn != None).distinct().all()
+            return self.get_slices([r_.slice_urn for r_ in rall_])
 
         except sqla.exc.SQLAlchemyError as e:
             raise self.ons_ex.ONSException(str(e))
 
+    @trace.traced('db.renew_slice')
     def renew_slice(self, slice_urn, end_time, client_info):
         try:
             client, client_id, client_mail = client_info
@@ -268,114 +412,236 @@ class RoadmsDBM(object):
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
-    # audit procedures
-    def __audit_resource(self, rtype, rname):
+    @trace.traced('db.renew_slices')
+    def renew_slices(self, slice_urns, end_time, client_info):
+        """Same as renew_slice, but for many slices (with the same client) in one transaction."""
         try:
-            stmt_ = resources.insert().values(name=rname, type=rtype)
-            self.__s.execute(stmt_)
+            client, client_id, client_mail = client_info
+            for i in range(0, len(slice_urns), IN_CLAUSE_STEP):
+                stmt_ = connections.update().\
+                            where(connections.c.slice_urn.in_(slice_urns[i:i+IN_CLAUSE_STEP])).\
+                            values(end_time=end_time, client_name=client, client_id=client_id,
+                                   client_email=client_mail)
+                self.__s.execute(stmt_)
 
-        except sqla.exc.SQLAlchemyError:
-            stmt_ = resources.update().where(sqla.and_(resources.c.name==rname,
-                                                       resources.c.type==rtype)).\
-                        values(audit_time=datetime.utcnow())
-            self.__s.execute(stmt_)
+            self.__s.commit()
+
+        except sqla.exc.SQLAlchemyError as e:
+            self.__s.rollback()
+            raise self.ons_ex.ONSException(str(e))
 
-    def __audit_roadm(self, rid, ep, label):
+    # audit procedures
+    def __update_many(self, column, ids, **values):
+        """Sets {values} on the rows where {column} (of the column's table) is one of {ids}. Returns the number of updated rows.
+        The statement (one per id) is compiled once and executed for all {ids} with executemany, instead of building and compiling
+        long IN clauses (which took most of the time for large numbers of ids)."""
+        ids = set(ids)
+        if not ids:
+            return 0
+
+        stmt_ = column.table.update().where(column==sqla.bindparam('b_key')).values(**values)
+        return self.__s.execute(stmt_, [{'b_key': i} for i in ids]).rowcount
+
+    def __delete_many(self, column, ids):
+        """Same as __update_many, but deletes the rows."""
+        ids = set(ids)
+        if not ids:
+            return 0
+
+        stmt_ = column.table.delete().where(column==sqla.bindparam('b_key'))
+        return self.__s.execute(stmt_, [{'b_key': i} for i in ids]).rowcount
+
+    def __bulk_upsert(self, table, rows, keys, updates):
+        """Inserts {rows} (dicts with the same columns) into {table} with executemany, in batches of opennaas.update_step.
+        A row which conflicts with an existing one on the unique columns {keys} updates the columns {updates} of the existing row instead
+        (so concurrent inserts, e.g. by make_connection, do not abort the whole transaction). Rows which conflict on other unique
+        columns (e.g. a connection whose ingress is already connected elsewhere) are skipped. Python-side column defaults are not applied.
+        Without UPSERT_SUPPORTED, the conflicting rows are updated by a separate statement (executemany as well)."""
+        if not rows:
+            return
+        cols_ = rows[0].keys()
+        sql_ = 'INSERT OR IGNORE INTO "%s" (%s) VALUES (%s)' % (table.name, ', '.join(cols_), ', '.join(':' + c for c in cols_))
+        if UPSERT_SUPPORTED:
+            sql_ += ' ON CONFLICT (%s) DO UPDATE SET %s' % (', '.join(keys), ', '.join('%s=excluded.%s' % (c, c) for c in updates))
+        stmt_ = sqla.text(sql_, bindparams=[sqla.bindparam(c, type_=table.c[c].type) for c in cols_])
+
+        update_ = None
+        if (not UPSERT_SUPPORTED) and updates:
+            update_ = table.update().where(sqla.and_(*[table.c[k]==sqla.bindparam('b_' + k) for k in keys])).\
+                                     values(**dict((c, sqla.bindparam('b_' + c)) for c in updates))
+
+        step_ = config.get("opennaas.update_step")
+        for i in range(0, len(rows), step_):
+            self.__s.execute(stmt_, rows[i:i+step_])
+            if update_ is not None:
+                self.__s.execute(update_, [dict(('b_' + c, r[c]) for c in tuple(keys) + tuple(updates)) for r in rows[i:i+step_]])
+
+    def __resources_index(self):
+        return dict(((r.type, r.name), (r.id, r.audit_time))
+                    for r in self.__s.execute(sqla.select([resources.c.id, resources.c.type,
+                                                           resources.c.name, resources.c.audit_time])))
+
+    def __roadms_index(self, resource_ids):
+        ret_ = {}
+        resource_ids = list(resource_ids)
+        for i in range(0, len(resource_ids), IN_CLAUSE_STEP):
+            stmt_ = sqla.select([roadms.c.id, roadms.c.resource_id, roadms.c.endpoint, roadms.c.label,
+                                 roadms.c.allocation, roadms.c.audit_time]).\
+                        where(roadms.c.resource_id.in_(resource_ids[i:i+IN_CLAUSE_STEP]))
+            ret_.update(((r.resource_id, r.endpoint, r.label), (r.id, r.allocation, r.audit_time))
+                        for r in self.__s.execute(stmt_))
+        return ret_
+
+    def __connections_index(self, resource_ids):
+        ret_ = {}
+        resource_ids = list(resource_ids)
+        for i in range(0, len(resource_ids), IN_CLAUSE_STEP):
+            stmt_ = sqla.select([connections.c.ingress, connections.c.egress, connections.c.audit_time]).\
+                        select_from(connections.join(roadms, roadms.c.id==connections.c.ingress)).\
+                        where(roadms.c.resource_id.in_(resource_ids[i:i+IN_CLAUSE_STEP]))
+            ret_.update(((c.ingress, c.egress), c.audit_time) for c in self.__s.execute(stmt_))
+        return ret_
+
+    @trace.traced('db.audit_snapshot')
+    def audit_snapshot(self, resources_info, roadms_info, xconns_info, checkpoint=False):
+        """Brings the tables in line with an inventory snapshot of the controller.
+        {resources_info} list of (type, name), {roadms_info} list of (type, name, endpoint, label),
+        {xconns_info} list of (type, name, (xconn_id, src_endpoint, src_label, dst_endpoint, dst_label)).
+        The snapshot may cover only some of the resources (the rows of the other resources are not looked at).
+        If {checkpoint} is True, the resources are recorded as synced in the same transaction (see get_sync_checkpoint).
+        The current rows of the resources are loaded into an index (one query per table) and compared with the snapshot,
+        only new rows are inserted (see __bulk_upsert) and only changed allocations are updated (both in bulk).
+        Rows which are still present get a new audit_time at most every AUDIT_REFRESH_INTERVAL, rows which vanished
+        are deleted by audit_terminated once their audit_time is older than a day.
+        Returns the number of changed rows."""
         try:
-            stmt_ = roadms.insert().values(resource_id=rid,endpoint=ep,label=label)
-            self.__s.execute(stmt_)
+            now_ = datetime.utcnow()
+            refresh_ = now_ - AUDIT_REFRESH_INTERVAL
+            changed_ = 0
+
+            # resources
+            res_idx_ = self.__resources_index()
+            new_ = [{'type': rtype, 'name': rname, 'audit_time': now_} for (rtype, rname) in set(resources_info)
+                    if (rtype, rname) not in res_idx_]
+            if new_:
+                self.__bulk_upsert(resources, new_, ('name', 'type'), ('audit_time',))
+                changed_ += len(new_)
+                res_idx_ = self.__resources_index()
+
+            touch_ = [res_idx_[k][0] for k in set(resources_info) if res_idx_[k][1] < refresh_]
+            self.__update_many(resources.c.id, touch_, audit_time=now_)
+
+            # roadms (endpoint/label pairs)
+            scope_ = [res_idx_[k][0] for k in set(resources_info)]
+            rm_idx_ = self.__roadms_index(scope_)
+            seen_ = set((res_idx_[(rtype, rname)][0], ep, label) for (rtype, rname, ep, label) in roadms_info
+                        if (rtype, rname) in res_idx_)
+            new_ = [{'resource_id': rid, 'endpoint': ep, 'label': label, 'allocation': ALLOCATION.FREE,
+                     'operational': OPERATIONAL.READY, 'audit_time': now_}
+                    for (rid, ep, label) in seen_ if (rid, ep, label) not in rm_idx_]
+            if new_:
+                self.__bulk_upsert(roadms, new_, ('endpoint', 'label', 'resource_id'), ('audit_time',))
+                changed_ += len(new_)
+                rm_idx_ = self.__roadms_index(scope_)
+
+            touch_ = [rm_idx_[k][0] for k in seen_ if rm_idx_[k][2] < refresh_]
+            self.__update_many(roadms.c.id, touch_, audit_time=now_)
+
+            # cross-connections (the roadms of a connection are allocated)
+            conn_idx_ = self.__connections_index(scope_)
+            new_, touch_, allocated_ = [], [], set()
+            for (rtype, rname, xconn) in xconns_info:
+                if (xconn is None) or ((rtype, rname) not in res_idx_):
+                    continue
+                x_id, xsrc_ep, xsrc_label, xdst_ep, xdst_label = xconn
+                rid_ = res_idx_[(rtype, rname)][0]
+                rin_ = rm_idx_.get((rid_, xsrc_ep, xsrc_label))
+                rout_ = rm_idx_.get((rid_, xdst_ep, xdst_label))
+                if (rin_ is None) or (rout_ is None):
+                    continue
 
-        except sqla.exc.SQLAlchemyError:
-            stmt_ = roadms.update().where(sqla.and_(roadms.c.resource_id==rid,
-                                                    roadms.c.endpoint==ep,
-                                                    roadms.c.label==label)).\
-                        values(audit_time=datetime.utcnow())
-            self.__s.execute(stmt_)
+                key_ = (rin_[0], rout_[0])
+                if key_ not in conn_idx_:
+                    new_.append({'ingress': rin_[0], 'egress': rout_[0], 'xconn_id': x_id, 'slice_urn': None,
+                                 'end_time': now_, 'client_name': '', 'client_id': '', 'client_email': '',
+                                 'audit_time': now_})
+                    conn_idx_[key_] = now_
+                elif conn_idx_[key_] < refresh_:
+                    touch_.append(rin_[0])
 
-    def __audit_connection(self, ingr, egr, xid):
-        try:
-            stmt_ = connections.insert().values(ingress=ingr,egress=egr,xconn_id=xid)
-            self.__s.execute(stmt_)
+                allocated_.update(r[0] for r in (rin_, rout_) if r[1] != ALLOCATION.ALLOCATED)
 
-        except sqla.exc.SQLAlchemyError:
-            stmt_ = connections.update().where(sqla.and_(connections.c.ingress==ingr,
-                                                         connections.c.egress==egr)).\
-                        values(audit_time=datetime.utcnow())
-            self.__s.execute(stmt_)
+            self.__bulk_upsert(connections, new_, ('ingress', 'egress'), ('audit_time',))
+            changed_ += len(new_)
 
-        stmt_ = roadms.update().where(sqla.or_(roadms.c.id==ingr,
-                                               roadms.c.id==egr)).\
-                    values(allocation=ALLOCATION.ALLOCATED)
-        self.__s.execute(stmt_)
+            self.__update_many(connections.c.ingress, touch_, audit_time=now_)
+            changed_ += self.__update_many(roadms.c.id, allocated_, allocation=ALLOCATION.ALLOCATED)
 
-    def audit_resources(self, info):
-        try:
-            for (rtype, rname) in info:
-                self.__audit_resource(rtype, rname)
+            if changed_:
+                self.__bump_generation()
+
+            if checkpoint:
+                self.__bulk_upsert(sync_checkpoints,
+                                   [{'type': rtype, 'name': rname, 'synced_time': now_} for (rtype, rname) in set(resources_info)],
+                                   ('type', 'name'), ('synced_time',))
 
             self.__s.commit()
+            return changed_
 
         except sqla.exc.SQLAlchemyError as e:
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
-    def audit_roadms(self, info):
+    def get_sync_checkpoint(self, max_age):
+        """Returns the set of (type, name) of the resources recorded by audit_snapshot within the last {max_age} (timedelta)."""
         try:
-            r_id, r_type, r_name = (None, None, None)
-            for (rtype, rname, ep, label) in info:
-                if rtype != r_type or rname != r_name:
-                    r_id, r_type, r_name = self.__s.query(Resources.id, Resources.type, Resources.name).\
-                                                filter(sqla.and_(Resources.name==rname,
-                                                                 Resources.type==rtype)).one()
-
-                self.__audit_roadm(r_id, ep, label)
-
-            self.__s.commit()
+            stmt_ = sqla.select([sync_checkpoints.c.type, sync_checkpoints.c.name]).\
+                        where(sync_checkpoints.c.synced_time >= datetime.utcnow() - max_age)
+            return set((r.type, r.name) for r in self.__s.execute(stmt_))
 
         except sqla.exc.SQLAlchemyError as e:
-            self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
-    def audit_connections(self, info):
+    def clear_sync_checkpoint(self):
         try:
-            r_id, r_type, r_name = (None, None, None)
-            for (rtype, rname, xconn) in info:
-                x_id, xsrc_ep, xsrc_label, xdst_ep, xdst_label = xconn
-                if rtype != r_type or rname != r_name:
-                    r_id, r_type, r_name = self.__s.query(Resources.id, Resources.type, Resources.name).\
-                                                filter(sqla.and_(Resources.name==rname,
-                                                                 Resources.type==rtype)).one()
-
-                rin = self.__s.query(Roadms.id).filter(sqla.and_(Roadms.resource_id==r_id,
-                                                                 Roadms.endpoint==xsrc_ep,
-                                                                 Roadms.label==xsrc_label)).one()
-                rout = self.__s.query(Roadms.id).filter(sqla.and_(Roadms.resource_id==r_id,
-                                                                  Roadms.endpoint==xdst_ep,
-                                                                  Roadms.label==xdst_label)).one()
-                self.__audit_connection(rin.id, rout.id, x_id)
-
+            self.__s.execute(sync_checkpoints.delete())
             self.__s.commit()
 
         except sqla.exc.SQLAlchemyError as e:
             self.__s.rollback()
             raise self.ons_ex.ONSException(str(e))
 
-    def audit_terminated(self):
+    def audit_terminated(self, excluded=()):
+        """Deletes the rows which have not been seen by the audit for a day and frees the roadms left in transition.
+        The rows of the resources {excluded} (list of (type, name), e.g. the resources a sync cycle could not fetch) are kept,
+        so the ids of the rows are selected first and filtered here (see __delete_many)."""
         try:
             old_time = datetime.utcnow() - timedelta(days=1)
-
-            stmt_ = resources.delete(resources.c.audit_time < old_time)
-            self.__s.execute(stmt_)
-
-            stmt_ = roadms.delete(roadms.c.audit_time < old_time)
-            self.__s.execute(stmt_)
-
-            stmt_ = connections.delete(connections.c.audit_time < old_time)
-            self.__s.execute(stmt_)
-
-            stmt_ = roadms.update().where(roadms.c.allocation==ALLOCATION.AUDIT_TRANS).\
-                        values(allocation=ALLOCATION.FREE)
-            self.__s.execute(stmt_)
+            excluded = set(tuple(k) for k in excluded)
+
+            changed_ = 0
+            stmt_ = sqla.select([resources.c.id, resources.c.type, resources.c.name]).where(resources.c.audit_time < old_time)
+            changed_ += self.__delete_many(resources.c.id, [r.id for r in self.__s.execute(stmt_).fetchall()
+                                                            if (r.type, r.name) not in excluded])
+
+            excluded_ids_ = set(v[0] for (k, v) in self.__resources_index().items() if k in excluded)
+            stmt_ = sqla.select([roadms.c.id, roadms.c.resource_id]).where(roadms.c.audit_time < old_time)
+            changed_ += self.__delete_many(roadms.c.id, [r.id for r in self.__s.execute(stmt_).fetchall()
+                                                         if r.resource_id not in excluded_ids_])
+
+            stmt_ = sqla.select([connections.c.ingress, roadms.c.resource_id]).\
+                        select_from(connections.join(roadms, roadms.c.id==connections.c.ingress)).\
+                        where(connections.c.audit_time < old_time)
+            changed_ += self.__delete_many(connections.c.ingress, [c.ingress for c in self.__s.execute(stmt_).fetchall()
+                                                                   if c.resource_id not in excluded_ids_])
+
+            stmt_ = sqla.select([roadms.c.id, roadms.c.resource_id]).where(roadms.c.allocation==ALLOCATION.AUDIT_TRANS)
+            changed_ += self.__update_many(roadms.c.id, [r.id for r in self.__s.execute(stmt_).fetchall()
+                                                         if r.resource_id not in excluded_ids_],
+                                           allocation=ALLOCATION.FREE)
+
+            if changed_:
+                self.__bump_generation()
 
             self.__s.commit()
 
@@ -15,8 +15,17 @@ def setup():
     config.install("opennaas.server_port", 8888, "OpenNaas server port")
     config.install("opennaas.user", "admin", "OpenNaas user")
     config.install("opennaas.password", "123456", "OpenNaas password")
-    config.install("opennaas.update_timeout", 5, "Update resources timeout (secs)")
-    config.install("opennaas.update_step", 100, "Update resources step")
+    config.install("opennaas.http_pool_size", 10, "Number of (keep-alive) HTTP connections to the OpenNaas server kept open for reuse")
+    config.install("opennaas.http_connect_timeout", 5, "Timeout for connecting to the OpenNaas server (secs)")
+    config.install("opennaas.http_read_timeout", 60, "Timeout for a response of the OpenNaas server (secs)")
+    config.install("opennaas.http_retries", 3, "Retries of failed requests to the OpenNaas server (only connection errors and idempotent requests)")
+    config.install("opennaas.http_retry_backoff", 0.5, "Backoff factor between retries (secs, doubled with each retry)")
+    config.install("opennaas.fetch_concurrency", 8, "Number of parallel requests to the OpenNaas server when fetching the inventory (should not exceed opennaas.http_pool_size)")
+    config.install("opennaas.topology_ttl", 3600, "Endpoints and labels of the OpenNaas resources are cached for this time (secs), afterwards they are revalidated (ETag). 0 disables the cache")
+    config.install("opennaas.update_timeout", 5, "Update resources timeout (secs between the end of a sync cycle and the start of the next one)")
+    config.install("opennaas.update_step", 100, "Update resources step (rows written per transaction by the sync engine, rows fetched per batch from the database)")
+    config.install("opennaas.sync_queue_size", 4, "Resources buffered between the stages of the sync engine (the controller is not queried further ahead)")
+    config.install("opennaas.sync_checkpoint_age", 3600, "An interrupted sync cycle is resumed (skipping the resources already written) if it was interrupted within this time (secs)")
     config.install("opennaas.check_expire_timeout", 60, "Check resources expiration timeout (secs)")
     config.install("opennaas.check_credentials", False, "Check credentials for incoming requests")
 
@@ -27,8 +36,8 @@ def setup():
     pm.registerService('opennaas_models', ons_models_package)
     import commandsmanager as ons_commands_mngr_package
     pm.registerService('opennaas_commands', ons_commands_mngr_package)
-    import fsmmanager as ons_fsm_mngr_package
-    pm.registerService('opennaas_fsm', ons_fsm_mngr_package)
+    import syncengine as ons_sync_engine_package
+    pm.registerService('opennaas_sync', ons_sync_engine_package)
     from resourcemanager import RMRoadmManager
     pm.registerService('opennaas_resourcemanager', RMRoadmManager())
 
@@ -3,15 +3,17 @@ import amsoil.core.log
 logger=amsoil.core.log.getLogger('ons_rm')
 
 from amsoil.core import serviceinterface
+from amsoil.core import trace
 
 ons_ex = pm.getService('opennaas_exceptions')
 ons_models = pm.getService('opennaas_models')
-ons_fsm = pm.getService('opennaas_fsm')
+ons_sync = pm.getService('opennaas_sync')
 config = pm.getService("config")
 worker = pm.getService('worker')
 ons_comms = pm.getService('opennaas_commands')
 
 from abc import ABCMeta, abstractmethod
+from contextlib import contextmanager
 import datetime as dt
 
 """
@@ -49,6 +51,21 @@ class RMInterface(object):
         """
         pass
 
+    @abstractmethod
+    def get_slices_resources(self, slice_names):
+        """ Get all managed resources of many slices at once
+        :param slice_names: list of slice names
+        :return: list of GeniResources (ordered like slice_names)
+        """
+        pass
+
+    @abstractmethod
+    def refresh_topology(self):
+        """ Drop the cached endpoints and labels of the devices, so they are requested again by the next audit
+        :return: None
+        """
+        pass
+
     @abstractmethod
     def renew_resources(self, slices, end_time):
         """ Renew resources (throw exception if any check fails)
@@ -69,7 +86,7 @@ class RMInterface(object):
 
     @abstractmethod
     def start_slices(self, slices):
-        """ Start slices (throw exception if any check fails)
+        """ Start slices (throw exception if any check or the command of any connection fails, the other commands are undone then)
         :param slices: dict with slice name (key) and client information
         :return: list of GeniResources
         """
@@ -79,13 +96,13 @@ class RMInterface(object):
     def force_start_slices(self, slices):
         """ Start slices (skips all checks)
         :param slices: dict with slice name (key) and client information
-        :return: list of GeniResources
+        :return: list of GeniResources (with error set if the command of the connection failed)
         """
         pass
 
     @abstractmethod
     def stop_slices(self, slices):
-        """ Stop slices (throw exception if any check fails)
+        """ Stop slices (throw exception if any check or the command of any connection fails, the other commands are undone then)
         :param slices: dict with slice name (key) and client information
         :return: list of GeniResources
         """
@@ -95,13 +112,13 @@ class RMInterface(object):
     def force_stop_slices(self, slices):
         """ Stop slices (skips all checks)
         :param slices: dict with slice name (key) and client information
-        :return: list of GeniResources
+        :return: list of GeniResources (with error set if the command of the connection failed)
         """
         pass
 
     @abstractmethod
     def delete_slices(self, slices):
-        """ Remove slices (throw exception if any check fails)
+        """ Remove slices (throw exception if any check or the command of any connection fails, the other commands are undone then)
         :param slices: dict with slice name (key) and client information
         :return: list of GeniResources
         """
@@ -111,7 +128,7 @@ class RMInterface(object):
     def force_delete_slices(self, slices):
         """ Remove slices (skips all checks)
         :param slices: dict with slice name (key) and client information
-        :return: list of GeniResources
+        :return: list of GeniResources (with error set if the command of the connection failed)
         """
         pass
 
@@ -148,7 +165,7 @@ class RMRoadmManager(RMInterface):
     def __create_detailed_manifest(self, resources):
         ret_ = []
         for (r_in, r_out, conns) in resources:
-            logger.debug("In=%s, Out=%s, Conns=%s" % (r_in, r_out, conns,))
+            logger.debug("In=%s, Out=%s, Conns=%s", r_in, r_out, conns)
 
             in_urn = ons_models.create_roadm_urn(r_in.name, r_in.endpoint, r_in.label)
             out_urn = ons_models.create_roadm_urn(r_out.name, r_out.endpoint, r_out.label)
@@ -167,52 +184,121 @@ class RMRoadmManager(RMInterface):
 
         return ret_
 
-    def __operation_slices(self, slices, call_func):
+    def __operation_slices(self, slices, command_func, undo_func, db_func, best_effort):
+        """Applies __operation_connections to all connections of the {slices}.
+        With {best_effort}, the connections which failed keep their state, the error is set on their (ingress and egress) resources
+        of the manifest. Connections whose ingress and egress are on different resources are skipped (with error) then."""
         try:
             ons_models.roadmsDBM.open_session()
-            exec_ = set()
-            rs_ = []
-            for s_urn in slices.keys():
-                logger.debug("Slice urn=%s" % (s_urn,))
-                r_info_ = ons_models.roadmsDBM.get_slice(s_urn)
-                e_info_ = [call_func(rin, rout, conn) for (rin, rout, conn) in r_info_]
-
-                [exec_.add(e) for e in e_info_]
-                rs_.extend(self.__create_detailed_manifest(r_info_))
-
-            [ons_comms.commandsMngr.execute(rtype, rname) for (rtype, rname) in exec_]
+            logger.debug("Slice urns=%s", slices.keys())
+            r_info_ = ons_models.roadmsDBM.get_slices(slices.keys())
+            mismatch_ = [not self.__same_device(r_in, r_out) for (r_in, r_out, conns) in r_info_]
+            if any(mismatch_) and (not best_effort):
+                raise ons_ex.ONSException("Mismatch between ingress/egress openNaas resources!")
+
+            rs_ = self.__create_detailed_manifest(r_info_)
+            errors_ = iter(self.__operation_connections([r for (r, m) in zip(r_info_, mismatch_) if not m],
+                                                        command_func, undo_func, db_func, best_effort))
+            for (i, m) in enumerate(mismatch_):
+                rs_[2*i].error = rs_[2*i+1].error = "Mismatch between ingress/egress openNaas resources!" if m else next(errors_)
             return rs_
 
         finally:
             ons_models.roadmsDBM.close_session()
 
-    def __start_conn(self, r_in, r_out, conns):
-        if (r_in.type != r_out.type) or (r_in.name != r_out.name):
-            raise ons_ex.ONSException("Mismatch between ingress/egress openNaas resources!")
+    def __same_device(self, r_in, r_out):
+        return (r_in.type == r_out.type) and (r_in.name == r_out.name)
+
+    def __device(self, r_info):
+        return (r_info[0].type, r_info[0].name)
+
+    def __operation_connections(self, r_info, command_func, undo_func, db_func, best_effort):
+        """Sends the command of {command_func} for each connection of {r_info} (see RoadmsDBM.get_slices) to the controller
+        (concurrently, see CommandsManager.map), executes the queue of each affected ROADM once and then applies {db_func}
+        to the connections which succeeded (in one transaction). The database session must be open.
+        Without {best_effort}, it is all or nothing: if a command (or the execution of a queue) fails, the commands already sent are undone
+        by {undo_func} and ONSException is raised (the database is not changed).
+        With {best_effort}, returns the error message of each connection (None if it succeeded).
+        In both cases, the commands are undone if the database could not be changed."""
+        cmd_errors_ = ons_comms.commandsMngr.map(self.__safe_command, [(command_func, r) for r in r_info])
+        sent_ = [r for (r, e) in zip(r_info, cmd_errors_) if e is None]
+        errors_ = cmd_errors_
+        if best_effort or (len(sent_) == len(r_info)):
+            exec_errors_ = self.__execute(sent_)
+            errors_ = [e or exec_errors_.get(self.__device(r)) for (r, e) in zip(r_info, cmd_errors_)]
+            if best_effort: # the commands of the queues which failed are not left for the next execution
+                self.__undo([r for r in sent_ if self.__device(r) in exec_errors_], undo_func)
+
+        failed_ = [e for e in errors_ if e is not None]
+        if failed_:
+            logger.error("%d of %d connections failed: %s" % (len(failed_), len(r_info), failed_[0]))
+            if not best_effort:
+                self.__undo(sent_, undo_func)
+                raise ons_ex.ONSException("%d of %d connections failed (the others have been undone): %s" %
+                                          (len(failed_), len(r_info), failed_[0]))
+
+        done_ = [r for (r, e) in zip(r_info, errors_) if e is None]
+        try:
+            if done_:
+                db_func([(conns.ingress, conns.egress) for (r_in, r_out, conns) in done_])
+
+        except ons_ex.ONSException:
+            self.__undo(done_, undo_func)
+            raise
+
+        return errors_
+
+    def __execute(self, r_info):
+        """Executes the queue of each ROADM of the connections {r_info} once. Returns the error message of each ROADM which failed."""
+        devices_ = sorted(set(self.__device(r) for r in r_info))
+        errors_ = ons_comms.commandsMngr.map(self.__safe_execute, devices_)
+        return dict((d, e) for (d, e) in zip(devices_, errors_) if e is not None)
+
+    def __undo(self, r_info, undo_func):
+        """Sends the command of {undo_func} for each connection of {r_info} and executes the queues. Failures are logged only."""
+        if not r_info:
+            return
+
+        logger.warning("Undoing the commands of %d connections" % (len(r_info),))
+        errors_ = ons_comms.commandsMngr.map(self.__safe_command, [(undo_func, r) for r in r_info])
+        undone_ = [r for (r, e) in zip(r_info, errors_) if e is None]
+        failed_ = len(r_info) - len(undone_) + len(self.__execute(undone_))
+        if failed_:
+            logger.error("Could not undo the commands of all connections (%d ROADMs or connections failed)" % (failed_,))
+
+    def __safe_command(self, command_func, r_info):
+        """Returns None if the command succeeded or the error message."""
+        try:
+            command_func(*r_info)
+            return None
+
+        except ons_ex.ONSException as e:
+            logger.error("Command failed (xconn=%s): %s" % (r_info[2].xconn_id, str(e)))
+            return str(e)
+
+    def __safe_execute(self, r_type, r_name):
+        """Returns None if the queue of the ROADM has been executed or the error message."""
+        try:
+            ons_comms.commandsMngr.execute(r_type, r_name)
+            return None
 
-        ons_models.roadmsDBM.oper_connection(conns.ingress, conns.egress,
-                                             ons_models.OPERATIONAL.READY_BUSY)
+        except ons_ex.ONSException as e:
+            logger.error("Execute failed (type=%s, name=%s): %s" % (r_type, r_name, str(e)))
+            return str(e)
+
+    def __start_conn(self, r_in, r_out, conns):
         ons_comms.commandsMngr.makeXConnection(r_in.type, r_in.name, conns.xconn_id,
                                                r_in.endpoint, r_in.label,
                                                r_out.endpoint, r_out.label)
-        return (r_in.type, r_in.name)
 
     def __stop_conn(self, r_in, r_out, conns):
-        if (r_in.type != r_out.type) or (r_in.name != r_out.name):
-            raise ons_ex.ONSException("Mismatch between ingress/egress openNaas resources!")
-
-        ons_models.roadmsDBM.oper_connection(conns.ingress, conns.egress,
-                                             ons_models.OPERATIONAL.READY)
         ons_comms.commandsMngr.removeXConnection(r_in.type, r_in.name, conns.xconn_id)
-        return (r_in.type, r_in.name)
 
-    def __release_conn(self, r_in, r_out, conns):
-        if (r_in.type != r_out.type) or (r_in.name != r_out.name):
-            raise ons_ex.ONSException("Mismatch between ingress/egress openNaas resources!")
+    def __busy_conns(self, conns):
+        ons_models.roadmsDBM.oper_connections(conns, ons_models.OPERATIONAL.READY_BUSY)
 
-        ons_models.roadmsDBM.destroy_connection(conns.ingress, conns.egress)
-        ons_comms.commandsMngr.removeXConnection(r_in.type, r_in.name, conns.xconn_id)
-        return (r_in.type, r_in.name)
+    def __ready_conns(self, conns):
+        ons_models.roadmsDBM.oper_connections(conns, ons_models.OPERATIONAL.READY)
 
     def create_geni_resource(self, resource_name, endpoint, label, slice_name,
                              end_time, resource_type, allocation, operational):
@@ -222,23 +308,34 @@ class RMRoadmManager(RMInterface):
 
     @worker.outsideprocess
     def update_resources(self, params):
-        ons_fsm.fsmMngr.action()
+        ons_sync.syncEngine.run()
 
     @worker.outsideprocess
+    @trace.traced('rm.check_slices_expiration')
     def check_slices_expiration(self, params):
-        slices_ = {}
+        """Releases all connections of the expired slices in one pass (same as delete_slices, but without reading the slices again)."""
         try:
             ons_models.roadmsDBM.open_session()
-            rs_ = ons_models.roadmsDBM.get_expired_slices()
-            for r in rs_:
-                if r.slice_urn: slices_[r.slice_urn] = None
+            r_info_ = ons_models.roadmsDBM.get_expired_connections()
+            mismatch_ = [conns.xconn_id for (r_in, r_out, conns) in r_info_ if not self.__same_device(r_in, r_out)]
+            if mismatch_:
+                # skipped (instead of failing as delete_slices), so they do not block the expiration of all others
+                logger.error("Mismatch between ingress/egress openNaas resources, not released: %s" % (mismatch_,))
+                r_info_ = [r for r in r_info_ if self.__same_device(r[0], r[1])]
+
+            if not r_info_:
+                return
+
+            logger.info("Releasing %d connections of %d expired slices" %
+                        (len(r_info_), len(set(conns.slice_urn for (r_in, r_out, conns) in r_info_))))
+            self.__operation_connections(r_info_, self.__stop_conn, self.__start_conn,
+                                         ons_models.roadmsDBM.destroy_connections, True)
 
         finally:
             ons_models.roadmsDBM.close_session()
 
-        self.delete_slices(slices_)
-
     @serviceinterface
+    @trace.traced('rm.get_resources')
     def get_resources(self):
         try:
             ons_models.roadmsDBM.open_session()
@@ -250,6 +347,45 @@ class RMRoadmManager(RMInterface):
             ons_models.roadmsDBM.close_session()
 
     @serviceinterface
+    @contextmanager
+    def iter_resources(self):
+        """ Iterate over all managed resources, the rows are read from the database (and the GeniResources created) while iterating.
+        The database session is kept open until the with block is left, so please consume the iterator within it:
+            with rm.iter_resources() as rs: ...
+        :return: context manager giving an iterator of GeniResources
+        """
+        try:
+            ons_models.roadmsDBM.open_session()
+            yield (self.create_geni_resource(*r_) for r_ in ons_models.roadmsDBM.iter_resources())
+
+        finally:
+            ons_models.roadmsDBM.close_session()
+
+    @serviceinterface
+    def get_resources_generation(self):
+        """ Get a counter which changes whenever the result of get_resources changes
+        :return: integer
+        """
+        try:
+            ons_models.roadmsDBM.open_session()
+            return ons_models.roadmsDBM.get_generation()
+
+        finally:
+            ons_models.roadmsDBM.close_session()
+
+    @serviceinterface
+    def refresh_topology(self):
+        # the audit runs in the worker process, it drops its cache when it sees the new topology generation
+        ons_comms.commandsMngr.refresh_topology()
+        try:
+            ons_models.roadmsDBM.open_session()
+            ons_models.roadmsDBM.invalidate_topology()
+
+        finally:
+            ons_models.roadmsDBM.close_session()
+
+    @serviceinterface
+    @trace.traced('rm.reserve_resources')
     def reserve_resources(self, resources, slice_name, end_time=None,
                           client_name="", client_id="", client_mail=""):
         try:
@@ -279,6 +415,7 @@ class RMRoadmManager(RMInterface):
             ons_models.roadmsDBM.close_session()
 
     @serviceinterface
+    @trace.traced('rm.get_slice_resources')
     def get_slice_resources(self, slice_name):
         try:
             ons_models.roadmsDBM.open_session()
@@ -289,50 +426,74 @@ class RMRoadmManager(RMInterface):
         finally:
             ons_models.roadmsDBM.close_session()
 
+    @serviceinterface
+    @trace.traced('rm.get_slices_resources')
+    def get_slices_resources(self, slice_names):
+        try:
+            ons_models.roadmsDBM.open_session()
+            rs_ = ons_models.roadmsDBM.get_slices(slice_names)
+
+            return self.__create_detailed_manifest(rs_)
+
+        finally:
+            ons_models.roadmsDBM.close_session()
+
     @serviceinterface
     def renew_resources(self, slices, end_time):
         raise ons_ex.ONSException("renew_resources: NOT implemented yet!")
 
     @serviceinterface
+    @trace.traced('rm.force_renew_resources')
     def force_renew_resources(self, slices, end_time):
         try:
             ons_models.roadmsDBM.open_session()
-            rs_ = []
-            for s_urn in slices.keys():
-                logger.debug("Slice urn=%s" % (s_urn,))
+            # slices of the same client are renewed with one statement
+            by_client_ = {}
+            for s_urn, c_info in slices.items():
+                by_client_.setdefault(tuple(c_info), []).append(s_urn)
+
+            renewed_ = []
+            for c_info, s_urns in by_client_.items():
+                logger.debug("Slice urns=%s", s_urns)
                 try:
-                    ons_models.roadmsDBM.renew_slice(s_urn, end_time, slices[s_urn])
-                    r_info_ = ons_models.roadmsDBM.get_slice(s_urn)
-                    rs_.extend(self.__create_detailed_manifest(r_info_))
+                    ons_models.roadmsDBM.renew_slices(s_urns, end_time, c_info)
+                    renewed_.extend(s_urns)
 
                 except ons_ex.ONSException as e:
                     logger.error(str(e))
 
-            return rs_
+            r_info_ = ons_models.roadmsDBM.get_slices(renewed_)
+            return self.__create_detailed_manifest(r_info_)
 
         finally:
             ons_models.roadmsDBM.close_session()
 
     @serviceinterface
+    @trace.traced('rm.start_slices')
     def start_slices(self, slices):
-        return self.__operation_slices(slices, self.__start_conn)
+        return self.__operation_slices(slices, self.__start_conn, self.__stop_conn, self.__busy_conns, False)
 
     @serviceinterface
+    @trace.traced('rm.force_start_slices')
     def force_start_slices(self, slices):
-        raise ons_ex.ONSException("force_start_slices: NOT implemented yet!")
+        return self.__operation_slices(slices, self.__start_conn, self.__stop_conn, self.__busy_conns, True)
 
     @serviceinterface
+    @trace.traced('rm.stop_slices')
     def stop_slices(self, slices):
-        return self.__operation_slices(slices, self.__stop_conn)
+        return self.__operation_slices(slices, self.__stop_conn, self.__start_conn, self.__ready_conns, False)
 
     @serviceinterface
+    @trace.traced('rm.force_stop_slices')
     def force_stop_slices(self, slices):
-        raise ons_ex.ONSException("force_stop_slices: NOT implemented yet!")
+        return self.__operation_slices(slices, self.__stop_conn, self.__start_conn, self.__ready_conns, True)
 
     @serviceinterface
+    @trace.traced('rm.delete_slices')
     def delete_slices(self, slices):
-        return self.__operation_slices(slices, self.__release_conn)
+        return self.__operation_slices(slices, self.__stop_conn, self.__start_conn, ons_models.roadmsDBM.destroy_connections, False)
 
     @serviceinterface
+    @trace.traced('rm.force_delete_slices')
     def force_delete_slices(self, slices):
-        raise ons_ex.ONSException("force_delete_slices: NOT implemented yet!")
+        return self.__operation_slices(slices, self.__stop_conn, self.__start_conn, ons_models.roadmsDBM.destroy_connections, True)
@@ -0,0 +1,226 @@
+import threading
+import Queue
+from datetime import datetime, timedelta
+
+import amsoil.core.pluginmanager as pm
+from amsoil.core import trace
+import amsoil.core.log
+logger=amsoil.core.log.getLogger('ons_sync')
+
+ons_models = pm.getService('opennaas_models')
+ons_comms = pm.getService('opennaas_commands')
+ons_ex = pm.getService('opennaas_exceptions')
+config = pm.getService("config")
+
+"""
+OpenNaas Sync Engine.
+
+A sync cycle brings the database in line with the inventory of the OpenNaas controller (see RoadmsDBM.audit_snapshot).
+It runs as a pipeline of three stages, connected by bounded queues (a stage blocks if the next one falls behind):
+- fetch: requests the endpoints, labels (usually from the topology cache, see RoadmCM) and cross-connections of one resource after the other
+  (the requests of a resource in parallel),
+- transform: converts the answers into the rows of the snapshot,
+- write: collects the rows of some resources (at least opennaas.update_step rows) and writes them in one transaction.
+The resources written are recorded as checkpoint in the same transaction. If a cycle is interrupted (e.g. the worker was restarted
+or writing to the database failed), the next cycle only fetches the remaining resources.
+A cycle which runs to its end drops the checkpoint, even if some resources could not be fetched: they are fetched again by the next cycle
+(with all others), and the terminated rows are only cleaned up for the resources which have been synced.
+"""
+_DONE = object() # passed from stage to stage after the last item
+_QUEUE_POLL = 0.5 # secs between checks if the pipeline has been stopped
+
+class SyncEngine(object):
+    def __init__(self):
+        self.batch_size = config.get("opennaas.update_step")
+        self.queue_size = config.get("opennaas.sync_queue_size")
+        self.checkpoint_age = timedelta(seconds=config.get("opennaas.sync_checkpoint_age"))
+        self.__progress = {'state': 'idle'}
+        self.__topology_generation = None
+        self.__lock = threading.Lock()
+
+    def progress(self):
+        """Returns a dict describing the current (or last) cycle: state ('idle', 'running', 'completed', 'incomplete' or 'failed'),
+        started/finished (datetimes), total/skipped/fetched/written (resources), changes (rows) and errors."""
+        with self.__lock:
+            return dict(self.__progress)
+
+    def __update_progress(self, **values):
+        with self.__lock:
+            for key, value in values.items():
+                self.__progress[key] = (self.__progress[key] + value) if key in ('fetched', 'written', 'changes', 'errors') else value
+
+    @trace.traced('sync.run')
+    def run(self):
+        """Runs a complete sync cycle and returns True if all resources have been synced."""
+        try:
+            resources_ = ons_comms.commandsMngr.getResources()
+
+        except ons_ex.ONSException as e:
+            logger.error("Sync failed, could not list resources: %s" % (str(e),))
+            self.__update_progress(state='failed', finished=datetime.utcnow())
+            return False
+
+        stop_ = threading.Event()
+        try:
+            ons_models.roadmsDBM.open_session()
+            topology_generation_ = ons_models.roadmsDBM.get_generation(ons_models.TOPOLOGY_GENERATION)
+            if topology_generation_ != self.__topology_generation:
+                ons_comms.commandsMngr.refresh_topology()
+                self.__topology_generation = topology_generation_
+
+            done_ = ons_models.roadmsDBM.get_sync_checkpoint(self.checkpoint_age)
+            todo_ = [r for r in resources_ if tuple(r) not in done_]
+            with self.__lock:
+                self.__progress = {'state': 'running', 'started': datetime.utcnow(), 'finished': None,
+                                   'total': len(resources_), 'skipped': len(resources_) - len(todo_),
+                                   'fetched': 0, 'written': 0, 'changes': 0, 'errors': 0}
+            if done_:
+                logger.info("Sync resumes from checkpoint, %d of %d resources already synced" % (len(resources_) - len(todo_), len(resources_)))
+
+            fetched_ = Queue.Queue(self.queue_size)
+            rows_ = Queue.Queue(self.queue_size)
+            stages_ = [threading.Thread(target=self.__fetch, args=(todo_, fetched_, stop_)),
+                       threading.Thread(target=self.__transform, args=(fetched_, rows_, stop_))]
+            for t in stages_:
+                t.daemon = True
+                t.start()
+            try:
+                written_ = self.__write(rows_)
+            finally:
+                stop_.set()
+                for t in stages_:
+                    t.join()
+
+            failed_ = [r for r in todo_ if tuple(r) not in written_]
+            ons_models.roadmsDBM.audit_terminated(failed_)
+            ons_models.roadmsDBM.clear_sync_checkpoint()
+            if failed_ or self.progress()['errors']:
+                logger.warning("Sync incomplete, %d resources not synced: %s" % (len(failed_), self.progress(),))
+                self.__update_progress(state='incomplete', finished=datetime.utcnow())
+                return False
+
+            self.__update_progress(state='completed', finished=datetime.utcnow())
+            logger.info("Sync completed: %s" % (self.progress(),))
+            return True
+
+        except ons_ex.ONSException as e:
+            logger.error("Sync failed: %s" % (str(e),))
+            self.__update_progress(state='failed', finished=datetime.utcnow())
+            return False
+
+        finally:
+            stop_.set()
+            ons_models.roadmsDBM.close_session()
+
+    # pipeline stages
+    def __put(self, queue, item, stop):
+        """Blocks until there is room in the {queue} (back-pressure). Returns False if the pipeline was stopped meanwhile."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=_QUEUE_POLL)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def __get(self, queue, stop):
+        while not stop.is_set():
+            try:
+                return queue.get(timeout=_QUEUE_POLL)
+            except Queue.Empty:
+                pass
+        return _DONE
+
+    def __fetch(self, resources, out, stop):
+        try:
+            for resource in resources:
+                try:
+                    item_ = (resource,) + self.__fetch_resource(resource) + (None,)
+
+                except ons_ex.ONSException as e:
+                    item_ = (resource, None, None, str(e))
+
+                if not self.__put(out, item_, stop):
+                    return
+
+        except Exception as e:
+            logger.error("Sync fetch stage failed: %s" % (str(e),))
+            self.__update_progress(errors=1)
+
+        finally:
+            self.__put(out, _DONE, stop)
+
+    def __transform(self, inp, out, stop):
+        try:
+            while True:
+                item_ = self.__get(inp, stop)
+                if item_ is _DONE:
+                    return
+                (rtype, rname), ep_labels, xconns, error = item_
+                if error is not None:
+                    logger.error("Sync could not fetch %s/%s: %s" % (rtype, rname, error))
+                    self.__update_progress(errors=1)
+                    continue
+
+                self.__update_progress(fetched=1)
+                roadms_ = sorted(set((rtype, rname, ep, label) for (ep, label) in ep_labels))
+                xconns_ = [(rtype, rname, detail) for detail in xconns if detail is not None]
+                if not self.__put(out, ((rtype, rname), roadms_, xconns_), stop):
+                    return
+
+        except Exception as e:
+            logger.error("Sync transform stage failed: %s" % (str(e),))
+            self.__update_progress(errors=1)
+
+        finally:
+            self.__put(out, _DONE, stop)
+
+    def __write(self, inp):
+        """Runs in the calling thread (the only one using the database session). Returns the set of (type, name) of the resources written."""
+        written_ = set()
+        resources_, roadms_, xconns_ = [], [], []
+        while True:
+            item_ = inp.get()
+            if item_ is not _DONE:
+                resource, rms, xcs = item_
+                resources_.append(resource)
+                roadms_.extend(rms)
+                xconns_.extend(xcs)
+
+            if resources_ and ((item_ is _DONE) or (len(roadms_) + len(xconns_) >= self.batch_size)):
+                changes_ = ons_models.roadmsDBM.audit_snapshot(resources_, roadms_, xconns_, checkpoint=True)
+                written_.update(tuple(r) for r in resources_)
+                self.__update_progress(written=len(resources_), changes=changes_)
+                logger.info("Sync progress: %(written)d/%(total)d resources written (%(skipped)d skipped), %(changes)d changes" % self.progress())
+                resources_, roadms_, xconns_ = [], [], []
+
+            if item_ is _DONE:
+                return written_
+
+    # controller requests (see CommandsManager.map for the concurrency)
+    def __fetch_resource(self, resource):
+        """Returns the endpoint/label pairs and the cross-connections of the {resource}.
+        If a cross-connection uses an endpoint/label which is not known (the cached topology is outdated), the topology is requested again."""
+        ep_labels_ = self.__ep_labels(resource)
+        xconns_ = self.__xconns(resource)
+        known_ = set(ep_labels_)
+        if any(((x[1], x[2]) not in known_) or ((x[3], x[4]) not in known_) for x in xconns_ if x is not None):
+            logger.info("Topology of %s/%s changed, refreshing" % tuple(resource))
+            ons_comms.commandsMngr.refresh_topology(*resource)
+            ep_labels_ = self.__ep_labels(resource)
+
+        return (ep_labels_, xconns_)
+
+    def __ep_labels(self, resource):
+        cm_ = ons_comms.commandsMngr
+        eps_ = cm_.getEndPoints(*resource)
+        labels_ = cm_.map(cm_.getLabels, [tuple(resource) + (ep,) for ep in eps_])
+        return [(ep, label) for (ep, labels) in zip(eps_, labels_) for label in labels]
+
+    def __xconns(self, resource):
+        cm_ = ons_comms.commandsMngr
+        xcs_ = cm_.getXConnections(*resource)
+        return cm_.map(cm_.getXConnection, [tuple(resource) + (xc,) for xc in xcs_])
+
+
+syncEngine = SyncEngine()
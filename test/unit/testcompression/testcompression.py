@@ -0,0 +1,76 @@
+"""
+Benchmark of the geni_compress cache (g3rpc/compression.py) with an advertisement of 10k resources.
+Compares compressing every time (as before) with cache misses and hits (the same string and an equal copy of it).
+Run with: python testcompression.py
+"""
+import sys
+import zlib
+import time
+import base64
+import unittest
+from os.path import dirname, join, normpath
+
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/plugins/geniv3rpc/g3rpc/'))
+sys.path.insert(0,PYTHON_DIR)
+
+import compression
+
+RESOURCES = 10000
+ROUNDS = 20
+
+def advertisement(resources):
+    nodes = ''.join('  <node component_id="urn:publicid:IDN+ofelia+roadm+r%d:ep%d:l%d" exclusive="true">\n'
+                    '    <available now="%s"/>\n  </node>\n' % (i / 1000, i % 100, i % 7, 'true' if i % 3 else 'false')
+                    for i in xrange(resources))
+    return '<?xml version="1.0" encoding="UTF-8"?>\n<rspec type="advertisement" xmlns="http://www.geni.net/resources/rspec/3">\n' + nodes + '</rspec>\n'
+
+def per_call_ms(func, rspec):
+    start = time.time()
+    for i in xrange(ROUNDS):
+        func(rspec)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+class TestCompression(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rspec = advertisement(RESOURCES)
+
+    def test_same_result(self):
+        expected = base64.b64encode(zlib.compress(self.rspec))
+        self.assertEqual(compression.compress(self.rspec), expected)
+        self.assertEqual(compression.CompressionCache().compress(self.rspec), expected)
+        self.assertEqual(zlib.decompress(base64.b64decode(compression.compress(self.rspec, 9))), self.rspec)
+
+    def test_hit_and_miss(self):
+        before = per_call_ms(lambda r: base64.b64encode(zlib.compress(r)), self.rspec)
+
+        def miss(rspec):
+            cache = compression.CompressionCache()
+            cache.compress(rspec)
+        missed = per_call_ms(miss, self.rspec)
+
+        cache = compression.CompressionCache()
+        cache.compress(self.rspec)
+        hit = per_call_ms(cache.compress, self.rspec)
+        copies = [self.rspec[:-1] + self.rspec[-1] for i in xrange(ROUNDS)] # equal content, other objects (e.g. rebuilt RSpecs)
+        start = time.time()
+        for copy in copies:
+            cache.compress(copy)
+        hit_copy = (time.time() - start) / ROUNDS * 1000
+
+        print "\n%d resources (%d KB): uncached %.2f ms, miss %.2f ms, hit %.4f ms, hit of an equal copy %.2f ms" % \
+              (RESOURCES, len(self.rspec) / 1024, before, missed, hit, hit_copy)
+        self.assertTrue(missed < before * 1.5, "a miss costs much more than compressing (%.2f ms, %.2f ms)" % (missed, before))
+        self.assertTrue(hit_copy * 5 < before, "a hit saves too little (%.2f ms, %.2f ms)" % (hit_copy, before))
+
+    def test_bounded(self):
+        cache = compression.CompressionCache(size=2)
+        for i in xrange(5):
+            cache.compress(self.rspec + str(i))
+        self.assertEqual(len(cache._entries), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Benchmark of the per-request logging overhead (amsoil.core.log) with debug logging on and off.
+A request logs like the delegate hot paths: the call with all arguments (RSpec, credentials, see OpenNaasGENI3Delegate.enter_method_log)
+and a few debug/info messages. The previous way (LoggerAdapter adding the prefix, messages formatted with %) is measured for comparison.
+Run with: python testlogperf.py
+"""
+import sys
+import time
+import logging
+import tempfile
+import unittest
+from os.path import dirname, join, normpath
+
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/'))
+sys.path.insert(0,PYTHON_DIR)
+
+from amsoil import config
+config.LOG_FILE = tempfile.NamedTemporaryFile(prefix='testlogperf', suffix='.log').name
+config.LOG_RATE_LIMIT = 0 # all records are written
+import amsoil.core.log
+
+REQUESTS = 2000
+RSPEC = '<rspec>' + ''.join('<node component_id="urn:publicid:IDN+am+node+%d"/>' % (i,) for i in xrange(1000)) + '</rspec>'
+CREDENTIALS = [{'geni_type': 'geni_sfa', 'geni_version': '3', 'geni_value': 'x' * 4000} for i in xrange(3)]
+
+class PrefixAdapter(logging.LoggerAdapter):
+    """The adapter getLogger returned before (the prefix was added before the level was checked)."""
+    def process(self, msg, kwargs):
+        return ("[%s] %s" % (self.extra['prefix'], msg), kwargs)
+
+def format_args(args, kwargs):
+    return ', '.join('%s=%r' % e for e in zip(('urns', 'credentials', 'rspec'), args) + kwargs.items())
+
+def old_request(log, args):
+    log.debug("Calling %s with args=%s" % ('allocate', format_args(args, {})))
+    log.debug("client_urn=%s, client_uuid=%s, client_email=%s" % ('urn:publicid:IDN+ch+user+alice', 'uuid', 'alice@example.org'))
+    log.debug("Resources=%s" % (args[2],))
+    log.info("Called: <%s>" % ('Allocate',))
+
+def new_request(log, args):
+    log.debug("Calling %s with args=%s", 'allocate', amsoil.core.log.lazy(format_args, args, {}))
+    log.debug("client_urn=%s, client_uuid=%s, client_email=%s", 'urn:publicid:IDN+ch+user+alice', 'uuid', 'alice@example.org')
+    log.debug("Resources=%s", args[2])
+    log.info("Called: <%s>", 'Allocate')
+
+def per_request_us(request, log):
+    args = (['urn:publicid:IDN+ch+slice+s1'], CREDENTIALS, RSPEC)
+    start = time.time()
+    for i in xrange(REQUESTS):
+        request(log, args)
+    return (time.time() - start) / REQUESTS * 1e6
+
+
+class TestLogPerf(unittest.TestCase):
+
+    def setUp(self):
+        self.child = amsoil.core.log.getLogger('testlogperf')
+        self.old = PrefixAdapter(self.child, {'prefix': 'testlogperf'})
+
+    def tearDown(self):
+        self.child.setLevel(logging.NOTSET)
+
+    def measure(self, level):
+        self.child.setLevel(level)
+        return per_request_us(old_request, self.old), per_request_us(new_request, self.child)
+
+    def test_debug_off(self):
+        # the info record is still written, so the request does not get free
+        old, new = self.measure(logging.INFO)
+        print "\ndebug off: %.1f us/request before, %.1f us/request now" % (old, new)
+        self.assertTrue(new * 3 < old, "deferred formatting saves too little (%.1f us, before %.1f us)" % (new, old))
+
+    def test_debug_on(self):
+        # the records are written by the writer thread, the request only renders them
+        old, new = self.measure(logging.DEBUG)
+        print "\ndebug on: %.1f us/request before, %.1f us/request now" % (old, new)
+        self.assertTrue(new < old * 1.5, "rendering the records got slower (%.1f us, before %.1f us)" % (new, old))
+
+
+if __name__ == '__main__':
+    unittest.main()
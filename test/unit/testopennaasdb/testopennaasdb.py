@@ -0,0 +1,370 @@
+"""
+Benchmarks of the OpenNaas database access (opennaas/models.py, RoadmsDBM) against the previous implementations, on a temporary sqlite database.
+The inventory has 10k endpoints of 20 ROADMs, one slice has 500 connections (xconns), 100 further slices have one each.
+TestQueries: iter_resources and get_slice(s) as joined queries against the per-row queries used before.
+TestAudit: audit_snapshot (batched INSERT ... ON CONFLICT DO UPDATE, or the fallback for sqlite < 3.24) against the per-row
+insert-then-update used before, for the first import and a repeated audit of 10 ROADMs with 10k endpoint/labels and 500 xconns.
+TestUpdateMany: oper_connections and destroy_connections of 4000 connections (executemany of one statement per id, see __update_many)
+against the previous IN clauses of IN_CLAUSE_STEP ids each.
+Needs sqlalchemy (as the plugin does).
+Run with: python testopennaasdb.py
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from os.path import dirname, join, normpath
+
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/')))
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/plugins/opennaas/')))
+
+import amsoil.core.pluginmanager as pm
+
+DB_DIR = tempfile.mkdtemp(prefix='testopennaasdb')
+
+class _Config(object):
+    """The keys of the opennaas plugin which are read by models (the config plugin keeps them in its database)."""
+    values = { 'opennaas.db_dir' : DB_DIR, 'opennaas.db_dump_stat' : False, 'opennaas.update_step' : 100 }
+    def get(self, key):
+        return self.values[key]
+
+pm.registerService('config', _Config())
+import resourceexceptions
+pm.registerService('opennaas_exceptions', resourceexceptions)
+
+import sqlalchemy as sqla
+import models
+from models import Resources, Roadms, RoadmsConns, ALLOCATION
+
+ROADMS = 20
+ENDPOINTS = 500 # per ROADM
+BIG_SLICE = 'urn:publicid:IDN+ofelia+slice+big'
+BIG_SLICE_XCONNS = 500
+SMALL_SLICES = ['urn:publicid:IDN+ofelia+slice+s%d' % (i,) for i in xrange(100)]
+
+def fill():
+    """Creates the inventory, the connections use the first endpoints of each ROADM (ingress 2*i, egress 2*i+1)."""
+    models.meta.drop_all()
+    models.meta.create_all()
+    conn = models.engine.connect()
+    conn.execute(models.resources.insert(), [{'id': r + 1, 'name': 'roadm%d' % (r,), 'type': 'roadm'} for r in xrange(ROADMS)])
+    conn.execute(models.roadms.insert(), [{'id': r * ENDPOINTS + e + 1, 'resource_id': r + 1, 'endpoint': 'ep%d' % (e,), 'label': '1550',
+                                           'allocation': ALLOCATION.FREE} for r in xrange(ROADMS) for e in xrange(ENDPOINTS)])
+    end_time = datetime.utcnow() + timedelta(days=1)
+    slices = [BIG_SLICE] * BIG_SLICE_XCONNS + SMALL_SLICES
+    xconns = []
+    for i, slice_urn in enumerate(slices):
+        ingress = (i % ROADMS) * ENDPOINTS + 2 * (i / ROADMS) + 1
+        xconns.append({'ingress': ingress, 'egress': ingress + 1, 'xconn_id': 'x%d' % (i,), 'slice_urn': slice_urn, 'end_time': end_time})
+    conn.execute(models.connections.insert(), xconns)
+    for i in xrange(0, len(xconns), models.IN_CLAUSE_STEP / 2):
+        step = xconns[i:i + models.IN_CLAUSE_STEP / 2]
+        conn.execute(models.roadms.update().where(models.roadms.c.id.in_([x['ingress'] for x in step] + [x['egress'] for x in step])).\
+                         values(allocation=ALLOCATION.ALLOCATED))
+    conn.close()
+
+def old_iter_resources(s):
+    """iter_resources before the join: one query per allocated endpoint."""
+    for r_ in s.query(Resources.name, Resources.type, Roadms.endpoint, Roadms.label, Roadms.allocation, Roadms.operational, Roadms.id).\
+                join(Roadms, Resources.id==Roadms.resource_id).yield_per(100):
+        if r_.allocation == ALLOCATION.ALLOCATED:
+            conn_ = s.query(RoadmsConns).filter(sqla.or_(RoadmsConns.ingress == r_.id, RoadmsConns.egress == r_.id)).one()
+            yield (r_.name, r_.endpoint, r_.label, conn_.slice_urn, conn_.end_time, r_.type, r_.allocation, r_.operational)
+        else:
+            yield (r_.name, r_.endpoint, r_.label, None, None, r_.type, r_.allocation, r_.operational)
+
+def old_connections(s, rall_):
+    """get_slice(s) before the join: two queries per connection."""
+    ret_ = []
+    for r_ in rall_:
+        ends_ = [s.query(Roadms.endpoint, Roadms.label, Roadms.allocation, Roadms.operational, Resources.name, Resources.type).\
+                   join(Resources, Roadms.resource_id==Resources.id).filter(Roadms.id == rid_).one() for rid_ in (r_.ingress, r_.egress)]
+        ret_.append((ends_[0], ends_[1], r_))
+    return ret_
+
+def old_get_slice(s, slice_urn):
+    return old_connections(s, s.query(RoadmsConns).filter(RoadmsConns.slice_urn == slice_urn).all())
+
+def old_get_slices(s, slice_urns):
+    rall_ = s.query(RoadmsConns).filter(RoadmsConns.slice_urn.in_(slice_urns)).all()
+    order_ = dict((u, i) for i, u in enumerate(slice_urns))
+    rall_.sort(key=lambda r: order_[r.slice_urn])
+    return old_connections(s, rall_)
+
+AUDIT_RESOURCES = [('roadm', 'roadm%d' % (r,)) for r in xrange(10)]
+AUDIT_ROADMS = [('roadm', 'roadm%d' % (r,), 'ep%d' % (e,), '1550') for r in xrange(10) for e in xrange(1000)]
+AUDIT_XCONNS = [('roadm', 'roadm%d' % (i % 10,), ('x%d' % (i,), 'ep%d' % (2 * (i / 10),), '1550', 'ep%d' % (2 * (i / 10) + 1,), '1550'))
+                for i in xrange(500)]
+
+def reset():
+    models.meta.drop_all()
+    models.meta.create_all()
+
+def old_audit(s, resources_info, roadms_info, xconns_info):
+    """audit_resources, audit_roadms and audit_connections before the diff against the current rows and the upsert:
+    each row is inserted, if the insert fails (the row exists) its audit_time is updated instead."""
+    def insert_or_update(insert_, update_):
+        try:
+            s.execute(insert_)
+            return True
+        except sqla.exc.IntegrityError:
+            s.execute(update_.values(audit_time=datetime.utcnow()))
+            return False
+    resources, roadms, connections = models.resources, models.roadms, models.connections
+    for (rtype, rname) in resources_info:
+        insert_or_update(resources.insert().values(name=rname, type=rtype),
+                         resources.update().where(sqla.and_(resources.c.name==rname, resources.c.type==rtype)))
+    ids_ = dict(((r.type, r.name), r.id) for r in s.execute(sqla.select([resources.c.id, resources.c.type, resources.c.name])))
+    for (rtype, rname, ep, label) in roadms_info:
+        rid_ = ids_[(rtype, rname)]
+        insert_or_update(roadms.insert().values(resource_id=rid_, endpoint=ep, label=label, allocation=ALLOCATION.FREE),
+                         roadms.update().where(sqla.and_(roadms.c.resource_id==rid_, roadms.c.endpoint==ep, roadms.c.label==label)))
+    for (rtype, rname, (x_id, src_ep, src_label, dst_ep, dst_label)) in xconns_info:
+        rid_ = ids_[(rtype, rname)]
+        rin_ = s.query(Roadms.id).filter(sqla.and_(Roadms.resource_id==rid_, Roadms.endpoint==src_ep, Roadms.label==src_label)).one()
+        rout_ = s.query(Roadms.id).filter(sqla.and_(Roadms.resource_id==rid_, Roadms.endpoint==dst_ep, Roadms.label==dst_label)).one()
+        insert_or_update(connections.insert().values(ingress=rin_.id, egress=rout_.id, xconn_id=x_id),
+                         connections.update().where(sqla.and_(connections.c.ingress==rin_.id, connections.c.egress==rout_.id)))
+        s.execute(roadms.update().where(sqla.and_(sqla.or_(roadms.c.id==rin_.id, roadms.c.id==rout_.id),
+                                                  roadms.c.allocation!=ALLOCATION.ALLOCATED)).values(allocation=ALLOCATION.ALLOCATED))
+    s.commit()
+
+def inventory():
+    """The contents of the tables without ids and times."""
+    conn = models.engine.connect()
+    try:
+        names = dict((r.id, r.name) for r in conn.execute(models.resources.select()))
+        roadms = dict((r.id, (names[r.resource_id], r.endpoint, r.label, r.allocation)) for r in conn.execute(models.roadms.select()))
+        xconns = set((r.xconn_id, roadms[r.ingress], roadms[r.egress]) for r in conn.execute(models.connections.select()))
+        return set(names.values()), set(roadms.values()), xconns
+    finally:
+        conn.close()
+
+def old_update_in_chunks(s, column, ids, **values):
+    """__update_many before executemany."""
+    ids = list(ids)
+    count_ = 0
+    for i in range(0, len(ids), models.IN_CLAUSE_STEP):
+        count_ += s.execute(column.table.update().where(column.in_(ids[i:i+models.IN_CLAUSE_STEP])).values(**values)).rowcount
+    return count_
+
+def old_oper_connections(s, conns, op_value):
+    old_update_in_chunks(s, models.roadms.c.id, [i for pair in conns for i in pair], operational=op_value)
+    s.commit()
+
+def old_destroy_connections(s, conns):
+    ingress_ = [ingress for (ingress, egress) in conns]
+    for i in range(0, len(ingress_), models.IN_CLAUSE_STEP):
+        s.execute(models.connections.delete(models.connections.c.ingress.in_(ingress_[i:i+models.IN_CLAUSE_STEP])))
+    old_update_in_chunks(s, models.roadms.c.id, [i for pair in conns for i in pair], allocation=ALLOCATION.FREE, operational=models.OPERATIONAL.READY)
+    s.commit()
+
+def comparable(connections):
+    return [(tuple(rin), tuple(rout), c.xconn_id, c.slice_urn, c.end_time) for (rin, rout, c) in connections]
+
+def statements_and_seconds(func):
+    """Returns the result of {func}, the number of statements it executed and the time it took."""
+    count = [0]
+    def count_statement(*args):
+        count[0] += 1
+    sqla.event.listen(models.engine, 'before_cursor_execute', count_statement)
+    try:
+        start = time.time()
+        result = func()
+        return result, count[0], time.time() - start
+    finally:
+        sqla.event.remove(models.engine, 'before_cursor_execute', count_statement)
+
+
+class TestQueries(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        fill()
+
+    def setUp(self):
+        self.dbm = models.RoadmsDBM()
+        self.dbm.open_session()
+        self.old_session = models.sessionmaker(bind=models.engine)()
+
+    def tearDown(self):
+        self.dbm.close_session()
+        self.old_session.close()
+
+    def compare(self, name, old_func, new_func, to_comparable=lambda r: r):
+        old, old_statements, before = statements_and_seconds(old_func)
+        new, new_statements, now = statements_and_seconds(new_func)
+        print "\n%s: before %d statements / %.3f s, now %d statements / %.3f s" % (name, old_statements, before, new_statements, now)
+        self.assertEqual(to_comparable(new), to_comparable(old))
+        self.assertTrue(now < before, "%s is slower (%.3f s, before %.3f s)" % (name, now, before))
+        return new_statements
+
+    def test_iter_resources(self):
+        statements = self.compare("iter_resources (%d endpoints)" % (ROADMS * ENDPOINTS,),
+                                  lambda: list(old_iter_resources(self.old_session)), lambda: list(self.dbm.iter_resources()))
+        self.assertEqual(statements, 1)
+
+    def test_get_slice(self):
+        statements = self.compare("get_slice (%d xconns)" % (BIG_SLICE_XCONNS,),
+                                  lambda: old_get_slice(self.old_session, BIG_SLICE), lambda: self.dbm.get_slice(BIG_SLICE), comparable)
+        self.assertEqual(statements, 1)
+
+    def test_get_slices(self):
+        slice_urns = SMALL_SLICES[::-1] + [BIG_SLICE]
+        statements = self.compare("get_slices (%d slices)" % (len(slice_urns),),
+                                  lambda: old_get_slices(self.old_session, slice_urns), lambda: self.dbm.get_slices(slice_urns), comparable)
+        self.assertEqual(statements, 1)
+
+
+class TestAudit(unittest.TestCase):
+
+    def setUp(self):
+        reset()
+        self.upsert_supported = models.UPSERT_SUPPORTED
+
+    def tearDown(self):
+        models.UPSERT_SUPPORTED = self.upsert_supported
+
+    def audit(self, upsert_supported):
+        models.UPSERT_SUPPORTED = upsert_supported
+        dbm = models.RoadmsDBM()
+        dbm.open_session()
+        try:
+            return dbm.audit_snapshot(AUDIT_RESOURCES, AUDIT_ROADMS, AUDIT_XCONNS)
+        finally:
+            dbm.close_session()
+
+    def old_audit(self):
+        s = models.sessionmaker(bind=models.engine)()
+        try:
+            old_audit(s, AUDIT_RESOURCES, AUDIT_ROADMS, AUDIT_XCONNS)
+        finally:
+            s.close()
+
+    def measure(self, name, func):
+        """Runs {func} for the first import and again for the same inventory, returns the number of statements and the time of both runs."""
+        reset()
+        first = statements_and_seconds(func)[1:]
+        second = statements_and_seconds(func)[1:]
+        print "\n%s: first import %d statements / %.3f s, repeated %d statements / %.3f s" % ((name,) + first + second)
+        return first, second
+
+    def test_audit(self):
+        (old_first, old_again) = self.measure("per-row insert-then-update", self.old_audit)
+        expected = inventory()
+        modes = [False] + ([True] if self.upsert_supported else [])
+        for upsert_supported in modes:
+            (first, again) = self.measure("audit_snapshot (%s)" % ('upsert' if upsert_supported else 'fallback',),
+                                          lambda: self.audit(upsert_supported))
+            self.assertEqual(inventory(), expected)
+            self.assertTrue(first[1] * 3 < old_first[1], "the first import saves too little (%.3f s, before %.3f s)" % (first[1], old_first[1]))
+            self.assertTrue(again[1] * 3 < old_again[1], "the repeated audit saves too little (%.3f s, before %.3f s)" % (again[1], old_again[1]))
+            self.assertTrue(again[0] < 10, "the repeated audit should only read the tables (%d statements)" % (again[0],))
+
+
+class TestUpdateMany(unittest.TestCase):
+    CONNECTIONS = 4000
+
+    @classmethod
+    def setUpClass(cls):
+        fill()
+
+    def setUp(self):
+        conn = models.engine.connect()
+        conn.execute(models.connections.delete())
+        conn.execute(models.connections.insert(), [{'ingress': 2 * i + 1, 'egress': 2 * i + 2, 'xconn_id': 'x%d' % (i,), 'slice_urn': 'urn:s%d' % (i % 10,)}
+                                                   for i in xrange(self.CONNECTIONS)])
+        conn.execute(models.roadms.update().values(allocation=ALLOCATION.ALLOCATED, operational=models.OPERATIONAL.READY))
+        conn.close()
+        self.conns = [(2 * i + 1, 2 * i + 2) for i in xrange(self.CONNECTIONS)]
+
+    def state(self):
+        conn = models.engine.connect()
+        try:
+            return (sorted(conn.execute(sqla.select([models.roadms.c.id, models.roadms.c.allocation, models.roadms.c.operational])).fetchall()),
+                    sorted(conn.execute(sqla.select([models.connections.c.ingress])).fetchall()))
+        finally:
+            conn.close()
+
+    def compare(self, name, old_func, new_func):
+        """Runs {old_func} with a session and {new_func} with a RoadmsDBM, each on a fresh copy of the connections."""
+        s = models.sessionmaker(bind=models.engine)()
+        try:
+            before = statements_and_seconds(lambda: old_func(s))[2]
+        finally:
+            s.close()
+        expected = self.state()
+        self.setUp()
+        dbm = models.RoadmsDBM()
+        dbm.open_session()
+        try:
+            now = statements_and_seconds(lambda: new_func(dbm))[2]
+        finally:
+            dbm.close_session()
+        print "\n%s (%d connections): IN clauses %.3f s, executemany %.3f s" % (name, self.CONNECTIONS, before, now)
+        self.assertEqual(self.state(), expected)
+        self.assertTrue(now < before, "%s is slower (%.3f s, before %.3f s)" % (name, now, before))
+
+    def test_oper_connections(self):
+        self.compare("oper_connections", lambda s: old_oper_connections(s, self.conns, models.OPERATIONAL.READY_BUSY),
+                     lambda dbm: dbm.oper_connections(self.conns, models.OPERATIONAL.READY_BUSY))
+
+    def test_destroy_connections(self):
+        self.compare("destroy_connections", lambda s: old_destroy_connections(s, self.conns),
+                     lambda dbm: dbm.destroy_connections(self.conns))
+
+
+class TestUpsert(unittest.TestCase):
+    """__bulk_upsert with INSERT ... ON CONFLICT DO UPDATE and with the fallback for sqlite < 3.24 (INSERT OR IGNORE and UPDATE)."""
+
+    def setUp(self):
+        reset()
+        self.upsert_supported = models.UPSERT_SUPPORTED
+        conn = models.engine.connect()
+        conn.execute(models.resources.insert(), [{'id': 1, 'name': 'roadm0', 'type': 'roadm'}])
+        conn.execute(models.roadms.insert(), [{'id': i, 'resource_id': 1, 'endpoint': 'ep%d' % (i,), 'label': '1550'} for i in xrange(1, 6)])
+        self.old_time = datetime.utcnow() - timedelta(days=2)
+        conn.execute(models.connections.insert(), [{'ingress': 1, 'egress': 2, 'xconn_id': 'x12', 'slice_urn': 'urn:s', 'audit_time': self.old_time}])
+        conn.close()
+
+    def tearDown(self):
+        models.UPSERT_SUPPORTED = self.upsert_supported
+
+    def upsert(self, upsert_supported):
+        models.UPSERT_SUPPORTED = upsert_supported
+        now = datetime.utcnow()
+        row = lambda ingress, egress: {'ingress': ingress, 'egress': egress, 'xconn_id': 'x%d%d' % (ingress, egress), 'slice_urn': None,
+                                       'end_time': now, 'client_name': '', 'client_id': '', 'client_email': '', 'audit_time': now}
+        dbm = models.RoadmsDBM()
+        dbm.open_session()
+        try:
+            # (1, 2) exists (its audit_time is refreshed), (1, 3) conflicts on the unique ingress (skipped), (4, 5) is new
+            dbm._RoadmsDBM__bulk_upsert(models.connections, [row(1, 2), row(1, 3), row(4, 5)], ('ingress', 'egress'), ('audit_time',))
+            dbm._RoadmsDBM__s.commit()
+        finally:
+            dbm.close_session()
+        conn = models.engine.connect()
+        rows = dict(((r.ingress, r.egress), r) for r in conn.execute(models.connections.select()))
+        conn.close()
+        self.assertEqual(sorted(rows), [(1, 2), (4, 5)])
+        self.assertEqual((rows[(1, 2)].xconn_id, rows[(1, 2)].slice_urn), ('x12', 'urn:s')) # only audit_time is updated
+        self.assertTrue(rows[(1, 2)].audit_time > self.old_time)
+        self.assertEqual(rows[(4, 5)].xconn_id, 'x45')
+
+    def test_fallback(self):
+        self.upsert(False)
+
+    def test_upsert(self):
+        if not self.upsert_supported:
+            self.skipTest("sqlite %s has no INSERT ... ON CONFLICT DO UPDATE" % (models.sqlite3.sqlite_version,))
+        self.upsert(True)
+
+
+def tearDownModule():
+    shutil.rmtree(DB_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
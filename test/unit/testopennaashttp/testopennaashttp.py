@@ -0,0 +1,168 @@
+"""
+Benchmarks of the access to the OpenNaas controller (opennaas/commandsmanager.py), the HTTP ones against a local stub controller.
+TestPooledSession: the pooled keep-alive session against the previous requests.get per call (a new connection each).
+TestMap: CommandsManager.map (opennaas.fetch_concurrency parallel requests) against fetching one after the other, with 10 ms latency per request.
+TestParse: decoding the XML answers (one cElementTree parse) against the previous decoders (ElementTree, the xConnection parsed once per field).
+Needs requests (as the plugin does).
+Run with: python testopennaashttp.py
+"""
+import sys
+import time
+import xml.etree.ElementTree as PyET
+import threading
+import unittest
+import BaseHTTPServer
+import SocketServer
+from os.path import dirname, join, normpath
+
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/')))
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/plugins/opennaas/')))
+
+import amsoil.core.pluginmanager as pm
+
+LATENCY = 0.01 # secs per request below /opennaas/slow/
+CONCURRENCY = 8
+
+class _Controller(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers each GET with the requested path, counts the connections."""
+    protocol_version = 'HTTP/1.1' # keep-alive
+    wbufsize = -1 # the answer is sent at once (separate small writes wait for the delayed ACK on keep-alive connections)
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with _Controller.lock:
+            _Controller.connections += 1
+
+    def do_GET(self):
+        if self.path.startswith('/opennaas/slow/'):
+            time.sleep(LATENCY)
+        body = '<entry>%s</entry>' % (self.path,)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 4 * CONCURRENCY # the default backlog (5) drops connects of concurrent requests (retried a second later)
+
+server = _Server(('127.0.0.1', 0), _Controller)
+
+class _Config(object):
+    """The keys of the opennaas plugin which are read by commandsmanager (the config plugin keeps them in its database)."""
+    values = { 'opennaas.server_address' : '127.0.0.1', 'opennaas.server_port' : server.server_address[1],
+               'opennaas.user' : 'admin', 'opennaas.password' : '123456',
+               'opennaas.http_pool_size' : CONCURRENCY, 'opennaas.http_connect_timeout' : 5, 'opennaas.http_read_timeout' : 5,
+               'opennaas.http_retries' : 0, 'opennaas.http_retry_backoff' : 0.5,
+               'opennaas.fetch_concurrency' : CONCURRENCY, 'opennaas.topology_ttl' : 0 }
+    def get(self, key):
+        return self.values[key]
+
+pm.registerService('config', _Config())
+import resourceexceptions
+pm.registerService('opennaas_exceptions', resourceexceptions)
+
+import requests
+import commandsmanager
+
+BASE_URL = 'http://127.0.0.1:%d/opennaas/' % (server.server_address[1],)
+
+def connections_and_seconds(func):
+    """Returns the result of {func}, the number of connections the controller accepted meanwhile and the time it took."""
+    before = _Controller.connections
+    start = time.time()
+    result = func()
+    return result, _Controller.connections - before, time.time() - start
+
+
+class TestPooledSession(unittest.TestCase):
+    REQUESTS = 300
+
+    def test_get(self):
+        urls = [BASE_URL + 'resources/r%d' % (i,) for i in xrange(self.REQUESTS)]
+        cm = commandsmanager.CommandsManager('127.0.0.1', str(server.server_address[1]))
+        old, old_connections, before = connections_and_seconds(lambda: [requests.get(url=u, auth=('admin', '123456')).text for u in urls])
+        new, new_connections, now = connections_and_seconds(lambda: [cm.get(u) for u in urls])
+        print "\n%d GETs: before %d connections / %.3f s, now %d connections / %.3f s" % (self.REQUESTS, old_connections, before, new_connections, now)
+        self.assertEqual(new, old)
+        self.assertEqual(old_connections, self.REQUESTS)
+        self.assertEqual(new_connections, 1)
+        self.assertTrue(now < before, "the pooled session is slower (%.3f s, before %.3f s)" % (now, before))
+
+
+class TestMap(unittest.TestCase):
+    REQUESTS = 100
+
+    def test_map(self):
+        args_list = [(BASE_URL + 'slow/r%d' % (i,),) for i in xrange(self.REQUESTS)]
+        cm = commandsmanager.CommandsManager('127.0.0.1', str(server.server_address[1]))
+        old, old_connections, before = connections_and_seconds(lambda: [cm.get(*args) for args in args_list])
+        new, new_connections, now = connections_and_seconds(lambda: cm.map(cm.get, args_list))
+        print "\n%d GETs (%d ms latency): one after the other %.3f s, map %.3f s (%d new connections)" % \
+              (self.REQUESTS, LATENCY * 1000, before, now, new_connections)
+        self.assertEqual(new, old) # same order
+        self.assertTrue(new_connections < CONCURRENCY) # one is already open
+        self.assertTrue(now * 3 < before, "map saves too little (%.3f s, before %.3f s)" % (now, before))
+
+    def test_map_raises(self):
+        cm = commandsmanager.CommandsManager('127.0.0.1', '1') # nothing listens there
+        self.assertRaises(resourceexceptions.ONSException, cm.map, cm.get, [('http://127.0.0.1:1/opennaas/r%d' % (i,),) for i in xrange(4)])
+
+
+def old_decode_xml_entry(xml_data):
+    return [e.text.strip() for e in PyET.fromstring(xml_data).findall('entry')]
+
+def old_decode_xml_conn(xml_data):
+    return (PyET.fromstring(xml_data).find('instanceID').text,
+            PyET.fromstring(xml_data).find('srcEndPointId').text,
+            PyET.fromstring(xml_data).find('srcLabelId').text,
+            PyET.fromstring(xml_data).find('dstEndPointId').text,
+            PyET.fromstring(xml_data).find('dstLabelId').text)
+
+class TestParse(unittest.TestCase):
+    ROUNDS = 2000
+    # answers as handed over by requests (unicode)
+    XCONN = u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<xConnection><instanceID>x12</instanceID>' \
+            u'<srcEndPointId>ep1</srcEndPointId><srcLabelId>1550</srcLabelId><dstEndPointId>ep2</dstEndPointId><dstLabelId>1551</dstLabelId></xConnection>'
+    ENTRIES = u'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<list>%s</list>' % (u''.join(u'<entry>ep%d</entry>' % (i,) for i in xrange(40)),)
+
+    def compare(self, name, old_func, new_func, xml_data):
+        self.assertEqual(new_func(xml_data), old_func(xml_data))
+        times = []
+        for func in (old_func, new_func):
+            start = time.time()
+            for i in xrange(self.ROUNDS):
+                func(xml_data)
+            times.append((time.time() - start) / self.ROUNDS * 1000000)
+        print "\n%s: before %.1f us, now %.1f us" % (name, times[0], times[1])
+        self.assertTrue(times[1] * 5 < times[0], "%s saves too little (%.1f us, before %.1f us)" % (name, times[1], times[0]))
+
+    def test_xconnection(self):
+        cm = commandsmanager.RoadmCM('127.0.0.1', str(server.server_address[1]))
+        self.compare("xConnection", old_decode_xml_conn, cm.decode_xml_conn, self.XCONN)
+
+    def test_entries(self):
+        cm = commandsmanager.CommandsManager('127.0.0.1', str(server.server_address[1]))
+        self.compare("list of 40 entries", old_decode_xml_entry, cm.decode_xml_entry, self.ENTRIES)
+
+    def test_non_ascii(self):
+        cm = commandsmanager.CommandsManager('127.0.0.1', str(server.server_address[1]))
+        self.assertEqual(cm.decode_xml_entry(u'<list><entry>r\xf6adm</entry><entry/></list>'), [u'r\xf6adm', ''])
+
+
+def setUpModule():
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+def tearDownModule():
+    server.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Tests of the slice operations of the OpenNaas resource manager (opennaas/resourcemanager.py) with a fake controller and a temporary sqlite database.
+start/stop/delete_slices are all or nothing: if a command fails, the commands already sent are undone and ONSException is raised before
+the database is changed. The force_ variants (geni_best_effort) change what they can and set the error on the resources of the others.
+check_slices_expiration releases whole slices: all connections of a slice of which any connection has expired.
+The controller is replaced by recording the calls to makeXConnection, removeXConnection and execute of the commands manager.
+Needs sqlalchemy and requests (as the plugin does).
+Run with: python testopennaasslices.py
+"""
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from os.path import dirname, join, normpath
+
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/')))
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/plugins/opennaas/')))
+
+import amsoil.core.pluginmanager as pm
+
+DB_DIR = tempfile.mkdtemp(prefix='testopennaasslices')
+
+class _Config(object):
+    """The keys of the opennaas plugin which are read by the resource manager and its modules (the config plugin keeps them in its database)."""
+    values = { 'opennaas.db_dir' : DB_DIR, 'opennaas.db_dump_stat' : False, 'opennaas.update_step' : 100,
+               'opennaas.server_address' : '127.0.0.1', 'opennaas.server_port' : 1, 'opennaas.user' : 'admin', 'opennaas.password' : '123456',
+               'opennaas.http_pool_size' : 4, 'opennaas.http_connect_timeout' : 1, 'opennaas.http_read_timeout' : 1,
+               'opennaas.http_retries' : 0, 'opennaas.http_retry_backoff' : 0.5, 'opennaas.fetch_concurrency' : 4, 'opennaas.topology_ttl' : 0,
+               'opennaas.update_timeout' : 5, 'opennaas.check_expire_timeout' : 60 }
+    def get(self, key):
+        return self.values[key]
+
+class _Worker(object):
+    """The jobs are not scheduled, the tests call them."""
+    def addAsReccurring(self, service_name, callable_name, params, interval):
+        pass
+    def outsideprocess(self, func):
+        return func
+
+pm.registerService('config', _Config())
+pm.registerService('worker', _Worker())
+import resourceexceptions
+pm.registerService('opennaas_exceptions', resourceexceptions)
+import models
+pm.registerService('opennaas_models', models)
+import commandsmanager
+pm.registerService('opennaas_commands', commandsmanager)
+pm.registerService('opennaas_sync', None) # only used by update_resources
+
+import sqlalchemy as sqla
+from resourcemanager import RMRoadmManager
+from models import ALLOCATION, OPERATIONAL
+
+SLICE = 'urn:publicid:IDN+ofelia+slice+s1'
+OTHER_SLICE = 'urn:publicid:IDN+ofelia+slice+s2'
+XCONNS = [('x1', SLICE, 1, 2), ('x2', SLICE, 3, 4), ('x3', SLICE, 5, 6), ('x4', OTHER_SLICE, 7, 8)] # (xconn_id, slice_urn, ingress, egress)
+
+class _Controller(object):
+    """Records the commands (and the commits of the database, to check the order), fails for the xconn ids in {failing}."""
+    def __init__(self):
+        self.calls = []
+        self.failing = set()
+        self.failing_execute = False
+        self._lock = threading.Lock()
+
+    def record(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    def makeXConnection(self, r_type, r_name, instance_id, src_ep, src_label, dst_ep, dst_label):
+        self.command('make', instance_id)
+
+    def removeXConnection(self, r_type, r_name, instance_id):
+        self.command('remove', instance_id)
+
+    def command(self, name, instance_id):
+        if instance_id in self.failing:
+            raise resourceexceptions.ONSException("%s %s failed" % (name, instance_id))
+        self.record((name, instance_id))
+
+    def execute(self, r_type, r_name):
+        if self.failing_execute:
+            raise resourceexceptions.ONSException("execute %s failed" % (r_name,))
+        self.record(('execute', r_name))
+
+    def names(self):
+        return [c[0] for c in self.calls]
+
+
+class TestSliceOperations(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rm = RMRoadmManager()
+
+    def setUp(self):
+        models.meta.drop_all()
+        models.meta.create_all()
+        conn = models.engine.connect()
+        conn.execute(models.resources.insert(), [{'id': 1, 'name': 'roadm0', 'type': 'roadm'}])
+        conn.execute(models.roadms.insert(), [{'id': i, 'resource_id': 1, 'endpoint': 'ep%d' % (i,), 'label': '1550',
+                                               'allocation': ALLOCATION.ALLOCATED, 'operational': OPERATIONAL.READY} for i in xrange(1, 9)])
+        conn.execute(models.connections.insert(), [{'xconn_id': x, 'slice_urn': s, 'ingress': i, 'egress': e,
+                                                    'end_time': datetime.utcnow() + timedelta(days=1)} for (x, s, i, e) in XCONNS])
+        conn.close()
+        self.controller = _Controller()
+        cm = commandsmanager.commandsMngr
+        self.saved = dict((name, getattr(cm, name)) for name in ('makeXConnection', 'removeXConnection', 'execute'))
+        for name in self.saved:
+            setattr(cm, name, getattr(self.controller, name))
+        sqla.event.listen(models.engine, 'commit', self.on_commit)
+
+    def tearDown(self):
+        sqla.event.remove(models.engine, 'commit', self.on_commit)
+        for (name, method) in self.saved.items():
+            setattr(commandsmanager.commandsMngr, name, method)
+
+    def on_commit(self, conn):
+        self.controller.record(('commit',))
+
+    def connections(self):
+        conn = models.engine.connect()
+        try:
+            return dict((r.xconn_id, r) for r in conn.execute(models.connections.select()))
+        finally:
+            conn.close()
+
+    def operational(self):
+        conn = models.engine.connect()
+        try:
+            return dict((r.id, r.operational) for r in conn.execute(models.roadms.select()))
+        finally:
+            conn.close()
+
+    def test_delete(self):
+        rs = self.rm.delete_slices({SLICE: None})
+        self.assertEqual(len(rs), 6)
+        self.assertEqual([r.error for r in rs], [None] * 6)
+        self.assertEqual(sorted(self.connections()), ['x4'])
+        # the queue is executed once, before the database is changed
+        self.assertEqual(self.controller.names(), ['remove'] * 3 + ['execute', 'commit'])
+
+    def test_delete_all_or_nothing(self):
+        self.controller.failing.add('x2')
+        self.assertRaises(resourceexceptions.ONSException, self.rm.delete_slices, {SLICE: None})
+        self.assertEqual(sorted(self.connections()), ['x1', 'x2', 'x3', 'x4'])
+        names = self.controller.names()
+        self.assertEqual(names[:2], ['remove'] * 2) # x1 and x3 were sent
+        self.assertEqual(sorted(self.controller.calls[2:4]), [('make', 'x1'), ('make', 'x3')]) # and undone
+        self.assertEqual(names[4:], ['execute']) # nothing committed
+
+    def test_start_execute_fails(self):
+        self.controller.failing_execute = True
+        self.assertRaises(resourceexceptions.ONSException, self.rm.start_slices, {SLICE: None})
+        self.assertEqual(set(self.operational().values()), set([OPERATIONAL.READY]))
+        self.assertEqual(sorted(self.controller.calls), [('make', 'x1'), ('make', 'x2'), ('make', 'x3'),
+                                                         ('remove', 'x1'), ('remove', 'x2'), ('remove', 'x3')])
+
+    def test_stop(self):
+        self.rm.start_slices({SLICE: None})
+        self.assertEqual(sorted(i for (i, o) in self.operational().items() if o == OPERATIONAL.READY_BUSY), range(1, 7))
+        self.rm.stop_slices({SLICE: None})
+        self.assertEqual(set(self.operational().values()), set([OPERATIONAL.READY]))
+
+    def test_force_delete(self):
+        self.controller.failing.add('x2')
+        rs = self.rm.force_delete_slices({SLICE: None})
+        self.assertEqual([r.error is not None for r in rs], [False, False, True, True, False, False])
+        self.assertEqual(sorted(self.connections()), ['x2', 'x4'])
+        self.assertEqual(self.controller.names(), ['remove'] * 2 + ['execute', 'commit'])
+
+    def test_force_start_execute_fails(self):
+        self.controller.failing_execute = True
+        rs = self.rm.force_start_slices({SLICE: None})
+        self.assertEqual(len([r for r in rs if r.error is not None]), 6)
+        self.assertEqual(set(self.operational().values()), set([OPERATIONAL.READY]))
+        self.assertEqual(self.controller.names().count('remove'), 3) # the queued commands are undone
+
+    def test_expiry_releases_whole_slices(self):
+        conn = models.engine.connect()
+        past = datetime.utcnow() - timedelta(hours=1)
+        conn.execute(models.connections.update().where(models.connections.c.xconn_id=='x1').values(end_time=past)) # x2 and x3 are still live
+        conn.execute(models.roadms.insert(), [{'id': i, 'resource_id': 1, 'endpoint': 'ep%d' % (i,), 'label': '1550',
+                                               'allocation': ALLOCATION.ALLOCATED} for i in (9, 10)])
+        conn.execute(models.connections.insert(), [{'xconn_id': 'audit', 'slice_urn': None, 'ingress': 9, 'egress': 10, 'end_time': past}])
+        conn.close()
+        del self.controller.calls[:]
+        self.rm.check_slices_expiration(None)
+        self.assertEqual(sorted(self.connections()), ['audit', 'x4']) # connections found by the audit have no slice to expire
+        self.assertEqual(sorted(self.controller.calls[:3]), [('remove', 'x1'), ('remove', 'x2'), ('remove', 'x3')])
+        self.assertEqual(self.controller.calls[3:], [('execute', 'roadm0'), ('commit',)])
+        del self.controller.calls[:]
+        self.rm.check_slices_expiration(None)
+        self.assertEqual(self.controller.calls, [])
+
+
+def tearDownModule():
+    shutil.rmtree(DB_DIR, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""
+Tests of the rate limiting of the XML-RPC endpoints (flaskrpcs/ratelimit.py and FastXMLRPCHandler._marshaled_dispatch_chunks).
+Each call has to be charged to exactly one bucket, also if the method name found in the raw request is not the parsed one.
+Needs flask and flask-xmlrpc (as the plugin does).
+Run with: python testratelimit.py
+"""
+import sys
+import xmlrpclib
+import unittest
+from os.path import dirname, join, normpath
+
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/')))
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/plugins/flaskrpcs/')))
+
+import ratelimit
+from fastxmlrpc import FastXMLRPCHandler
+
+BURST = 3
+
+class Handler(object):
+    READONLY_METHODS = frozenset(['GetVersion'])
+
+    def _dispatch(self, method, params):
+        return method
+
+    def _rejectedReturn(self, method, retry_after, reason):
+        return 'rejected'
+
+class TestHandler(FastXMLRPCHandler):
+    def _client_identity(self):
+        return 'alice'
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.limiter = ratelimit.RateLimiter(0.001, BURST, 0.001, BURST)
+        self.handler = TestHandler(instance=Handler(), rate_limiter=self.limiter)
+
+    def tokens(self, priority_class):
+        return int(self.limiter._buckets[('alice', priority_class)].tokens)
+
+    def call(self, data):
+        return xmlrpclib.loads(''.join(self.handler._marshaled_dispatch_chunks(data).iterchunks()))[0][0]
+
+    def test_bucket(self):
+        for i in xrange(BURST):
+            self.assertEqual(self.limiter.admit('alice', ratelimit.READ).retry_after, None)
+        self.assertTrue(self.limiter.admit('alice', ratelimit.READ).retry_after > 0)
+        self.assertEqual(self.limiter.admit('alice', ratelimit.WRITE).retry_after, None)
+        self.assertEqual(self.limiter.admit('bob', ratelimit.READ).retry_after, None)
+
+    def test_cancel_gives_the_token_back(self):
+        admission = self.limiter.admit('alice', ratelimit.READ)
+        self.assertEqual(self.tokens(ratelimit.READ), BURST - 1)
+        admission.cancel()
+        admission.cancel()
+        self.assertEqual(self.tokens(ratelimit.READ), BURST)
+
+    def test_call_charges_one_bucket(self):
+        self.assertEqual(self.call(xmlrpclib.dumps((), 'GetVersion')), 'GetVersion')
+        self.assertEqual(self.call(xmlrpclib.dumps((), 'Delete')), 'Delete')
+        self.assertEqual((self.tokens(ratelimit.READ), self.tokens(ratelimit.WRITE)), (BURST - 1, BURST - 1))
+
+    def test_wrong_peeked_name_charges_one_bucket(self):
+        # the raw request looks like GetVersion (read-only), but it is a Delete
+        data = xmlrpclib.dumps((), 'Delete').replace('<methodCall>', '<!-- <methodName>GetVersion</methodName> --><methodCall>')
+        self.assertEqual(ratelimit.peek_method_name(data), 'GetVersion')
+        self.assertEqual(self.call(data), 'Delete')
+        self.assertEqual((self.tokens(ratelimit.READ), self.tokens(ratelimit.WRITE)), (BURST, BURST - 1))
+
+    def test_rejected_call(self):
+        for i in xrange(BURST):
+            self.call(xmlrpclib.dumps((), 'Delete'))
+        self.assertEqual(self.call(xmlrpclib.dumps((), 'Delete')), 'rejected')
+        self.assertEqual(self.call(xmlrpclib.dumps((), 'GetVersion')), 'GetVersion')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+"""
+Conformance and round trip tests of the RFC3339 conversion used by the GENI AM API v3 handler (g3rpc/rfc3339.py).
+The expected values come from the conversion the handler used before (dateutil and strftime).
+TestRFC3339Speed compares the time per call with the old conversion, for distinct values (memo misses) and repeated ones (a Status of many slivers).
+Run with: python testrfc3339.py
+"""
+import sys
+import time
+import unittest
+from datetime import datetime, timedelta, tzinfo
+from os.path import dirname, join, normpath
+
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/plugins/geniv3rpc/g3rpc/'))
+sys.path.insert(0,PYTHON_DIR)
+
+from dateutil import parser as dateparser
+import rfc3339
+
+def old_str2datetime(strval):
+    result = dateparser.parse(strval)
+    if result:
+        result = result - result.utcoffset()
+        result = result.replace(tzinfo=None)
+    return result
+
+def old_datetime2str(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S.%fZ')
+
+class FixedOffset(tzinfo):
+    def __init__(self, minutes):
+        self._offset = timedelta(minutes=minutes)
+    def utcoffset(self, dt):
+        return self._offset
+    def dst(self, dt):
+        return timedelta(0)
+
+TIMESTAMPS = ['2013-11-08T12:00:00Z', '2013-11-08t12:00:00z', '2013-11-08 12:00:00Z', '2013-11-08T12:00:00.5Z', '2013-11-08T12:00:00.123456Z',
+              '2013-11-08T12:00:00.1234567Z', '2013-11-08T12:00:00+02:00', '2013-11-08T12:00:00-0530', '2013-11-08T23:30:00-01:00',
+              '2013-12-31T23:59:59.999999-00:30', '2012-02-29T00:00:00+00:00', '2013-11-08T12:00:00,25Z', ' 2013-11-08T12:00:00Z ']
+
+
+class TestRFC3339(unittest.TestCase):
+
+    def test_parse_conforms(self):
+        for ts in TIMESTAMPS:
+            self.assertEqual(rfc3339.parse(ts), old_str2datetime(ts), ts)
+            self.assertEqual(rfc3339.parse(ts), old_str2datetime(ts), ts + ' (memoized)')
+
+    def test_parse_fallback(self):
+        self.assertEqual(rfc3339.parse('Nov 8 2013 12:00 +0100'), datetime(2013, 11, 8, 11, 0))
+
+    def test_parse_without_offset_is_utc(self):
+        self.assertEqual(rfc3339.parse('2013-11-08T12:00:00'), datetime(2013, 11, 8, 12, 0))
+
+    def test_parse_invalid(self):
+        for ts in ['', 'tomorrow', '2013-13-45T12:00:00Z']:
+            self.assertRaises(ValueError, rfc3339.parse, ts)
+
+    def test_format_conforms(self):
+        for dt in [datetime(2013, 11, 8, 12, 0), datetime(2013, 11, 8, 12, 0, 0, 5), datetime(1999, 12, 31, 23, 59, 59, 999999), datetime(2038, 1, 19, 3, 14, 8)]:
+            self.assertEqual(rfc3339.format(dt), old_datetime2str(dt))
+            self.assertEqual(rfc3339.format(dt), old_datetime2str(dt))
+
+    def test_format_before_1900(self):
+        self.assertEqual(rfc3339.format(datetime(1850, 1, 2, 3, 4, 5)), '1850-01-02 03:04:05.000000Z')
+
+    def test_format_aware(self):
+        # the same instant in two zones: the wall time is written (as strftime does), not the memoized result of the other zone
+        utc = datetime(2013, 11, 8, 12, 0, tzinfo=FixedOffset(0))
+        cet = datetime(2013, 11, 8, 13, 0, tzinfo=FixedOffset(60))
+        self.assertEqual(utc, cet)
+        self.assertEqual(rfc3339.format(utc), old_datetime2str(utc))
+        self.assertEqual(rfc3339.format(cet), old_datetime2str(cet))
+        # naive datetimes can not be compared with aware ones, the memo must not try
+        self.assertEqual(rfc3339.format(datetime(2013, 11, 8, 12, 0)), '2013-11-08 12:00:00.000000Z')
+
+    def test_round_trip(self):
+        dt = datetime(2013, 1, 1, 0, 0, 0, 1)
+        for i in xrange(1000):
+            self.assertEqual(rfc3339.parse(rfc3339.format(dt)), dt)
+            dt += timedelta(days=13, hours=5, minutes=7, seconds=11, microseconds=123457)
+
+    def test_memo_is_bounded(self):
+        for i in xrange(3 * rfc3339.MEMO_SIZE):
+            rfc3339.parse(rfc3339.format(datetime(2013, 1, 1) + timedelta(seconds=i)))
+        self.assertTrue(len(rfc3339._parse_memo) <= rfc3339.MEMO_SIZE)
+
+
+def per_call_us(func, values):
+    start = time.time()
+    for v in values:
+        func(v)
+    return (time.time() - start) / len(values) * 1000000
+
+class TestRFC3339Speed(unittest.TestCase):
+    CALLS = 20000
+
+    def setUp(self):
+        start = datetime(2013, 11, 8, 12, 0, 0, 250000)
+        self.distinct_dts = [start + timedelta(seconds=7 * i) for i in xrange(self.CALLS)]
+        self.repeated_dts = [start] * self.CALLS
+        self.distinct_strs = [old_datetime2str(dt) for dt in self.distinct_dts]
+        self.repeated_strs = [old_datetime2str(start)] * self.CALLS
+
+    def compare(self, name, old_func, new_func, values):
+        before, now = per_call_us(old_func, values), per_call_us(new_func, values)
+        print "\n%s: before %.2f us, now %.2f us per call" % (name, before, now)
+        self.assertTrue(now < before, "%s is slower (%.2f us, before %.2f us)" % (name, now, before))
+        return before, now
+
+    def test_parse_distinct(self):
+        before, now = self.compare("parse, distinct", old_str2datetime, rfc3339.parse, self.distinct_strs)
+        self.assertTrue(now * 5 < before)
+
+    def test_parse_repeated(self):
+        before, now = self.compare("parse, repeated", old_str2datetime, rfc3339.parse, self.repeated_strs)
+        self.assertTrue(now * 10 < before)
+
+    def test_format_distinct(self):
+        self.compare("format, distinct", old_datetime2str, rfc3339.format, self.distinct_dts)
+
+    def test_format_repeated(self):
+        self.compare("format, repeated", old_datetime2str, rfc3339.format, self.repeated_dts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Checks that GENIv3DelegateBase.lxml_ad_stream serializes large RSpecs in bounded pieces: the serializer yields one element at a time,
+the result is kept in a temporary file (spooledrspec) and read back in bounded chunks (also by the compression).
+Run with: python testrspecstream.py
+"""
+import sys
+import zlib
+import base64
+import unittest
+from os.path import dirname, join, normpath
+
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/'))
+sys.path.insert(0,PYTHON_DIR)
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/plugins/geniv3rpc/'))
+sys.path.insert(0,PYTHON_DIR)
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/plugins/geniv3rpc/g3rpc/'))
+sys.path.insert(0,PYTHON_DIR)
+
+import amsoil.core.pluginmanager as pm
+
+class _Dispatcher(object):
+    """The handler module needs the xmlrpc service (flaskrpcs plugin) on import, the delegate base does not use it."""
+    pass
+
+class _XMLRPC(object):
+    Dispatcher = _Dispatcher
+
+pm.registerService('xmlrpc', _XMLRPC)
+
+import genivthree
+import spooledrspec
+import compression
+
+RESOURCES = 20000 # about 4 MB as pretty printed string (more than SPOOL_SIZE)
+ELEMENT_BOUND = 8 * 1024 # max. bytes per chunk of the serializer (lxml buffers about 4 KB, one element is about 200 bytes)
+
+class _Delegate(genivthree.GENIv3DelegateBase):
+    def get_ad_extensions_mapping(self):
+        return { 'geni' : 'http://www.geni.net/resources/rspec/3' }
+
+
+class TestRSpecStream(unittest.TestCase):
+
+    def setUp(self):
+        self.delegate = _Delegate()
+        self.em = self.delegate.lxml_ad_element_maker('geni')
+
+    def elements(self, count):
+        for i in xrange(count):
+            yield self.em.node(self.em.name('node-%d' % (i,)), self.em.label('label-%d' % (i % 100,)), component_id='urn:publicid:IDN+am+node+%d' % (i,))
+
+    def test_same_output_as_tree(self):
+        streamed = ''.join(self.delegate.lxml_stream_chunks('advertisement', self.delegate.get_ad_extensions_mapping(), self.elements(3), pretty_print=False))
+        root = self.delegate.lxml_ad_root()
+        for element in self.elements(3):
+            root.append(element)
+        self.assertEqual(genivthree.etree.tostring(genivthree.etree.fromstring(streamed), method='c14n'),
+                         genivthree.etree.tostring(root, method='c14n'))
+
+    def test_bounded_chunks(self):
+        size = 0
+        for chunk in self.delegate.lxml_stream_chunks('advertisement', self.delegate.get_ad_extensions_mapping(), self.elements(RESOURCES)):
+            self.assertTrue(len(chunk) <= ELEMENT_BOUND, "chunk of %d bytes" % (len(chunk),))
+            size += len(chunk)
+        self.assertTrue(size > 2 * spooledrspec.SPOOL_SIZE, "the output (%d bytes) is too small to show anything" % (size,))
+
+    def test_spooled(self):
+        rspec = self.delegate.lxml_ad_stream(self.elements(RESOURCES))
+        self.assertTrue(rspec._file._rolled, "the RSpec was kept in memory")
+        chunks = list(rspec.iterchunks())
+        self.assertTrue(max(len(chunk) for chunk in chunks) <= spooledrspec.READ_SIZE)
+        self.assertEqual(sum(len(chunk) for chunk in chunks), len(rspec))
+        self.assertEqual(str(rspec), ''.join(self.delegate.lxml_stream_chunks('advertisement', self.delegate.get_ad_extensions_mapping(), self.elements(RESOURCES))))
+
+    def test_compressed_in_chunks(self):
+        rspec = self.delegate.lxml_ad_stream(self.elements(3000))
+        cache = compression.CompressionCache()
+        compressed = cache.compress(rspec)
+        self.assertEqual(zlib.decompress(base64.b64decode(compressed)), str(rspec))
+        self.assertTrue(cache.compress(rspec) is compressed)
+
+
+if __name__ == '__main__':
+    unittest.main()
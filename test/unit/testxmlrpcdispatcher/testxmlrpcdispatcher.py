@@ -0,0 +1,60 @@
+"""
+Tests that the XML-RPC dispatcher (flaskrpcs/xmlrpcdispatcher.py) only lets clients call public methods.
+Private methods (e.g. GENIv3Handler._status, which takes the client certificate as first parameter) must not be reachable.
+Needs flask (as the plugin does).
+Run with: python testxmlrpcdispatcher.py
+"""
+import sys
+import logging
+import xmlrpclib
+import unittest
+from SimpleXMLRPCServer import SimpleXMLRPCDispatcher
+from os.path import dirname, join, normpath
+
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/')))
+sys.path.insert(0,normpath(join(dirname(__file__), '../../../src/plugins/flaskrpcs/')))
+
+from xmlrpcdispatcher import XMLRPCDispatcher
+
+TRUSTED_CERT = 'trusted certificate'
+
+class StatusHandler(XMLRPCDispatcher):
+    """Mimics the shape of GENIv3Handler.Status: the public method looks up the certificate and passes it to the private one."""
+    def __init__(self):
+        super(StatusHandler, self).__init__(logging.getLogger('testxmlrpcdispatcher'))
+        self.calls = []
+
+    def Status(self, urns):
+        return self._status(TRUSTED_CERT, urns)
+
+    def _status(self, client_cert, urns):
+        self.calls.append((client_cert, urns))
+        return {'client_cert': client_cert, 'urns': urns}
+
+
+class TestXMLRPCDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.handler = StatusHandler()
+        self.server = SimpleXMLRPCDispatcher(allow_none=True, encoding='utf-8')
+        self.server.register_instance(self.handler)
+
+    def call(self, method, *params):
+        return xmlrpclib.loads(self.server._marshaled_dispatch(xmlrpclib.dumps(params, method)))[0][0]
+
+    def test_public_method(self):
+        self.assertEqual(self.call('Status', ['urn:a']), {'client_cert': TRUSTED_CERT, 'urns': ['urn:a']})
+
+    def test_private_method_is_not_dispatched(self):
+        self.assertRaises(xmlrpclib.Fault, self.call, '_status', 'forged certificate', ['urn:a'])
+        self.assertRaises(AttributeError, self.handler._dispatch, '_status', ('forged certificate', ['urn:a']))
+        self.assertEqual(self.handler.calls, [])
+
+    def test_special_and_unknown_methods(self):
+        for method in ['__init__', '_dispatch', '_rejectedReturn', 'NoSuchMethod']:
+            self.assertRaises(xmlrpclib.Fault, self.call, method)
+        self.assertEqual(self.handler.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
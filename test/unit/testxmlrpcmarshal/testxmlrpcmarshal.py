@@ -0,0 +1,64 @@
+"""
+Benchmark of the fast XML-RPC marshalling (flaskrpcs/fastxmlrpc.py) against xmlrpclib.dumps.
+Covers a Status reply with 10k slivers and a ListResources reply of 5 MB, the output has to be the same.
+Needs flask and flask-xmlrpc (as the plugin does).
+Run with: python testxmlrpcmarshal.py
+"""
+import sys
+import time
+import xmlrpclib
+import unittest
+from os.path import dirname, join, normpath
+
+PYTHON_DIR = normpath(join(dirname(__file__), '../../../src/plugins/flaskrpcs/'))
+sys.path.insert(0,PYTHON_DIR)
+
+import fastxmlrpc
+
+SLIVERS = 10000
+RSPEC_SIZE = 5 * 1024 * 1024
+ROUNDS = 5
+
+def status_reply():
+    slivers = [{'geni_sliver_urn': 'urn:publicid:IDN+ofelia+sliver+r%d:ep%d:l%d' % (i / 1000, i % 100, i % 7),
+                'geni_expires': '2013-11-08 12:00:00.000000Z', 'geni_allocation_status': 'geni_allocated',
+                'geni_operational_status': 'geni_ready', 'geni_error': ''} for i in xrange(SLIVERS)]
+    return {'geni_api': 3, 'code': {'geni_code': 0}, 'value': {'geni_urn': 'urn:publicid:IDN+ofelia+slice+s1', 'geni_slivers': slivers}, 'output': None}
+
+def list_resources_reply():
+    node = '<node component_id="urn:publicid:IDN+ofelia+roadm+r0:ep0:l0" exclusive="true">\n  <available now="true"/>\n</node>\n'
+    rspec = '<rspec type="advertisement">\n' + node * (RSPEC_SIZE / len(node)) + '</rspec>\n'
+    return {'geni_api': 3, 'code': {'geni_code': 0}, 'value': rspec, 'output': None}
+
+def fast_dumps(reply):
+    writer = fastxmlrpc.ChunkWriter()
+    fastxmlrpc.ChunkMarshaller('utf-8', True).dumps_response((reply,), writer.write)
+    return writer.getchunks()
+
+def per_call_ms(func, reply):
+    start = time.time()
+    for i in xrange(ROUNDS):
+        func(reply)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+class TestXMLRPCMarshal(unittest.TestCase):
+
+    def compare(self, name, reply):
+        self.assertEqual(''.join(fast_dumps(reply)), xmlrpclib.dumps((reply,), methodresponse=True, allow_none=True))
+        before = per_call_ms(lambda r: xmlrpclib.dumps((r,), methodresponse=True, allow_none=True), reply)
+        now = per_call_ms(fast_dumps, reply)
+        print "\n%s: xmlrpclib.dumps %.1f ms, ChunkMarshaller %.1f ms" % (name, before, now)
+        return before, now
+
+    def test_status(self):
+        before, now = self.compare("Status, %d slivers" % (SLIVERS,), status_reply())
+        self.assertTrue(now < before, "the fast marshaller is slower (%.1f ms, before %.1f ms)" % (now, before))
+
+    def test_list_resources(self):
+        before, now = self.compare("ListResources, %d MB" % (RSPEC_SIZE / 1024 / 1024,), list_resources_reply())
+        self.assertTrue(now * 1.3 < before, "the fast marshaller saves too little (%.1f ms, before %.1f ms)" % (now, before))
+
+
+if __name__ == '__main__':
+    unittest.main()